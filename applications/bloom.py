@@ -0,0 +1,80 @@
+# encoding: utf-8
+import math
+import random
+from itertools import islice
+
+import numpy as np
+
+from applications.models import Application
+
+
+def _mix(x):
+    """
+    Перемешивает биты 64-битных чисел (финализатор splitmix64).
+    """
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class PairBloomFilter:
+    """
+    Фильтр Блума для пар (id Анкеты клиента, id Предложения).
+
+    Проверка может ошибиться только в одну сторону: пара, которой нет в фильтре, может быть признана
+    существующей (с вероятностью error_rate), но существующая пара всегда находится.
+    Хеш-функции зависят от соли, которая по умолчанию выбирается случайно, поэтому ложные срабатывания
+    при каждом построении фильтра приходятся на разные пары.
+    """
+
+    def __init__(self, capacity, error_rate=0.001, salt=None):
+        capacity = max(capacity, 1)
+        self.size = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.salt = np.uint64(random.getrandbits(64) if salt is None else salt)
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    @classmethod
+    def from_applications(cls, error_rate=0.001, chunk_size=100000, salt=None):
+        """
+        Строит фильтр по всем существующим Заявкам за один потоковый проход по таблице:
+        в памяти одновременно находится только одна пачка пар.
+
+        :param error_rate: float, допустимая вероятность ложного срабатывания.
+        :param chunk_size: int, количество пар в пачке.
+        :param salt: int, соль хеш-функций. По умолчанию случайная.
+        :return: PairBloomFilter
+        """
+        bloom_filter = cls(Application.objects.count(), error_rate=error_rate, salt=salt)
+
+        pairs = Application.objects.values_list('customer_id', 'lender_offer_id').iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(pairs, chunk_size))
+            if not chunk:
+                break
+            chunk = np.array(chunk, dtype=np.int64)
+            bloom_filter.add(chunk[:, 0], chunk[:, 1])
+
+        return bloom_filter
+
+    def _positions(self, customers_ids, offers_ids):
+        keys = (np.asarray(customers_ids, dtype=np.uint64) << np.uint64(32)) | np.asarray(offers_ids, dtype=np.uint64)
+
+        # Двойное хеширование: i-я хеш-функция равна h1 + i * h2
+        h1 = _mix(keys ^ self.salt)
+        h2 = _mix(h1) | np.uint64(1)
+        steps = np.arange(self.hashes_count, dtype=np.uint64)
+        positions = (h1[:, np.newaxis] + steps[np.newaxis, :] * h2[:, np.newaxis]) % np.uint64(self.size)
+        return positions.astype(np.int64)
+
+    def add(self, customers_ids, offers_ids):
+        positions = self._positions(customers_ids, offers_ids).ravel()
+        np.bitwise_or.at(self.bits, positions >> 3, np.left_shift(1, positions & 7).astype(np.uint8))
+
+    def contains(self, customers_ids, offers_ids):
+        """
+        :return: numpy.ndarray of bool, для каждой пары: True, если пара, возможно, есть в фильтре.
+        """
+        positions = self._positions(customers_ids, offers_ids)
+        return ((self.bits[positions >> 3] >> (positions & 7)) & 1).astype(bool).all(axis=1)
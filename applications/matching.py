@@ -0,0 +1,612 @@
+# encoding: utf-8
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Q
+
+from applications.bloom import PairBloomFilter
+from applications.models import Application, PendingMatch
+from lenders.models import Offer
+from lenders.offer_index import OfferIndex
+from lenders.offer_snapshot import get_offer_snapshot
+from partners.models import Customer, Partner
+
+
+# Сопоставление Анкет клиентов с режимом 'auto' со всеми актуальными Предложениями одним запросом.
+# Если заданы границы pk_gte и pk_lt, то сопоставляются только Анкеты с id из диапазона [pk_gte, pk_lt).
+# Уже существующие Заявки отсекаются через NOT EXISTS, а ON CONFLICT защищает от гонки
+# с параллельно работающими сопоставлениями.
+MATCH_CUSTOMERS_SQL = '''
+    WITH inserted AS (
+        INSERT INTO {application} (lender_offer_id, customer_id, status, created_at, updated_at)
+        SELECT offer.id, customer.id, %(status)s, %(now)s, %(now)s
+        FROM {customer} AS customer
+        JOIN {offer} AS offer
+            ON offer.credit_score_range @> customer.credit_score
+        WHERE customer.offer_matching_mode @> ARRAY[%(mode)s]::varchar(10)[]
+            AND offer.rotating_range @> %(now)s::timestamptz
+            AND (%(pk_gte)s IS NULL OR customer.id >= %(pk_gte)s)
+            AND (%(pk_lt)s IS NULL OR customer.id < %(pk_lt)s)
+            AND NOT EXISTS (
+                SELECT 1
+                FROM {application} AS application
+                WHERE application.customer_id = customer.id
+                    AND application.lender_offer_id = offer.id
+            )
+        ON CONFLICT (lender_offer_id, customer_id) DO NOTHING
+        RETURNING lender_offer_id
+    )
+    SELECT offer.lender_id, COUNT(*)
+    FROM inserted
+    JOIN {offer} AS offer ON offer.id = inserted.lender_offer_id
+    GROUP BY offer.lender_id
+'''
+
+
+def iter_chunks(queryset, chunk_size):
+    """
+    Обходит queryset пачками по chunk_size объектов в порядке возрастания первичного ключа.
+    Каждая следующая пачка выбирается по условию pk > последнего pk предыдущей пачки (keyset-пагинация),
+    поэтому в памяти одновременно находится только одна пачка, а стоимость выборки не растёт к концу таблицы.
+    prefetch_related у queryset выполняется отдельно для каждой пачки.
+
+    :param queryset: QuerySet.
+    :param chunk_size: int, количество объектов в пачке.
+    :return: генератор list of objects
+    """
+    last_pk = None
+    while True:
+        chunk_qs = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk_qs = chunk_qs.filter(pk__gt=last_pk)
+
+        chunk = list(chunk_qs[:chunk_size])
+        if not chunk:
+            return
+
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def get_auto_customers():
+    return Customer.objects.auto()
+
+
+def split_customers_pk_range(shards):
+    """
+    Делит диапазон id Анкет клиентов с режимом 'auto' на shards равных по ширине частей.
+
+    :param shards: int, количество частей.
+    :return: list of (pk_gte, pk_lt), полуинтервалы id; пустой список, если Анкет нет.
+    """
+    bounds = get_auto_customers().aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+    if bounds['min_pk'] is None:
+        return []
+
+    end = bounds['max_pk'] + 1
+    step = -(-(end - bounds['min_pk']) // shards)     # Деление с округлением вверх
+    return [(start, min(start + step, end)) for start in range(bounds['min_pk'], end, step)]
+
+
+def save_applications(pairs):
+    """
+    Сохраняет новые Заявки способом из настройки APPLICATIONS_MATCHING_WRITER, пропуская уже существующие.
+
+    :param pairs: iterable of (customer_id, lender_offer_id).
+    :return: int, количество действительно вставленных Заявок.
+    """
+    if settings.APPLICATIONS_MATCHING_WRITER == 'copy':
+        now = datetime.now()
+        return Application.objects.copy_skip_conflicts(
+            (customer_id, lender_offer_id, Application.NEW, now, now) for customer_id, lender_offer_id in pairs
+        )
+
+    return len(Application.objects.bulk_create_skip_conflicts([
+        Application(customer_id=customer_id, lender_offer_id=lender_offer_id) for customer_id, lender_offer_id in pairs
+    ]))
+
+
+def get_offers_version(now=None):
+    """
+    Возвращает версию набора актуальных Предложений. Версия меняется, когда Предложение создаётся, изменяется,
+    удаляется, а также когда начинается или заканчивается его ротация: тогда меняется последняя пройденная
+    граница ротации. Вычисляется одним агрегирующим запросом, id Предложений не загружаются.
+
+    :param now: datetime, по умолчанию текущее время.
+    :return: int, 64-битное число со знаком.
+    """
+    now = now or datetime.now()
+    return Offer.objects.aggregate_version(
+        count=Count('pk'),
+        updated_at=Max('updated_at'),
+        started=Max('rotating_start', filter=Q(rotating_start__lte=now)),
+        ended=Max('rotating_end', filter=Q(rotating_end__lt=now)),
+    )
+
+
+def mark_customers_matched(customers, offers_version, matched_at):
+    """
+    Запоминает у Анкет клиентов версию набора Предложений, с которым они сопоставлены.
+    Анкеты, изменённые после matched_at, не отмечаются: их нужно сопоставить заново.
+
+    :param customers: list of partners.Customer.
+    :param offers_version: int, результат get_offers_version.
+    :param matched_at: datetime, момент начала сопоставления.
+    """
+    Customer.objects.filter(
+        pk__in=[customer.pk for customer in customers],
+        updated_at__lte=matched_at
+    ).update(
+        matched_offers_version=offers_version
+    )
+
+
+def match_customers(pk_gte=None, pk_lt=None, chunk_size=None, skip_matched=True, on_chunk=None):
+    """
+    Сопоставляет Анкеты клиентов с режимом 'auto' с актуальными Предложениями и сохраняет новые Заявки.
+    Способ сопоставления задаётся настройкой APPLICATIONS_MATCHING_ENGINE.
+
+    :param pk_gte: int, если задано, то сопоставляются только Анкеты с id >= pk_gte.
+    :param pk_lt: int, если задано, то сопоставляются только Анкеты с id < pk_lt.
+    :param chunk_size: int, количество Анкет в пачке.
+                       По умолчанию значение настройки APPLICATIONS_MATCHING_CHUNK_SIZE.
+    :param skip_matched: boolean, по умолчанию True.
+                         Если False, то сопоставляются и Анкеты, уже отмеченные текущей версией набора Предложений,
+                         например после массового изменения Предложений через QuerySet.update().
+                         Движки 'sql' и 'bloom' не отмечают Анкеты версией и всегда сопоставляют все Анкеты.
+    :param on_chunk: callable, если задано, то вызывается после каждой пачки с количеством Анкет в ней,
+                     например для ограничения скорости. Предложения загружаются один раз на весь прогон.
+                     Движок 'sql' сопоставляет все Анкеты одним запросом и не вызывает on_chunk.
+    :return: dict, статистика сопоставления.
+    """
+    engine = settings.APPLICATIONS_MATCHING_ENGINE
+    if engine == 'sql':
+        created = match_customers_sql(pk_gte=pk_gte, pk_lt=pk_lt)
+        return {'applications': sum(created.values()), 'lenders': created}
+
+    customers_qs = get_auto_customers()
+    if pk_gte is not None:
+        customers_qs = customers_qs.filter(pk__gte=pk_gte)
+    if pk_lt is not None:
+        customers_qs = customers_qs.filter(pk__lt=pk_lt)
+
+    chunk_size = chunk_size or settings.APPLICATIONS_MATCHING_CHUNK_SIZE
+    if engine == 'bloom':
+        # Движок не отмечает Анкеты версией набора Предложений, поэтому сопоставляются все Анкеты
+        return match_customers_bloom(customers_qs, chunk_size, on_chunk=on_chunk)
+
+    # Анкеты, уже сопоставленные с текущим набором Предложений, пропускаются.
+    # Версия вычисляется до загрузки Предложений: если набор изменится во время прогона,
+    # то Анкеты будут отмечены устаревшей версией и сопоставятся заново при следующем прогоне.
+    offers_version = get_offers_version()
+    skipped_count = 0
+    if skip_matched:
+        skipped_count = customers_qs.filter(matched_offers_version=offers_version).count()
+        customers_qs = customers_qs.exclude(matched_offers_version=offers_version)
+
+    if engine == 'numpy':
+        stats = match_customers_numpy(customers_qs, chunk_size, offers_version=offers_version, on_chunk=on_chunk)
+    else:
+        stats = match_customers_python(customers_qs, chunk_size, offers_version=offers_version, on_chunk=on_chunk)
+
+    stats['skipped'] = skipped_count
+    return stats
+
+
+def match_customers_python(customers_qs, chunk_size, offers_version=None, on_chunk=None):
+    """
+    Сопоставляет Анкеты клиентов из customers_qs через Customer.match_with_offers.
+    Анкеты обрабатываются пачками: в памяти находятся только Анкеты и Заявки текущей пачки,
+    а Заявки каждой пачки сохраняются в отдельной транзакции.
+
+    :param customers_qs: QuerySet of partners.Customer.
+    :param chunk_size: int, количество Анкет в пачке.
+    :param offers_version: int, если задано, то сопоставленные Анкеты отмечаются этой версией набора Предложений.
+    :param on_chunk: callable, вызывается после каждой пачки с количеством Анкет в ней.
+    :return: dict, статистика сопоставления.
+    """
+    customers_count = 0
+    applications_count = 0
+    started_at = datetime.now()
+
+    # Актуальные Предложения загружаются один раз на весь прогон
+    offer_index = OfferIndex.build()
+
+    customers_qs = customers_qs.prefetch_related('application_set')
+    for customers in iter_chunks(customers_qs, chunk_size):
+        with transaction.atomic():
+            applications_count += match_customers_chunk(customers, offer_index)
+            if offers_version is not None:
+                mark_customers_matched(customers, offers_version, started_at)
+        customers_count += len(customers)
+        if on_chunk is not None:
+            on_chunk(len(customers))
+
+    return {'customers': customers_count, 'applications': applications_count, 'chunk_size': chunk_size}
+
+
+def match_customers_bloom(customers_qs, chunk_size, on_chunk=None):
+    """
+    Сопоставляет Анкеты клиентов из customers_qs, отсекая существующие Заявки фильтром Блума.
+    Фильтр строится одним потоковым проходом по таблице Заявок на весь прогон, поэтому Заявки Анкет
+    не загружаются в память и не передаются в SQL. Точную проверку выполняет вставка с пропуском конфликтов.
+
+    Ложное срабатывание фильтра отбрасывает новую пару, поэтому Анкеты не отмечаются версией набора Предложений:
+    соль фильтра меняется при каждом прогоне, и отброшенная пара будет создана одним из следующих прогонов.
+
+    :param customers_qs: QuerySet of partners.Customer.
+    :param chunk_size: int, количество Анкет в пачке.
+    :param on_chunk: callable, вызывается после каждой пачки с количеством Анкет в ней.
+    :return: dict, статистика сопоставления.
+    """
+    customers_count = 0
+    applications_count = 0
+    dropped_count = 0
+
+    offer_index = OfferIndex.build()
+    bloom_filter = PairBloomFilter.from_applications(error_rate=settings.APPLICATIONS_MATCHING_BLOOM_ERROR_RATE)
+
+    customers_qs = customers_qs.only('pk', 'credit_score')
+    for customers in iter_chunks(customers_qs, chunk_size):
+        customers_count += len(customers)
+
+        pairs = np.array([
+            (customer.pk, offer.pk) for customer in customers for offer in offer_index.match(customer.credit_score)
+        ], dtype=np.int64).reshape(-1, 2)
+        if len(pairs):
+            new_pairs = pairs[~bloom_filter.contains(pairs[:, 0], pairs[:, 1])]
+            dropped_count += len(pairs) - len(new_pairs)
+            if len(new_pairs):
+                with transaction.atomic():
+                    applications_count += save_applications(new_pairs.tolist())
+
+        if on_chunk is not None:
+            on_chunk(len(customers))
+
+    return {
+        'customers': customers_count,
+        'applications': applications_count,
+        'dropped': dropped_count,
+        'chunk_size': chunk_size,
+    }
+
+
+def match_customers_chunk(customers, offer_index):
+    """
+    Сопоставляет пачку Анкет клиентов с Предложениями индекса и сохраняет новые Заявки.
+    У множества Анкет скоринговый балл одинаковый, поэтому подходящие Предложения ищутся один раз
+    для каждого балла пачки, а затем для каждой Анкеты из них вычитаются Предложения её Заявок.
+    Объекты Заявок не создаются: в save_applications() передаются пары id.
+
+    :param customers: list of partners.Customer с предзагруженными application_set.
+    :param offer_index: lenders.offer_index.OfferIndex.
+    :return: int, количество созданных Заявок.
+    """
+    offers_ids = {
+        credit_score: [offer.pk for offer in offer_index.match(credit_score)]
+        for credit_score in set(customer.credit_score for customer in customers)
+    }
+
+    pairs = []
+    for customer in customers:
+        existed_offers_ids = {application.lender_offer_id for application in customer.application_set.all()}
+        pairs += [
+            (customer.pk, offer_id) for offer_id in offers_ids[customer.credit_score]
+            if offer_id not in existed_offers_ids
+        ]
+
+    if not pairs:
+        return 0
+    return save_applications(pairs)
+
+
+def weighted_fair_shares(demands, weights, capacity, priority=()):
+    """
+    Делит capacity мест пачки между Партнёрами пропорционально весам (max-min fairness):
+    Партнёр не получает больше, чем у него Анкет в очереди, а освободившиеся места
+    делятся между остальными Партнёрами в следующем раунде.
+    Места, которые не делятся по весам нацело, достаются по одному Партнёрам в порядке priority.
+
+    :param demands: dict, {id Партнёра: количество Анкет в очереди}.
+    :param weights: dict, {id Партнёра: вес}. Отсутствующий вес считается равным 1, вес меньше 1 -- равным 1:
+                    MinValueValidator не защищает от нулевого веса, сохранённого через QuerySet.update() или в БД.
+    :param capacity: int, количество мест в пачке.
+    :param priority: iterable, id Партнёров в порядке приоритета, например по убыванию отставания.
+    :return: dict, {id Партнёра: количество мест}.
+    """
+    weights = {partner_id: max(weights.get(partner_id, 1), 1) for partner_id in demands}
+    shares = {partner_id: 0 for partner_id in demands}
+    capacity = min(capacity, sum(demands.values()))
+    priority = [partner_id for partner_id in priority if partner_id in demands]
+    priority += sorted(partner_id for partner_id in demands if partner_id not in priority)
+
+    while capacity > 0:
+        active = [partner_id for partner_id in priority if shares[partner_id] < demands[partner_id]]
+        total_weight = sum(weights[partner_id] for partner_id in active)
+
+        granted = 0
+        for partner_id in active:
+            share = min(capacity * weights[partner_id] // total_weight, demands[partner_id] - shares[partner_id])
+            shares[partner_id] += share
+            granted += share
+
+        if not granted:
+            for partner_id in active[:capacity]:
+                shares[partner_id] += 1
+                granted += 1
+
+        capacity -= granted
+
+    return shares
+
+
+def drain_pending_matches(batch_size=None, now=None):
+    """
+    Разбирает очередь Анкет клиентов на сопоставление (applications.PendingMatch) пачками.
+    Пачка забирается из очереди через DELETE ... FOR UPDATE SKIP LOCKED (PendingMatch.objects.claim())
+    и сопоставляется в той же транзакции, поэтому очередь могут одновременно разбирать несколько воркеров:
+    заблокированные другим воркером Анкеты пропускаются. Анкета, изменённая во время сопоставления,
+    снова ставится в очередь после фиксации транзакции.
+
+    Места в пачке делятся между Партнёрами пропорционально Partner.matching_weight (weighted_fair_shares()),
+    поэтому Партнёр, загрузивший много Анкет, не задерживает сопоставление Анкет остальных Партнёров.
+    Внутри доли Партнёра Анкеты разбираются в порядке постановки в очередь.
+
+    :param batch_size: int, количество Анкет в пачке.
+                       По умолчанию значение настройки APPLICATIONS_MATCHING_CHUNK_SIZE.
+    :param now: datetime, момент, от которого считается отставание. По умолчанию текущее время.
+    :return: dict, статистика сопоставления. В 'lag' -- отставание очереди каждого Партнёра в секундах
+             (возраст самой старой Анкеты в очереди) на момент начала разбора.
+    """
+    batch_size = batch_size or settings.APPLICATIONS_MATCHING_CHUNK_SIZE
+    now = now or datetime.now()
+    offer_index = OfferIndex.build()
+    weights = dict(Partner.objects.values_list('pk', 'matching_weight'))
+
+    stats = {'customers': 0, 'applications': 0, 'batches': 0, 'lag': None}
+    while True:
+        with transaction.atomic():
+            queue = list(
+                PendingMatch.objects.order_by().values('partner_id').annotate(count=Count('pk'), oldest=Min('created_at'))
+            )
+            if stats['lag'] is None:
+                stats['lag'] = {
+                    item['partner_id']: max(0.0, (now - item['oldest']).total_seconds()) for item in queue
+                }
+
+            # Раньше места, не делящиеся по весам нацело, получают Партнёры с наибольшим отставанием
+            priority = [item['partner_id'] for item in sorted(queue, key=lambda item: item['oldest'])]
+            shares = weighted_fair_shares(
+                {item['partner_id']: item['count'] for item in queue}, weights, batch_size, priority
+            )
+
+            customers_ids = []
+            for partner_id in priority:
+                if not shares[partner_id]:
+                    continue
+                customers_ids += PendingMatch.objects.claim(partner_id, shares[partner_id])
+            if not customers_ids:
+                break
+
+            # Режим Анкеты мог смениться после постановки в очередь, сопоставляются только Анкеты с режимом 'auto'
+            customers = list(get_auto_customers().filter(pk__in=customers_ids).prefetch_related('application_set'))
+            stats['applications'] += match_customers_chunk(customers, offer_index)
+
+        stats['customers'] += len(customers)
+        stats['batches'] += 1
+
+    return stats
+
+
+class OfferArrays:
+    """
+    Предложения в виде массивов NumPy для векторизованного сопоставления пачек Анкет клиентов.
+    """
+
+    def __init__(self, ids, lender_ids, min_credit_scores, max_credit_scores, rotating_starts, rotating_ends,
+                 now=None):
+        now = np.datetime64(now or datetime.now(), 'us')
+
+        self.ids = ids
+        self.lender_ids = lender_ids
+        self.min_credit_scores = min_credit_scores
+        self.max_credit_scores = max_credit_scores
+        self.rotating_starts = rotating_starts
+        self.rotating_ends = rotating_ends
+        self.active = (self.rotating_starts <= now) & (now <= self.rotating_ends)
+
+    @classmethod
+    def from_offers(cls, offers, now=None):
+        offers = list(offers)
+        return cls(
+            ids=np.array([offer.pk for offer in offers], dtype=np.int64),
+            lender_ids=np.array([offer.lender_id for offer in offers], dtype=np.int64),
+            min_credit_scores=np.array([offer.min_credit_score for offer in offers], dtype=np.int64),
+            max_credit_scores=np.array([offer.max_credit_score for offer in offers], dtype=np.int64),
+            rotating_starts=np.array([offer.rotating_start for offer in offers], dtype='datetime64[us]'),
+            rotating_ends=np.array([offer.rotating_end for offer in offers], dtype='datetime64[us]'),
+            now=now,
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot, now=None):
+        """
+        Строит массивы поверх снимка Предложений, отображённого в память, без копирования данных.
+        Неактуальные Предложения снимка отсекаются маской active.
+
+        :param snapshot: lenders.offer_snapshot.OfferSnapshot.
+        :param now: datetime, по умолчанию текущее время.
+        :return: OfferArrays
+        """
+        return cls(
+            ids=snapshot.ids,
+            lender_ids=snapshot.lender_ids,
+            min_credit_scores=snapshot.min_credit_scores,
+            max_credit_scores=snapshot.max_credit_scores,
+            rotating_starts=snapshot.rotating_starts,
+            rotating_ends=snapshot.rotating_ends,
+            now=now,
+        )
+
+    @classmethod
+    def build(cls, now=None):
+        """
+        Строит массивы по актуальным Предложениям. Если задана настройка APPLICATIONS_OFFER_SNAPSHOT_PATH,
+        то Предложения берутся из общего для всех процессов хоста снимка в памяти, а не из БД.
+        """
+        now = now or datetime.now()
+        if settings.APPLICATIONS_OFFER_SNAPSHOT_PATH:
+            return cls.from_snapshot(get_offer_snapshot(settings.APPLICATIONS_OFFER_SNAPSHOT_PATH, now), now=now)
+
+        offers = Offer.objects.active(now).only(
+            'pk', 'lender_id', 'min_credit_score', 'max_credit_score', 'rotating_start', 'rotating_end'
+        )
+        return cls.from_offers(offers, now=now)
+
+    def match(self, customers, existed_pairs=()):
+        """
+        Сопоставляет пачку Анкет клиентов с Предложениями.
+        Аналог Customer.match_with_offers для множества Анкет: создаёт Заявки, но НЕ сохраняет их в базу.
+
+        :param customers: list of partners.Customer, достаточно полей pk и credit_score.
+        :param existed_pairs: iterable of (customer_id, lender_offer_id), уже существующие Заявки.
+        :return: list of applications.Application, список новых не сохранённых в базу Заявок
+        """
+        return [
+            Application(customer_id=customer_id, lender_offer_id=offer_id)
+            for customer_id, offer_id in self.match_pairs(customers, existed_pairs)
+        ]
+
+    def match_pairs(self, customers, existed_pairs=()):
+        """
+        То же, что match, но возвращает пары id без создания объектов Заявок.
+
+        :return: list of (customer_id, lender_offer_id)
+        """
+        if not customers or not len(self.ids):
+            return []
+
+        customers_ids = np.array([customer.pk for customer in customers], dtype=np.int64)
+        credit_scores = np.array([customer.credit_score for customer in customers], dtype=np.int64)
+
+        # Матрица "Анкета x Предложение": подходит ли Предложение Анкете
+        eligible = (
+            (credit_scores[:, np.newaxis] >= self.min_credit_scores[np.newaxis, :]) &
+            (credit_scores[:, np.newaxis] <= self.max_credit_scores[np.newaxis, :]) &
+            self.active[np.newaxis, :]
+        )
+        rows, cols = np.nonzero(eligible)
+        pairs_customers_ids = customers_ids[rows]
+        pairs_offers_ids = self.ids[cols]
+
+        # Убираем уже существующие Заявки, кодируя пару (Анкета, Предложение) одним числом
+        existed_pairs = np.array(list(existed_pairs), dtype=np.int64).reshape(-1, 2)
+        if len(existed_pairs):
+            base = max(self.ids.max(), existed_pairs[:, 1].max()) + 1
+            new = ~np.isin(
+                pairs_customers_ids * base + pairs_offers_ids,
+                existed_pairs[:, 0] * base + existed_pairs[:, 1]
+            )
+            pairs_customers_ids = pairs_customers_ids[new]
+            pairs_offers_ids = pairs_offers_ids[new]
+
+        return list(zip(pairs_customers_ids.tolist(), pairs_offers_ids.tolist()))
+
+
+def match_customers_numpy(customers_qs, chunk_size, offers_version=None, on_chunk=None):
+    """
+    Сопоставляет Анкеты клиентов из customers_qs векторизованно через OfferArrays.
+    Вместо цикла по Анкетам для каждой пачки вычисляется матрица подходящих пар (Анкета, Предложение).
+
+    :param customers_qs: QuerySet of partners.Customer.
+    :param chunk_size: int, количество Анкет в пачке.
+    :param offers_version: int, если задано, то сопоставленные Анкеты отмечаются этой версией набора Предложений.
+    :param on_chunk: callable, вызывается после каждой пачки с количеством Анкет в ней.
+    :return: dict, статистика сопоставления.
+    """
+    customers_count = 0
+    applications_count = 0
+    started_at = datetime.now()
+
+    offer_arrays = OfferArrays.build()
+
+    customers_qs = customers_qs.only('pk', 'credit_score')
+    for customers in iter_chunks(customers_qs, chunk_size):
+        existed_pairs = Application.objects.filter(
+            customer_id__gte=customers[0].pk,
+            customer_id__lte=customers[-1].pk
+        ).values_list('customer_id', 'lender_offer_id')
+
+        new_pairs = offer_arrays.match_pairs(customers, existed_pairs)
+        with transaction.atomic():
+            if new_pairs:
+                applications_count += save_applications(new_pairs)
+            if offers_version is not None:
+                mark_customers_matched(customers, offers_version, started_at)
+
+        customers_count += len(customers)
+        if on_chunk is not None:
+            on_chunk(len(customers))
+
+    return {'customers': customers_count, 'applications': applications_count, 'chunk_size': chunk_size}
+
+
+def match_offer(offer, now=None, chunk_size=None):
+    """
+    Обратное сопоставление: создаёт Заявки по Предложению для всех подходящих Анкет клиентов с режимом 'auto'.
+    Выбираются только Анкеты, скоринговый балл которых попадает в диапазон Предложения,
+    поэтому стоимость зависит от количества подходящих Анкет, а не от размера всей таблицы.
+
+    :param offer: lenders.Offer.
+    :param now: datetime, момент, на который проверяется актуальность Предложения. По умолчанию текущее время.
+    :param chunk_size: int, количество Заявок, сохраняемых за одну транзакцию.
+                       По умолчанию значение настройки APPLICATIONS_MATCHING_CHUNK_SIZE.
+    :return: int, количество созданных Заявок.
+    """
+    now = now or datetime.now()
+    if not offer.rotating_start <= now <= offer.rotating_end:
+        return 0
+
+    customers_qs = get_auto_customers().filter(
+        credit_score__gte=offer.min_credit_score,
+        credit_score__lte=offer.max_credit_score
+    ).exclude(
+        application__lender_offer=offer
+    ).only('pk')
+
+    applications_count = 0
+    for customers in iter_chunks(customers_qs, chunk_size or settings.APPLICATIONS_MATCHING_CHUNK_SIZE):
+        with transaction.atomic():
+            applications_count += save_applications((customer.pk, offer.pk) for customer in customers)
+
+    return applications_count
+
+
+def match_customers_sql(now=None, pk_gte=None, pk_lt=None):
+    """
+    Сопоставляет Анкеты клиентов с режимом 'auto' с актуальными Предложениями
+    и создаёт Заявки одним INSERT ... SELECT на стороне PostgreSQL.
+    Анкеты и Заявки не загружаются в память.
+
+    :param now: datetime, момент, на который проверяется актуальность Предложений. По умолчанию текущее время.
+    :param pk_gte: int, если задано, то сопоставляются только Анкеты с id >= pk_gte.
+    :param pk_lt: int, если задано, то сопоставляются только Анкеты с id < pk_lt.
+    :return: dict, {id Кредитной организации: количество созданных Заявок}
+    """
+    now = now or datetime.now()
+    sql = MATCH_CUSTOMERS_SQL.format(
+        application=Application._meta.db_table,
+        customer=Customer._meta.db_table,
+        offer=Offer._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'status': Application.NEW,
+            'now': now,
+            'mode': 'auto',
+            'pk_gte': pk_gte,
+            'pk_lt': pk_lt,
+        })
+        return dict(cursor.fetchall())
@@ -0,0 +1,26 @@
+# Generated by Django 2.1.2 on 2026-10-18 15:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0002_customer_updated_at_index'),
+        ('applications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingMatch',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='partners.Customer', verbose_name='Анкета клиента')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата и время постановки в очередь')),
+            ],
+            options={
+                'verbose_name': 'Анкета в очереди на сопоставление',
+                'verbose_name_plural': 'Очередь анкет на сопоставление',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.1.2 on 2026-10-18 16:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0005_partner_matching_weight'),
+        ('applications', '0002_pendingmatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingmatch',
+            name='partner',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='partners.Partner', verbose_name='Партнёр'),
+        ),
+        # Заполняем Партнёра у Анкет, которые уже стоят в очереди
+        migrations.RunSQL(
+            sql=(
+                'UPDATE applications_pendingmatch SET partner_id = partners_customer.partner_id '
+                'FROM partners_customer WHERE partners_customer.id = applications_pendingmatch.customer_id'
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='pendingmatch',
+            name='partner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='partners.Partner', verbose_name='Партнёр'),
+        ),
+        migrations.AddIndex(
+            model_name='pendingmatch',
+            index=models.Index(fields=['partner', 'created_at'], name='applications_pending_partner'),
+        ),
+    ]
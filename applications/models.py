@@ -1,8 +1,149 @@
 # encoding: utf-8
-from django.db import models
+from datetime import datetime
+
+from django.db import connections, models, transaction
 
 from lenders.models import Offer
-from partners.models import Customer
+from partners.models import Customer, Partner
+
+
+# Порядок полей в строках, которые принимает ApplicationQuerySet.copy_skip_conflicts()
+COPY_COLUMNS = ('customer_id', 'lender_offer_id', 'status', 'created_at', 'updated_at')
+
+
+class CopyRowsReader:
+    """
+    Файлоподобный объект для COPY FROM STDIN: строки кодируются в текстовый формат COPY по мере чтения,
+    поэтому в памяти находится не весь набор строк, а только очередной блок данных.
+
+    Исключение, возникшее при получении строк, psycopg2 заменяет на QueryCanceled,
+    поэтому оно сохраняется в error, чтобы вызывающий код мог выбросить исходное исключение.
+
+    :param rows: iterable of tuple, значения столбцов строки. None записывается как NULL.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ''
+        self.error = None
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                row = next(self._rows, None)
+            except Exception as e:
+                self.error = e
+                raise
+            if row is None:
+                break
+            self._buffer += '\t'.join('\\N' if value is None else str(value) for value in row) + '\n'
+
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class ApplicationQuerySet(models.QuerySet):
+
+    def bulk_create_skip_conflicts(self, objs, batch_size=1000):
+        """
+        Аналог bulk_create, который пропускает Заявки, уже существующие в базе (INSERT ... ON CONFLICT DO NOTHING).
+        Одна и та же пара (Предложение, Анкета клиента) может одновременно сохраняться
+        несколькими сопоставлениями, и IntegrityError в bulk_create откатил бы всю пачку.
+
+        :param objs: list of applications.Application, не сохранённые в базу Заявки.
+        :param batch_size: int, количество Заявок в одном INSERT.
+        :return: list of applications.Application, Заявки, которые действительно были вставлены; у них заполнен pk.
+        """
+        connection = connections[self.db]
+        opts = self.model._meta
+        fields = [field for field in opts.concrete_fields if field is not opts.auto_field]
+
+        created = []
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+
+            params = []
+            for obj in batch:
+                params += [
+                    field.get_db_prep_save(field.pre_save(obj, add=True), connection=connection) for field in fields
+                ]
+
+            sql = (
+                'INSERT INTO {table} ({columns}) VALUES {values} '
+                'ON CONFLICT (lender_offer_id, customer_id) DO NOTHING '
+                'RETURNING {pk}, lender_offer_id, customer_id'
+            ).format(
+                table=opts.db_table,
+                columns=', '.join(field.column for field in fields),
+                values=', '.join(['({0})'.format(', '.join(['%s'] * len(fields)))] * len(batch)),
+                pk=opts.pk.column,
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                inserted = {(lender_offer_id, customer_id): pk for pk, lender_offer_id, customer_id in cursor.fetchall()}
+
+            for obj in batch:
+                pk = inserted.pop((obj.lender_offer_id, obj.customer_id), None)
+                if pk is not None:
+                    obj.pk = pk
+                    obj._state.adding = False
+                    obj._state.db = self.db
+                    created.append(obj)
+
+        return created
+
+    def copy_skip_conflicts(self, rows):
+        """
+        Загружает Заявки через COPY FROM STDIN во временную таблицу и переносит их в таблицу Заявок
+        одним INSERT ... SELECT ... ON CONFLICT DO NOTHING. Объекты моделей не создаются, а строки
+        передаются в COPY по мере чтения (CopyRowsReader), поэтому способ подходит для больших объёмов.
+        Строки, ссылающиеся на несуществующие Анкеты клиентов или Предложения, пропускаются так же,
+        как уже существующие Заявки.
+
+        :param rows: iterable of tuple (customer_id, lender_offer_id, status, created_at, updated_at).
+        :return: int, количество действительно вставленных Заявок.
+        """
+        table = self.model._meta.db_table
+        staging_table = '{0}_staging'.format(table)
+        columns = ', '.join(COPY_COLUMNS)
+
+        with transaction.atomic(using=self.db), connections[self.db].cursor() as cursor:
+            # Временная таблица живёт до конца сессии и очищается при каждой фиксации транзакции
+            cursor.execute(
+                'CREATE TEMPORARY TABLE IF NOT EXISTS {staging_table} ON COMMIT DELETE ROWS '
+                'AS SELECT {columns} FROM {table} WITH NO DATA'.format(
+                    staging_table=staging_table, columns=columns, table=table
+                )
+            )
+            reader = CopyRowsReader(rows)
+            try:
+                cursor.copy_expert('COPY {0} ({1}) FROM STDIN'.format(staging_table, columns), reader)
+            except Exception:
+                if reader.error is not None:
+                    raise reader.error
+                raise
+            cursor.execute(
+                'INSERT INTO {table} ({columns}) '
+                'SELECT {staging_columns} FROM {staging_table} AS staging '
+                'JOIN {customer} AS customer ON customer.id = staging.customer_id '
+                'JOIN {offer} AS offer ON offer.id = staging.lender_offer_id '
+                'ON CONFLICT (lender_offer_id, customer_id) DO NOTHING'.format(
+                    table=table,
+                    columns=columns,
+                    staging_columns=', '.join('staging.{0}'.format(column) for column in COPY_COLUMNS),
+                    staging_table=staging_table,
+                    customer=Customer._meta.db_table,
+                    offer=Offer._meta.db_table,
+                )
+            )
+            inserted = cursor.rowcount
+
+            # Временная таблица могла быть создана во внешней транзакции и ещё не очищена
+            cursor.execute('TRUNCATE {0}'.format(staging_table))
+
+        return inserted
 
 
 class Application(models.Model):
@@ -31,10 +172,111 @@ class Application(models.Model):
     created_at = models.DateTimeField(verbose_name='Дата и время создания', auto_now_add=True)
     updated_at = models.DateTimeField(verbose_name='Дата и время обновления', auto_now=True)
 
+    objects = ApplicationQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Заявка'
         verbose_name_plural = 'Заявки'
         unique_together = ('lender_offer', 'customer')
+        indexes = [
+            # Постраничный вывод по курсору (common.pagination.KeysetCursorPagination)
+            models.Index(fields=['created_at', 'id'], name='applications_created_id'),
+            models.Index(fields=['updated_at', 'id'], name='applications_updated_id'),
+        ]
 
     def __str__(self):
         return '{0} | {1}'.format(self.customer, self.lender_offer)
+
+
+class PendingMatchQuerySet(models.QuerySet):
+
+    def enqueue(self, customers_ids):
+        """
+        Ставит Анкеты клиентов в очередь на сопоставление. Анкеты, которые уже в очереди, пропускаются.
+
+        :param customers_ids: iterable of int, id Анкет клиентов.
+        :return: int, количество добавленных в очередь Анкет.
+        """
+        customers_ids = list(customers_ids)
+        if not customers_ids:
+            return 0
+
+        sql = (
+            'INSERT INTO {table} (customer_id, partner_id, created_at) '
+            'SELECT id, partner_id, %s FROM {customer} WHERE id = ANY(%s::integer[]) '
+            'ON CONFLICT (customer_id) DO NOTHING'
+        ).format(table=self.model._meta.db_table, customer=Customer._meta.db_table)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [datetime.now(), customers_ids])
+            return cursor.rowcount
+
+    def enqueue_for_offer(self, offer):
+        """
+        Ставит в очередь на сопоставление Анкеты клиентов с режимом 'auto',
+        скоринговый балл которых попадает в диапазон Предложения.
+
+        :param offer: lenders.Offer.
+        :return: int, количество добавленных в очередь Анкет.
+        """
+        sql = (
+            'INSERT INTO {table} (customer_id, partner_id, created_at) '
+            'SELECT id, partner_id, %(now)s FROM {customer} '
+            'WHERE offer_matching_mode @> ARRAY[%(mode)s]::varchar(10)[] '
+            'AND credit_score BETWEEN %(min_credit_score)s AND %(max_credit_score)s '
+            'ON CONFLICT (customer_id) DO NOTHING'
+        ).format(table=self.model._meta.db_table, customer=Customer._meta.db_table)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, {
+                'now': datetime.now(),
+                'mode': 'auto',
+                'min_credit_score': offer.min_credit_score,
+                'max_credit_score': offer.max_credit_score,
+            })
+            return cursor.rowcount
+
+    def claim(self, partner_id, limit):
+        """
+        Забирает из очереди до limit самых старых Анкет клиентов Партнёра: строки удаляются сразу,
+        а строки, заблокированные другими воркерами, пропускаются (FOR UPDATE SKIP LOCKED).
+        Вызывается в транзакции, в которой забранные Анкеты сопоставляются: при ошибке строки возвращаются в очередь.
+
+        Параллельная постановка той же Анкеты в очередь (enqueue) ждёт фиксации этой транзакции
+        и затем добавляет строку заново, поэтому изменение Анкеты во время сопоставления не теряется.
+
+        :param partner_id: int, id Партнёра.
+        :param limit: int, наибольшее количество Анкет.
+        :return: list of int, id забранных Анкет клиентов.
+        """
+        sql = (
+            'DELETE FROM {table} WHERE customer_id IN ('
+            'SELECT customer_id FROM {table} WHERE partner_id = %s ORDER BY created_at LIMIT %s '
+            'FOR UPDATE SKIP LOCKED'
+            ') RETURNING customer_id'
+        ).format(table=self.model._meta.db_table)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [partner_id, limit])
+            return [customer_id for customer_id, in cursor.fetchall()]
+
+
+class PendingMatch(models.Model):
+    """
+    Очередь Анкет клиентов, которые нужно сопоставить с Предложениями: новые и изменённые Анкеты,
+    а также Анкеты, которым может подойти созданное или изменённое Предложение.
+    Очередь разбирается воркерами через DELETE ... FOR UPDATE SKIP LOCKED (applications.matching.drain_pending_matches).
+    """
+
+    customer = models.OneToOneField(
+        Customer, verbose_name='Анкета клиента', on_delete=models.CASCADE, primary_key=True
+    )
+    # Партнёр Анкеты. Хранится в очереди, чтобы распределять сопоставление между Партнёрами без соединения с Анкетами
+    partner = models.ForeignKey(Partner, verbose_name='Партнёр', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(verbose_name='Дата и время постановки в очередь', auto_now_add=True)
+
+    objects = PendingMatchQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Анкета в очереди на сопоставление'
+        verbose_name_plural = 'Очередь анкет на сопоставление'
+        indexes = [
+            models.Index(fields=['partner', 'created_at'], name='applications_pending_partner'),
+        ]
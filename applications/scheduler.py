@@ -0,0 +1,73 @@
+# encoding: utf-8
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Min
+
+from applications.matching import get_offers_version
+from lenders.models import Offer
+
+
+MATCHING_STATE_CACHE_KEY = 'applications:matching_state'
+NEXT_ROTATION_CACHE_KEY = 'applications:next_rotation'
+
+
+def get_next_rotation_start(now=None):
+    """
+    Возвращает ближайший момент в будущем, когда начинается ротация какого-либо Предложения.
+
+    :param now: datetime, по умолчанию текущее время.
+    :return: datetime или None, если таких Предложений нет.
+    """
+    now = now or datetime.now()
+    return Offer.objects.filter(
+        rotating_start__gt=now
+    ).aggregate(
+        next_start=Min('rotating_start')
+    )['next_start']
+
+
+def schedule_next_rotation(now=None):
+    """
+    Ставит отложенную задачу сопоставления Предложений, у которых начинается ротация,
+    на момент начала ротации ближайшего Предложения.
+    Если задача на этот момент уже поставлена, то повторно не ставится.
+
+    :param now: datetime, по умолчанию текущее время.
+    :return: datetime или None, момент, на который запланировано сопоставление.
+    """
+    from applications.tasks import rotate_offers_task   # Импортируем тут, иначе получается циклический импорт.
+
+    now = now or datetime.now()
+    next_start = get_next_rotation_start(now)
+    if next_start is None or cache.get(NEXT_ROTATION_CACHE_KEY) == next_start:
+        return next_start
+
+    countdown = (next_start - now).total_seconds()
+    rotate_offers_task.apply_async((next_start.isoformat(),), countdown=countdown)
+    cache.set(NEXT_ROTATION_CACHE_KEY, next_start, timeout=int(countdown) + 1)
+    return next_start
+
+
+def get_matching_state(now=None):
+    """
+    Возвращает отпечаток данных, от которых зависит результат периодического сопоставления:
+    версию набора актуальных Предложений (get_offers_version()), вычисляемую одним агрегирующим запросом.
+    Если отпечаток не изменился с прошлого сопоставления, то новых Заявок не появится.
+
+    Анкеты клиентов в отпечаток не входят. Сохранение Анкеты с режимом 'auto' в той же транзакции ставит её
+    в очередь applications.PendingMatch, которую разбирает drain_pending_matches_task. Поэтому Анкета не теряется,
+    даже если её транзакция зафиксирована позже других с более поздним updated_at.
+
+    :param now: datetime, по умолчанию текущее время.
+    :return: int
+    """
+    return get_offers_version(now)
+
+
+def is_matching_state_changed(state):
+    return cache.get(MATCHING_STATE_CACHE_KEY) != state
+
+
+def remember_matching_state(state):
+    cache.set(MATCHING_STATE_CACHE_KEY, state, timeout=None)
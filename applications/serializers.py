@@ -1,9 +1,14 @@
 # encoding: utf-8
+from collections import OrderedDict
+from operator import methodcaller
+
 from django.shortcuts import get_object_or_404
-from rest_framework import serializers
+from django.urls import reverse
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 
 from applications.models import Application
-from applications.tasks import match_customer_task
+from applications.tasks import enqueue_match_customer
 from lenders.models import Lender
 from partners.models import Customer
 
@@ -23,6 +28,103 @@ class ApplicationSerializer(serializers.ModelSerializer):
         return obj.get_status_display()
 
 
+class ApplicationValuesSerializer:
+    """
+    Быстрая сериализация списка Заявок с тем же результатом, что и у ApplicationSerializer.
+
+    Читает строки queryset.values(*ApplicationValuesSerializer.get_values_fields()) вместо объектов моделей.
+    Ссылки на Анкету клиента и Предложение строятся по шаблонам, которые вычисляются один раз на сериализатор,
+    а не через reverse() для каждой строки. Названия статусов берутся из словаря.
+    """
+
+    # {поле ответа: колонка строки values()}, в порядке полей ApplicationSerializer
+    sources = OrderedDict((
+        ('id', 'id'),
+        ('customer', 'customer_id'),
+        ('lender_offer', 'lender_offer_id'),
+        ('status', 'status'),
+        ('status_display', 'status'),
+        ('created_at', 'created_at'),
+        ('updated_at', 'updated_at'),
+    ))
+    status_labels = dict(Application.STATUSES)
+
+    def __init__(self, instance, context, fields=None):
+        """
+        :param instance: iterable of dict, строки values().
+        :param context: dict, контекст сериализатора; для абсолютных ссылок нужен request.
+        :param fields: set of str, поля ответа. По умолчанию все поля.
+        """
+        self.instance = instance
+        self.context = context
+        self.fields = [name for name in self.sources if fields is None or name in fields]
+
+    @classmethod
+    def get_values_fields(cls, fields=None):
+        """
+        :param fields: set of str, поля ответа. По умолчанию все поля.
+        :return: list of str, колонки, которые нужно выбрать через values().
+        """
+        return list(OrderedDict.fromkeys(
+            source for name, source in cls.sources.items() if fields is None or name in fields
+        ))
+
+    def get_url_template(self, view_name):
+        """
+        Возвращает функцию, которая строит абсолютную ссылку на объект по его id.
+        """
+        # Ссылка строится один раз для id-заглушки, которую затем заменяет id объекта
+        placeholder = '2147483647'
+        url = reverse(view_name, kwargs={'pk': placeholder})
+        request = self.context.get('request')
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        prefix, suffix = url.rsplit(placeholder, 1)
+        return lambda pk: '{0}{1}{2}'.format(prefix, pk, suffix)
+
+    @property
+    def data(self):
+        customer_url = self.get_url_template('customers_detail')
+        lender_offer_url = self.get_url_template('offers_detail')
+        status_labels = self.status_labels
+        datetime_format = api_settings.DATETIME_FORMAT
+        if datetime_format is None or datetime_format.lower() == ISO_8601:
+            format_datetime = serializers.DateTimeField().to_representation
+        else:
+            format_datetime = methodcaller('strftime', datetime_format)
+
+        if len(self.fields) == len(self.sources):
+            return [
+                OrderedDict((
+                    ('id', row['id']),
+                    ('customer', customer_url(row['customer_id'])),
+                    ('lender_offer', lender_offer_url(row['lender_offer_id'])),
+                    ('status', row['status']),
+                    ('status_display', status_labels.get(row['status'], row['status'])),
+                    ('created_at', format_datetime(row['created_at'])),
+                    ('updated_at', format_datetime(row['updated_at'])),
+                ))
+                for row in self.instance
+            ]
+
+        # Ответ с частью полей (?fields=)
+        converters = {
+            'customer': customer_url,
+            'lender_offer': lender_offer_url,
+            'status_display': lambda status: status_labels.get(status, status),
+            'created_at': format_datetime,
+            'updated_at': format_datetime,
+        }
+        fields = [(name, self.sources[name], converters.get(name)) for name in self.fields]
+
+        return [
+            OrderedDict(
+                (name, row[source] if convert is None else convert(row[source])) for name, source, convert in fields
+            )
+            for row in self.instance
+        ]
+
+
 class BaseApplicationSerializer(serializers.Serializer):
 
     customer_id = serializers.IntegerField()
@@ -32,7 +134,7 @@ class BaseApplicationSerializer(serializers.Serializer):
         customer = get_object_or_404(Customer, pk=value)
         self.customer = customer
 
-        if 'manual' not in customer.offer_matching_mode:
+        if not customer.is_manual:
             manual_verbous = filter(lambda x: x[0] == 'manual', Customer.OFFER_MATCHING_MODES)
             manual_verbous = list(manual_verbous)[0][1]
             raise serializers.ValidationError(
@@ -70,8 +172,8 @@ class ApplicationToCertainLenderSerializer(BaseApplicationSerializer):
     def save(self):
         existed_applications, new_applications = self.customer.match_with_offers(self.lender, return_existed=True)
 
-        # Сохраняем новые Заявки в базу
-        Application.objects.bulk_create(new_applications)
+        # Сохраняем новые Заявки в базу. Заявки, которые успело создать параллельное сопоставление, пропускаются
+        new_applications = Application.objects.bulk_create_skip_conflicts(new_applications)
 
         self.existed_applications = existed_applications
         self.new_applications = new_applications
@@ -90,4 +192,4 @@ class ApplicationToAllLendersSerializer(BaseApplicationSerializer):
         return value
 
     def save(self):
-        match_customer_task.delay(self.validated_data['customer_id'])
+        enqueue_match_customer(self.validated_data['customer_id'])
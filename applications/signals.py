@@ -0,0 +1,57 @@
+# encoding: utf-8
+from datetime import datetime
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from applications.models import PendingMatch
+from applications.scheduler import schedule_next_rotation
+from applications.tasks import enqueue_offer_matches_task
+from lenders.models import Offer
+from partners.models import Customer
+
+
+# Поля Предложения, от которых зависит, каким Анкетам клиентов оно подходит
+OFFER_MATCHING_FIELDS = ('min_credit_score', 'max_credit_score', 'rotating_start', 'rotating_end')
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def reschedule_rotation_on_offer_change(sender, instance, **kwargs):
+    # Начало ротации могло сдвинуться, перепланируем сопоставление после сохранения изменений в БД
+    transaction.on_commit(schedule_next_rotation)
+
+
+@receiver(pre_save, sender=Offer)
+def detect_offer_matching_change(sender, instance, update_fields=None, **kwargs):
+    # Подходящие Анкеты клиентов меняются только у нового Предложения или при изменении диапазона балла
+    # и периода ротации. Изменение, например, названия не ставит Анкеты в очередь.
+    if instance.pk is None:
+        instance._matching_changed = True
+    elif update_fields is not None and not set(update_fields) & set(OFFER_MATCHING_FIELDS):
+        instance._matching_changed = False
+    else:
+        stored = Offer.objects.filter(pk=instance.pk).values_list(*OFFER_MATCHING_FIELDS).first()
+        instance._matching_changed = stored != tuple(getattr(instance, field) for field in OFFER_MATCHING_FIELDS)
+
+
+@receiver(post_save, sender=Offer)
+def match_offer_on_save(sender, instance, **kwargs):
+    # Сохранение Предложения, в том числе через админку, ставит в очередь на сопоставление подходящие Анкеты клиентов.
+    # Очередь пополняется задачей после фиксации транзакции: подходящих Анкет может быть очень много.
+    # Если ротация Предложения ещё не началась, то Заявки создаст отложенная задача в момент её начала.
+    if not getattr(instance, '_matching_changed', True):
+        return
+
+    if instance.rotating_start <= datetime.now() <= instance.rotating_end:
+        transaction.on_commit(partial(enqueue_offer_matches_task.delay, instance.pk))
+
+
+@receiver(post_save, sender=Customer)
+def match_customer_on_save(sender, instance, **kwargs):
+    # Новые и изменённые Анкеты клиентов, в том числе созданные через API, сопоставляются воркерами из очереди.
+    # Очередь пополняется в той же транзакции, что и сохранение Анкеты.
+    if instance.is_auto:
+        PendingMatch.objects.enqueue([instance.pk])
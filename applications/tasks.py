@@ -1,16 +1,114 @@
 # encoding: utf-8
 import numbers
+import uuid
 
-from celery import shared_task
+from celery import chord, shared_task
+from celery.signals import worker_ready
+from celery.utils.log import get_task_logger
 from django.conf import settings
+from django.core.cache import caches
 from django.db.models import Prefetch
+from django.utils.dateparse import parse_datetime
 
-from applications.models import Application
+from applications.matching import (drain_pending_matches, match_customers,
+                                   match_offer, split_customers_pk_range)
+from applications.models import Application, PendingMatch
+from applications.scheduler import (get_matching_state,
+                                    is_matching_state_changed,
+                                    remember_matching_state,
+                                    schedule_next_rotation)
+from lenders.models import Offer, ScoreOffers
 from partners.models import Customer
 
 
+logger = get_task_logger(__name__)
+
+# Кэш ключей объединения запросов (настройка CACHES)
+MATCH_CUSTOMER_CACHE_ALIAS = 'matching'
+
+# Ключ поколения запросов на сопоставление Анкеты. Значение -- token задачи match_customer_task, ожидающей выполнения
+MATCH_CUSTOMER_CACHE_KEY = 'applications:match_customer:{0}'
+
+# Номера запросов поколения token. Каждый повторный запрос занимает первый свободный номер через cache.add(),
+# задача закрывает поколение, занимая первый свободный номер значением MATCH_CUSTOMER_CLOSED.
+# cache.add() атомарен во всех бэкендах кэша, поэтому ни один запрос не теряется между подсчётом и закрытием.
+MATCH_CUSTOMER_REQUEST_CACHE_KEY = 'applications:match_customer:{0}:{1}'
+MATCH_CUSTOMER_CLOSED = 'closed'
+
+
+def claim_match_customer_request(token, value):
+    """
+    Занимает первый свободный номер запроса в поколении token.
+
+    :param token: str, поколение запросов.
+    :param value: значение номера: 1 для запроса, MATCH_CUSTOMER_CLOSED для закрытия поколения задачей.
+    :return: (int, boolean), занятый номер и признак того, что поколение уже закрыто задачей.
+    """
+    cache = caches[MATCH_CUSTOMER_CACHE_ALIAS]
+    number = 0
+    while True:
+        number += 1
+        key = MATCH_CUSTOMER_REQUEST_CACHE_KEY.format(token, number)
+        if cache.add(key, value, timeout=settings.APPLICATIONS_MATCH_CUSTOMER_COALESCE_WINDOW):
+            return number, False
+        if cache.get(key) == MATCH_CUSTOMER_CLOSED:
+            return number, True
+
+
+def enqueue_match_customer(customer_id):
+    """
+    Ставит задачу match_customer_task для Анкеты клиента, если она ещё не стоит в очереди.
+    Повторные запросы в течение APPLICATIONS_MATCH_CUSTOMER_COALESCE_WINDOW секунд объединяются с уже
+    поставленной задачей: она сопоставит Анкету с Предложениями на момент выполнения, то есть выполнит и их.
+    Запрос, пришедший после начала выполнения задачи, ставит новую задачу: Анкета могла измениться.
+
+    :param customer_id: int, id Анкеты клиента.
+    :return: boolean, True, если задача поставлена в очередь, False, если запрос объединён с уже поставленной.
+    """
+    cache = caches[MATCH_CUSTOMER_CACHE_ALIAS]
+    key = MATCH_CUSTOMER_CACHE_KEY.format(customer_id)
+    token = uuid.uuid4().hex
+    if cache.add(key, token, timeout=settings.APPLICATIONS_MATCH_CUSTOMER_COALESCE_WINDOW):
+        match_customer_task.delay(customer_id, token)
+        return True
+
+    pending_token = cache.get(key)
+    if pending_token is None:
+        # Ключ истёк или удалён задачей между add() и get()
+        return enqueue_match_customer(customer_id)
+
+    _, closed = claim_match_customer_request(pending_token, 1)
+    if closed:
+        # Задача уже начала выполнение: поколение заменяется новым
+        if cache.get(key) == pending_token:
+            cache.delete(key)
+        return enqueue_match_customer(customer_id)
+    return False
+
+
 @shared_task
-def match_customer_task(customer):
+def match_customer_task(customer, token=None):
+    """
+    :param customer: partners.Customer или его id.
+    :param token: str, поколение запросов enqueue_match_customer(), которое выполняет задача.
+    :return: dict, статистика: 'applications' -- количество созданных Заявок,
+             'coalesced' -- количество повторных запросов, объединённых с этой задачей (enqueue_match_customer()).
+    """
+    customer_id = customer.pk if isinstance(customer, Customer) else customer
+
+    # Поколение закрывается до сопоставления: запросы, пришедшие позже, ставят новую задачу
+    coalesced = 0
+    if token is not None:
+        cache = caches[MATCH_CUSTOMER_CACHE_ALIAS]
+        number, _ = claim_match_customer_request(token, MATCH_CUSTOMER_CLOSED)
+        coalesced = number - 1
+
+        key = MATCH_CUSTOMER_CACHE_KEY.format(customer_id)
+        if cache.get(key) == token:
+            cache.delete(key)
+    if coalesced:
+        logger.info('Анкета клиента %s: объединено повторных запросов на сопоставление: %s', customer_id, coalesced)
+
     if not isinstance(customer, Customer) and isinstance(customer, numbers.Number):
         try:
             customer = Customer.objects.prefetch_related(
@@ -18,23 +116,147 @@ def match_customer_task(customer):
             ).get(
                 id=customer
             )
-        except Customer.DoesNotExists:
-            return
+        except Customer.DoesNotExist:
+            return {'applications': 0, 'coalesced': coalesced}
 
+    # Для одной Анкеты подходящие Предложения находятся одним запросом к таблице поиска по скоринговому баллу
     new_applications = customer.match_with_offers()
-    Application.objects.bulk_create(new_applications)
+    return {
+        'applications': len(Application.objects.bulk_create_skip_conflicts(new_applications)),
+        'coalesced': coalesced,
+    }
+
+
+@shared_task
+def match_customers_with_offers_task(chunk_size=None, skip_unchanged=False):
+    """
+    :param chunk_size: int, количество Анкет в пачке.
+    :param skip_unchanged: boolean, по умолчанию False.
+                           Если True, то сопоставление не выполняется, когда с прошлого сопоставления
+                           не изменился набор актуальных Предложений. Изменённые Анкеты клиентов
+                           сопоставляются из очереди (drain_pending_matches_task).
+    """
+    state = get_matching_state()
+    if skip_unchanged and not is_matching_state_changed(state):
+        logger.info('Предложения и анкеты клиентов не изменились, сопоставление пропущено')
+        return
+
+    if settings.APPLICATIONS_MATCHING_SHARDS > 1:
+        match_customers_with_offers_sharded_task(chunk_size=chunk_size)
+        stats = None
+    else:
+        stats = match_customers(chunk_size=chunk_size)
+        logger.info('Сопоставление анкет клиентов завершено: %s', stats)
+        if 'skipped' in stats:
+            logger.info('Пропущено анкет клиентов, уже сопоставленных с текущими предложениями: %s', stats['skipped'])
+
+    remember_matching_state(state)
+    return stats
+
+
+@shared_task
+def drain_pending_matches_task(batch_size=None):
+    """
+    Сопоставляет Анкеты клиентов из очереди applications.PendingMatch.
+    Задачу можно запускать на нескольких воркерах одновременно.
+    """
+    stats = drain_pending_matches(batch_size=batch_size)
+    if stats['batches']:
+        logger.info('Очередь анкет клиентов на сопоставление разобрана: %s', stats)
+        for partner_id, lag in sorted(stats['lag'].items(), key=lambda item: -item[1]):
+            logger.info('Партнёр %s: отставание очереди сопоставления %.1f с', partner_id, lag)
+    return stats
 
 
 @shared_task
-def match_customers_with_offers_task():
-    new_applications = []
+def match_offer_task(offer_id):
+    try:
+        offer = Offer.objects.get(id=offer_id)
+    except Offer.DoesNotExist:
+        return
 
-    customers = Customer.objects.prefetch_related(
-        'application_set'
-    ).filter(
-        offer_matching_mode__contains=['auto']
-    )
-    for customer in customers:
-        new_applications += customer.match_with_offers()
+    applications_count = match_offer(offer)
+    logger.info('Предложение "%s": создано заявок: %s', offer, applications_count)
+    return applications_count
+
+
+@shared_task
+def enqueue_offer_matches_task(offer_id):
+    """
+    Ставит в очередь на сопоставление (applications.PendingMatch) Анкеты клиентов с режимом 'auto',
+    которым может подойти Предложение. Запускается после фиксации транзакции, в которой Предложение сохранено,
+    чтобы INSERT ... SELECT по всем подходящим Анкетам не выполнялся в транзакции запроса.
+
+    :param offer_id: int, id Предложения.
+    :return: int, количество добавленных в очередь Анкет.
+    """
+    try:
+        offer = Offer.objects.get(id=offer_id)
+    except Offer.DoesNotExist:
+        return 0
+
+    customers_count = PendingMatch.objects.enqueue_for_offer(offer)
+    logger.info('Предложение "%s": поставлено в очередь на сопоставление анкет клиентов: %s', offer, customers_count)
+    return customers_count
+
+
+@shared_task
+def rotate_offers_task(rotating_start):
+    """
+    Запускается в момент начала ротации Предложений и сразу создаёт по ним Заявки,
+    не дожидаясь периодического сопоставления. Затем планирует себя на начало ротации следующего Предложения.
+
+    :param rotating_start: str, момент начала ротации в формате ISO 8601.
+    """
+    ScoreOffers.objects.rebuild()
+    for offer in Offer.objects.filter(rotating_start=parse_datetime(rotating_start)):
+        match_offer_task(offer.pk)
+
+    schedule_next_rotation()
+
+
+@worker_ready.connect
+def schedule_rotation_on_worker_ready(**kwargs):
+    schedule_next_rotation()
+
+
+@shared_task
+def match_customers_with_offers_sharded_task(shards=None, chunk_size=None):
+    """
+    Делит Анкеты клиентов на диапазоны id и сопоставляет каждый диапазон в отдельной задаче,
+    чтобы сопоставление выполнялось параллельно на нескольких воркерах.
+    Статистику по диапазонам собирает collect_matching_stats_task.
+    """
+    shards = shards or settings.APPLICATIONS_MATCHING_SHARDS
+    pk_ranges = split_customers_pk_range(shards)
+    if not pk_ranges:
+        logger.info('Нет анкет клиентов для сопоставления')
+        return
+
+    chord(
+        match_customers_shard_task.s(pk_gte, pk_lt, chunk_size=chunk_size)
+        for pk_gte, pk_lt in pk_ranges
+    )(collect_matching_stats_task.s())
+
+    logger.info('Сопоставление анкет клиентов разбито на %s задач: %s', len(pk_ranges), pk_ranges)
+
+
+@shared_task
+def match_customers_shard_task(pk_gte, pk_lt, chunk_size=None):
+    stats = match_customers(pk_gte=pk_gte, pk_lt=pk_lt, chunk_size=chunk_size)
+    stats['shard'] = [pk_gte, pk_lt]
+    return stats
+
+
+@shared_task
+def collect_matching_stats_task(shards_stats):
+    total = {'customers': 0, 'applications': 0, 'skipped': 0}
+    for stats in shards_stats:
+        logger.info('Диапазон анкет клиентов %s: %s', stats['shard'], stats)
+        total['customers'] += stats.get('customers', 0)
+        total['applications'] += stats['applications']
+        total['skipped'] += stats.get('skipped', 0)
 
-    Application.objects.bulk_create(new_applications)
+    total['shards'] = len(shards_stats)
+    logger.info('Сопоставление анкет клиентов завершено: %s', total)
+    return total
@@ -3,12 +3,19 @@ from datetime import datetime
 from unittest import mock
 
 from dateutil.relativedelta import relativedelta
+from django.core.cache import cache, caches
 from django.test import TestCase
 from django.urls import reverse
-from rest_framework.test import APIClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
 
 from applications.models import Application
-from applications.tasks import match_customer_task
+from applications.serializers import ApplicationSerializer, ApplicationValuesSerializer
+from applications.tasks import (MATCH_CUSTOMER_CACHE_ALIAS,
+                                MATCH_CUSTOMER_CACHE_KEY,
+                                MATCH_CUSTOMER_CLOSED,
+                                claim_match_customer_request,
+                                enqueue_match_customer, match_customer_task)
 from common.test_utils import (CreateInitialDataMixin, FiltersTestMixin,
                                OrderingTestMixin)
 from lenders.models import Offer
@@ -34,6 +41,7 @@ class ApplicationsApiTestCase(CreateInitialDataMixin, FiltersTestMixin, Ordering
         client_partner.login(username=self.user1_partner.username, password='user1_partner')
 
         match_customer_task.delay = mock.MagicMock()
+        caches[MATCH_CUSTOMER_CACHE_ALIAS].clear()
 
         # Партнёр может создавать Заявки для своей Анкеты клиента во все Кредитные организации
         response = client_partner.post(
@@ -44,7 +52,7 @@ class ApplicationsApiTestCase(CreateInitialDataMixin, FiltersTestMixin, Ordering
             }
         )
         self.assertEqual(response.status_code, 201)
-        match_customer_task.delay.assert_called_once_with(customer1.pk)
+        match_customer_task.delay.assert_called_once_with(customer1.pk, mock.ANY)
         match_customer_task.delay.reset_mock()
 
         # Партнёр НЕ может создавать Заявки для чужой Анкеты клиента во все Кредитные организации
@@ -100,6 +108,102 @@ class ApplicationsApiTestCase(CreateInitialDataMixin, FiltersTestMixin, Ordering
         match_customer_task.delay.assert_not_called()
         match_customer_task.delay.reset_mock()
 
+    def test_application_create_for_all_lenders_coalesced(self):
+        customer1 = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=self.user1_partner.partner,
+        )
+        client_partner = APIClient()
+        client_partner.login(username=self.user1_partner.username, password='user1_partner')
+        caches[MATCH_CUSTOMER_CACHE_ALIAS].clear()
+
+        # Повторные запросы на сопоставление Анкеты объединяются с уже поставленной задачей
+        with mock.patch.object(match_customer_task, 'delay') as delay_mock:
+            for _ in range(3):
+                response = client_partner.post(self.api_url, {'customer_id': customer1.pk, 'lender_id': 'all'})
+                self.assertEqual(response.status_code, 201)
+        delay_mock.assert_called_once_with(customer1.pk, mock.ANY)
+        token = delay_mock.call_args[0][1]
+
+        # Ключи объединения хранятся в отдельном кэше, а не в кэше по умолчанию
+        key = MATCH_CUSTOMER_CACHE_KEY.format(customer1.pk)
+        self.assertEqual(caches[MATCH_CUSTOMER_CACHE_ALIAS].get(key), token)
+        self.assertIsNone(cache.get(key))
+
+        # Предложения для одной Анкеты ищутся в таблице поиска по скоринговому баллу, без индекса всех Предложений
+        with mock.patch.object(Customer, 'match_with_offers', return_value=[]) as match_with_offers_mock:
+            self.assertEqual(match_customer_task(customer1.pk, token), {'applications': 0, 'coalesced': 2})
+        match_with_offers_mock.assert_called_once_with()
+
+        # После начала выполнения задачи запрос ставит новую задачу
+        with mock.patch.object(match_customer_task, 'delay') as delay_mock:
+            response = client_partner.post(self.api_url, {'customer_id': customer1.pk, 'lender_id': 'all'})
+        self.assertEqual(response.status_code, 201)
+        delay_mock.assert_called_once_with(customer1.pk, mock.ANY)
+        token = delay_mock.call_args[0][1]
+
+        # Запрос, пришедший после закрытия поколения, но до удаления его ключа задачей, тоже ставит новую задачу
+        claim_match_customer_request(token, MATCH_CUSTOMER_CLOSED)
+        with mock.patch.object(match_customer_task, 'delay') as delay_mock:
+            self.assertTrue(enqueue_match_customer(customer1.pk))
+        delay_mock.assert_called_once_with(customer1.pk, mock.ANY)
+        self.assertNotEqual(delay_mock.call_args[0][1], token)
+
+    def test_application_read_sparse_fields(self):
+        customer = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=self.user1_partner.partner,
+        )
+        offer = Offer.objects.create(
+            name='Предложение', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=10, max_credit_score=20,
+            lender=self.user3_lender.lender
+        )
+        application = Application.objects.create(customer=customer, lender_offer=offer, status=Application.FUNDED)
+
+        client_lender = APIClient()
+        client_lender.login(username=self.user3_lender.username, password='user3_lender')
+
+        response = client_lender.get('{0}?fields=id,status_display'.format(self.api_url))
+        self.assertEqual(response.json()['results'], [{'id': application.pk, 'status_display': 'Выдано'}])
+
+        url = '{0}{1}/?fields=status,customer'.format(self.api_url, application.pk)
+        response = client_lender.get(url)
+        self.assertEqual(list(response.json()), ['customer', 'status'])
+        self.assertEqual(response.json()['status'], Application.FUNDED)
+
+        self.assertEqual(client_lender.get('{0}?fields=passport_number'.format(self.api_url)).status_code, 400)
+
+    def test_application_values_serializer(self):
+        customer = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=self.user1_partner.partner,
+        )
+        for status in (Application.NEW, Application.FUNDED, Application.REFUSED):
+            offer = Offer.objects.create(
+                name='Предложение', offer_type=Offer.CONSUMER_CREDIT,
+                rotating_start=datetime.now() - relativedelta(days=1),
+                rotating_end=datetime.now() + relativedelta(months=1),
+                min_credit_score=10, max_credit_score=20,
+                lender=self.user3_lender.lender
+            )
+            Application.objects.create(customer=customer, lender_offer=offer, status=status)
+
+        # Быстрая сериализация даёт тот же JSON, что и ApplicationSerializer
+        request = APIRequestFactory().get(self.api_url)
+        queryset = Application.objects.order_by('pk')
+        self.assertEqual(
+            JSONRenderer().render(ApplicationValuesSerializer(
+                queryset.values(*ApplicationValuesSerializer.get_values_fields()), context={'request': request}
+            ).data),
+            JSONRenderer().render(ApplicationSerializer(queryset, many=True, context={'request': request}).data),
+        )
+
     def test_application_create_for_certain_lender(self):
         customer1 = Customer.objects.create(
             surname='Иванов', name='Пётр', patronymic='Сергеевич',
@@ -230,7 +334,7 @@ class ApplicationsApiTestCase(CreateInitialDataMixin, FiltersTestMixin, Ordering
 
         response = client_partner.get(self.api_url)
         self.assertEqual(response.status_code, 200)
-        response_json = response.json()
+        response_json = response.json()['results']
         self.assertEqual(len(response_json), 4)
 
         customer1_url = reverse('customers_detail', kwargs={'pk': customer1.pk})
@@ -247,7 +351,7 @@ class ApplicationsApiTestCase(CreateInitialDataMixin, FiltersTestMixin, Ordering
 
         response = client_lender.get(self.api_url)
         self.assertEqual(response.status_code, 200)
-        response_json = response.json()
+        response_json = response.json()['results']
         self.assertEqual(len(response_json), 3)
 
         expexted_offer_url = reverse('offers_detail', kwargs={'pk': offer1.pk})
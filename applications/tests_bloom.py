@@ -0,0 +1,46 @@
+# encoding: utf-8
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from applications.bloom import PairBloomFilter
+
+
+class PairBloomFilterTestCase(SimpleTestCase):
+
+    def test_contains(self):
+        rng = np.random.RandomState(0)
+        customers_ids = rng.randint(1, 10 ** 6, 10000)
+        offers_ids = rng.randint(1, 10 ** 4, 10000)
+
+        bloom_filter = PairBloomFilter(len(customers_ids), error_rate=0.01, salt=1)
+        self.assertFalse(bloom_filter.contains(customers_ids, offers_ids).any())
+
+        bloom_filter.add(customers_ids, offers_ids)
+
+        # Добавленные пары находятся всегда
+        self.assertTrue(bloom_filter.contains(customers_ids, offers_ids).all())
+
+        # Доля ложных срабатываний близка к заданной
+        other_customers_ids = rng.randint(10 ** 6, 2 * 10 ** 6, 10000)
+        self.assertLess(bloom_filter.contains(other_customers_ids, offers_ids).mean(), 0.02)
+
+    def test_salt(self):
+        customers_ids = np.arange(1, 2001)
+        offers_ids = np.ones(2000, dtype=np.int64)
+        other_customers_ids = np.arange(10001, 30001)
+        other_offers_ids = np.ones(20000, dtype=np.int64)
+
+        false_positives = []
+        for salt in (1, 2):
+            bloom_filter = PairBloomFilter(len(customers_ids), error_rate=0.01, salt=salt)
+            bloom_filter.add(customers_ids, offers_ids)
+            false_positives.append(set(other_customers_ids[bloom_filter.contains(other_customers_ids, other_offers_ids)]))
+
+        # При разной соли ложные срабатывания приходятся на разные пары
+        self.assertTrue(false_positives[0])
+        self.assertNotEqual(false_positives[0], false_positives[1])
+
+        with mock.patch('applications.bloom.random.getrandbits', return_value=5):
+            self.assertEqual(PairBloomFilter(10).salt, 5)
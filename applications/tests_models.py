@@ -0,0 +1,103 @@
+# encoding: utf-8
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from applications.models import Application, CopyRowsReader
+from lenders.models import Lender, Offer
+from partners.models import Customer, Partner
+
+
+User = get_user_model()
+
+
+class ApplicationModelTestCase(TestCase):
+
+    def test_bulk_create_skip_conflicts(self):
+        user = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user, name='М-Видео')
+        lender = Lender.objects.create(name='СберБанк')
+
+        customer = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=partner, offer_matching_mode=['auto']
+        )
+
+        now = datetime.now()
+        offer1, offer2, offer3 = [
+            Offer.objects.create(
+                name='Предложение {0}'.format(i), offer_type=Offer.CONSUMER_CREDIT,
+                rotating_start=now - relativedelta(days=1), rotating_end=now + relativedelta(months=1),
+                min_credit_score=5, max_credit_score=30, lender=lender
+            )
+            for i in range(1, 4)
+        ]
+
+        existed_application = Application.objects.create(customer=customer, lender_offer=offer2)
+
+        applications = [
+            Application(customer=customer, lender_offer=offer1),
+            Application(customer=customer, lender_offer=offer2),
+            Application(customer=customer, lender_offer=offer3),
+            Application(customer=customer, lender_offer=offer3),
+        ]
+        created = Application.objects.bulk_create_skip_conflicts(applications, batch_size=2)
+
+        # Уже существующая Заявка и повтор внутри пачки пропускаются, остальные сохраняются
+        self.assertEqual(created, [applications[0], applications[2]])
+        self.assertEqual(
+            set(Application.objects.values_list('pk', flat=True)),
+            {existed_application.pk, applications[0].pk, applications[2].pk}
+        )
+        self.assertIsNotNone(applications[0].created_at)
+        self.assertEqual(applications[0].status, Application.NEW)
+        self.assertEqual(Application.objects.bulk_create_skip_conflicts([]), [])
+
+    def test_copy_skip_conflicts(self):
+        user = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user, name='М-Видео')
+        lender = Lender.objects.create(name='СберБанк')
+
+        customer = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=partner, offer_matching_mode=['auto']
+        )
+
+        now = datetime.now()
+        offer1, offer2 = [
+            Offer.objects.create(
+                name='Предложение {0}'.format(i), offer_type=Offer.CONSUMER_CREDIT,
+                rotating_start=now - relativedelta(days=1), rotating_end=now + relativedelta(months=1),
+                min_credit_score=5, max_credit_score=30, lender=lender
+            )
+            for i in range(1, 3)
+        ]
+        Application.objects.create(customer=customer, lender_offer=offer1)
+
+        inserted = Application.objects.copy_skip_conflicts([
+            (customer.pk, offer1.pk, Application.NEW, now, now),
+            (customer.pk, offer2.pk, Application.SENT, now, now),
+        ])
+        self.assertEqual(inserted, 1)
+
+        application = Application.objects.get(customer=customer, lender_offer=offer2)
+        self.assertEqual(application.status, Application.SENT)
+        self.assertEqual(application.created_at, now)
+
+        # Временная таблица очищается, повторная загрузка в той же транзакции ничего не добавляет
+        self.assertEqual(Application.objects.copy_skip_conflicts([(customer.pk, offer2.pk, 1, now, now)]), 0)
+        self.assertEqual(Application.objects.copy_skip_conflicts([]), 0)
+
+    def test_copy_rows_reader(self):
+        rows = iter([(1, None, 'a'), (2, 3, 'b')])
+        reader = CopyRowsReader(rows)
+
+        # Строки кодируются по мере чтения: вторая строка ещё не взята из итератора
+        self.assertEqual(reader.read(4), '1\t\\N')
+        self.assertEqual(list(rows), [(2, 3, 'b')])
+        self.assertEqual(reader.read(), '\ta\n')
+        self.assertEqual(reader.read(8192), '')
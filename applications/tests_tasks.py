@@ -1,12 +1,30 @@
 # encoding: utf-8
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
 from unittest import mock
 
+from dateutil.relativedelta import relativedelta
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
 
-from applications.models import Application
-from applications.tasks import match_customers_with_offers_task
+from applications.matching import get_offers_version, weighted_fair_shares
+from applications.models import Application, PendingMatch
+from applications.scheduler import get_next_rotation_start, schedule_next_rotation
+from applications.tasks import (collect_matching_stats_task,
+                                drain_pending_matches_task,
+                                enqueue_offer_matches_task,
+                                match_customers_shard_task,
+                                match_customers_with_offers_sharded_task,
+                                match_customers_with_offers_task,
+                                match_offer_task, rotate_offers_task)
+from lenders.models import Lender, Offer
+from lenders.offer_index import OfferIndex
 from partners.models import Customer, Partner
 
 
@@ -40,11 +58,632 @@ class ApplicationsTasksTestCase(TestCase):
             credit_score=25, partner=partner, offer_matching_mode=['manual']
         )
 
-        with mock.patch.object(Application.objects, 'bulk_create') as bulk_create_mock:
-            with mock.patch.object(Customer, 'match_with_offers', autospec=True) as match_with_offers_mock:
-                match_with_offers_mock.side_effect = lambda *args, **kwargs: ['fake_data']
-                match_customers_with_offers_task()
+        lender = Lender.objects.create(name='СберБанк')
+        offer1 = Offer.objects.create(
+            name='Предложение 1', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=1, max_credit_score=20, lender=lender
+        )
+        offer2 = Offer.objects.create(
+            name='Предложение 2', offer_type=Offer.MORTGAGE,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=15, max_credit_score=30, lender=lender
+        )
+        customer4 = Customer.objects.create(
+            surname='Петров', name='Иван', patronymic='Ильич',
+            birth_date='1985-01-01', phone_number='89117310606', passport_number='1901432701',
+            credit_score=18, partner=partner, offer_matching_mode=['auto']
+        )
+        Application.objects.create(customer=customer4, lender_offer=offer2)
+
+        # Подходящие Предложения ищутся один раз для каждого скорингового балла пачки
+        with mock.patch.object(OfferIndex, 'match', autospec=True, side_effect=OfferIndex.match) as match_mock:
+            stats = match_customers_with_offers_task()
+
+        self.assertEqual(sorted(call[0][1] for call in match_mock.call_args_list), [10, 18])
+        self.assertEqual(stats['applications'], 4)
+        self.assertEqual(
+            set(Application.objects.values_list('customer_id', 'lender_offer_id')),
+            {
+                (customer1.pk, offer1.pk),
+                (customer2.pk, offer1.pk), (customer2.pk, offer2.pk),
+                (customer4.pk, offer1.pk), (customer4.pk, offer2.pk),
+            }
+        )
+        self.assertFalse(Application.objects.filter(customer=customer3).exists())
+
+        # Анкеты обрабатываются пачками, Заявки каждой пачки сохраняются отдельно.
+        # Сбрасываем отметки о сопоставлении, иначе Анкеты будут пропущены
+        Application.objects.all().delete()
+        Customer.objects.update(matched_offers_version=None)
+        with mock.patch.object(Application.objects, 'bulk_create_skip_conflicts') as bulk_create_mock:
+            bulk_create_mock.side_effect = lambda applications: applications
+            stats = match_customers_with_offers_task(chunk_size=2)
+
+        self.assertEqual(stats['applications'], 5)
+        self.assertEqual(
+            [[(app.customer_id, app.lender_offer_id) for app in call[0][0]] for call in bulk_create_mock.call_args_list],
+            [
+                [(customer1.pk, offer1.pk), (customer2.pk, offer1.pk), (customer2.pk, offer2.pk)],
+                [(customer4.pk, offer1.pk), (customer4.pk, offer2.pk)],
+            ]
+        )
+
+    @override_settings(APPLICATIONS_MATCHING_ENGINE='sql')
+    def test_task_match_customers_with_offers_task_sql_engine(self):
+        user1_partner = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user1_partner, name='М-Видео')
+        lender1 = Lender.objects.create(name='СберБанк')
+        lender2 = Lender.objects.create(name='ВТБ')
+
+        customer1 = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=partner, offer_matching_mode=['auto']
+        )
+        customer2 = Customer.objects.create(
+            surname='Ульянова', name='Мария', patronymic='Алексеевна',
+            birth_date='1992-01-01', phone_number='89117310102', passport_number='1901432711',
+            credit_score=18, partner=partner, offer_matching_mode=['manual', 'auto']
+        )
+        Customer.objects.create(
+            surname='Овчинников', name='Алексей', patronymic='Александрович',
+            birth_date='1983-01-01', phone_number='89117310505', passport_number='1901432700',
+            credit_score=18, partner=partner, offer_matching_mode=['manual']
+        )
+
+        offer1 = Offer.objects.create(
+            name='Предложение 1', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=1, max_credit_score=20, lender=lender1
+        )
+        offer2 = Offer.objects.create(
+            name='Предложение 2', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=15, max_credit_score=20, lender=lender2
+        )
+        Offer.objects.create(
+            name='Предложение старое', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(months=2),
+            rotating_end=datetime.now() - relativedelta(months=1),
+            min_credit_score=1, max_credit_score=20, lender=lender2
+        )
+        Application.objects.create(customer=customer1, lender_offer=offer1)
+
+        stats = match_customers_with_offers_task()
+
+        self.assertEqual(stats['applications'], 2)
+        self.assertEqual(stats['lenders'], {lender1.pk: 1, lender2.pk: 1})
+        self.assertEqual(
+            set(Application.objects.values_list('customer_id', 'lender_offer_id')),
+            set([(customer1.pk, offer1.pk), (customer2.pk, offer1.pk), (customer2.pk, offer2.pk)])
+        )
+
+        # Повторный запуск не создаёт дубликатов
+        self.assertEqual(match_customers_with_offers_task()['applications'], 0)
+        self.assertEqual(Application.objects.count(), 3)
+
+    @override_settings(APPLICATIONS_MATCHING_ENGINE='numpy')
+    def test_task_match_customers_with_offers_task_numpy_engine(self):
+        user1_partner = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user1_partner, name='М-Видео')
+        lender1 = Lender.objects.create(name='СберБанк')
+        lender2 = Lender.objects.create(name='ВТБ')
+
+        customer1 = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=partner, offer_matching_mode=['auto']
+        )
+        customer2 = Customer.objects.create(
+            surname='Ульянова', name='Мария', patronymic='Алексеевна',
+            birth_date='1992-01-01', phone_number='89117310102', passport_number='1901432711',
+            credit_score=18, partner=partner, offer_matching_mode=['manual', 'auto']
+        )
+        Customer.objects.create(
+            surname='Овчинников', name='Алексей', patronymic='Александрович',
+            birth_date='1983-01-01', phone_number='89117310505', passport_number='1901432700',
+            credit_score=18, partner=partner, offer_matching_mode=['manual']
+        )
+
+        offer1 = Offer.objects.create(
+            name='Предложение 1', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=1, max_credit_score=20, lender=lender1
+        )
+        offer2 = Offer.objects.create(
+            name='Предложение 2', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=15, max_credit_score=20, lender=lender2
+        )
+        Offer.objects.create(
+            name='Предложение старое', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(months=2),
+            rotating_end=datetime.now() - relativedelta(months=1),
+            min_credit_score=1, max_credit_score=20, lender=lender2
+        )
+        Application.objects.create(customer=customer1, lender_offer=offer1)
+
+        stats = match_customers_with_offers_task(chunk_size=1)
+
+        self.assertEqual(stats['customers'], 2)
+        self.assertEqual(stats['applications'], 2)
+        self.assertEqual(
+            set(Application.objects.values_list('customer_id', 'lender_offer_id')),
+            set([(customer1.pk, offer1.pk), (customer2.pk, offer1.pk), (customer2.pk, offer2.pk)])
+        )
+
+        # Повторный запуск не создаёт дубликатов
+        self.assertEqual(match_customers_with_offers_task()['applications'], 0)
+
+        # Заявки загружаются через COPY
+        customer4 = Customer.objects.create(
+            surname='Петрова', name='Анна', patronymic='Ивановна',
+            birth_date='1985-01-01', phone_number='89117310606', passport_number='1901432701',
+            credit_score=16, partner=partner, offer_matching_mode=['auto']
+        )
+        with override_settings(APPLICATIONS_MATCHING_WRITER='copy'):
+            self.assertEqual(match_customers_with_offers_task()['applications'], 2)
+
+        self.assertEqual(
+            set(Application.objects.filter(customer=customer4).values_list('lender_offer_id', 'status')),
+            set([(offer1.pk, Application.NEW), (offer2.pk, Application.NEW)])
+        )
+
+        # Предложения берутся из снимка в памяти
+        customer5 = Customer.objects.create(
+            surname='Сидоров', name='Иван', patronymic='Петрович',
+            birth_date='1987-01-01', phone_number='89117310707', passport_number='1901432702',
+            credit_score=5, partner=partner, offer_matching_mode=['auto']
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with override_settings(APPLICATIONS_OFFER_SNAPSHOT_PATH=os.path.join(tmp_dir, 'offers.bin')):
+                self.assertEqual(match_customers_with_offers_task()['applications'], 1)
+
+        self.assertEqual(list(Application.objects.filter(customer=customer5).values_list('lender_offer_id')), [
+            (offer1.pk,)
+        ])
+
+    @override_settings(APPLICATIONS_MATCHING_ENGINE='bloom')
+    @mock.patch('applications.bloom.random.getrandbits', return_value=1)     # Фиксированная соль фильтра
+    def test_task_match_customers_with_offers_task_bloom_engine(self, getrandbits_mock):
+        user1_partner = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user1_partner, name='М-Видео')
+        lender = Lender.objects.create(name='СберБанк')
+
+        customer1, customer2 = [
+            Customer.objects.create(
+                surname='Иванов', name='Пётр', patronymic='Сергеевич',
+                birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+                credit_score=credit_score, partner=partner, offer_matching_mode=['auto']
+            )
+            for credit_score in (10, 18)
+        ]
+        offer_data = dict(
+            offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            lender=lender,
+        )
+        offer1 = Offer.objects.create(name='Предложение 1', min_credit_score=1, max_credit_score=20, **offer_data)
+        offer2 = Offer.objects.create(name='Предложение 2', min_credit_score=15, max_credit_score=20, **offer_data)
+        Application.objects.create(customer=customer1, lender_offer=offer1)
+
+        stats = match_customers_with_offers_task()
+        self.assertEqual((stats['customers'], stats['applications'], stats['dropped']), (2, 2, 1))
+        self.assertEqual(
+            set(Application.objects.values_list('customer_id', 'lender_offer_id')),
+            set([(customer1.pk, offer1.pk), (customer2.pk, offer1.pk), (customer2.pk, offer2.pk)])
+        )
+
+        # Анкеты не отмечаются версией Предложений и проверяются при каждом прогоне
+        stats = match_customers_with_offers_task()
+        self.assertEqual((stats['customers'], stats['applications'], stats['dropped']), (2, 0, 3))
+        self.assertNotIn('skipped', stats)
+
+    @override_settings(APPLICATIONS_MATCHING_ENGINE='numpy')
+    def test_task_match_customers_with_offers_task_skip_matched(self):
+        user1_partner = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user1_partner, name='М-Видео')
+        lender = Lender.objects.create(name='СберБанк')
+
+        customer1, customer2 = [
+            Customer.objects.create(
+                surname='Иванов', name='Пётр', patronymic='Сергеевич',
+                birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+                credit_score=credit_score, partner=partner, offer_matching_mode=['auto']
+            )
+            for credit_score in (10, 30)
+        ]
+        offer_data = dict(
+            offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            lender=lender,
+        )
+        Offer.objects.create(name='Предложение 1', min_credit_score=1, max_credit_score=20, **offer_data)
+
+        stats = match_customers_with_offers_task()
+        self.assertEqual((stats['customers'], stats['applications'], stats['skipped']), (2, 1, 0))
+
+        # Набор Предложений не изменился, все Анкеты пропускаются, в том числе Анкета без подходящих Предложений
+        with self.assertLogs('applications.tasks', level='INFO') as logs:
+            stats = match_customers_with_offers_task()
+        self.assertEqual((stats['customers'], stats['applications'], stats['skipped']), (0, 0, 2))
+        self.assertIn('уже сопоставленных с текущими предложениями: 2', logs.output[-1])
+
+        # Изменённая Анкета сопоставляется заново
+        customer2.credit_score = 15
+        customer2.save()
+        stats = match_customers_with_offers_task()
+        self.assertEqual((stats['customers'], stats['applications'], stats['skipped']), (1, 1, 1))
+
+        # Новое Предложение меняет версию набора Предложений, сопоставляются все Анкеты
+        Offer.objects.create(name='Предложение 2', min_credit_score=25, max_credit_score=40, **offer_data)
+        stats = match_customers_with_offers_task()
+        self.assertEqual((stats['customers'], stats['applications'], stats['skipped']), (2, 0, 0))
+        self.assertEqual(Application.objects.count(), 2)
+
+    def test_get_offers_version(self):
+        now = datetime(2026, 1, 1, 12, 0)
+        lender = Lender.objects.create(name='СберБанк')
+        offer_data = dict(offer_type=Offer.CONSUMER_CREDIT, min_credit_score=1, max_credit_score=20, lender=lender)
+        Offer.objects.create(
+            name='Предложение 1', rotating_start=now - relativedelta(days=1), rotating_end=now + relativedelta(hours=1),
+            **offer_data
+        )
+        Offer.objects.create(
+            name='Предложение 2', rotating_start=now + relativedelta(hours=2), rotating_end=now + relativedelta(days=1),
+            **offer_data
+        )
+
+        version = get_offers_version(now)
+        self.assertEqual(get_offers_version(now + relativedelta(minutes=30)), version)
+
+        # Одно Предложение вышло из ротации, другое вошло: количество и updated_at те же, а версия другая
+        self.assertNotEqual(get_offers_version(now + relativedelta(hours=3)), version)
+
+    def test_task_match_customers_with_offers_sharded_task(self):
+        user1_partner = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user1_partner, name='М-Видео')
+        lender = Lender.objects.create(name='СберБанк')
+
+        customers = [
+            Customer.objects.create(
+                surname='Иванов', name='Пётр', patronymic='Сергеевич',
+                birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+                credit_score=10, partner=partner, offer_matching_mode=['auto']
+            )
+            for _ in range(5)
+        ]
+        offer = Offer.objects.create(
+            name='Предложение 1', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=1, max_credit_score=20, lender=lender
+        )
+
+        # Диапазоны id Анкет покрывают все Анкеты и не пересекаются
+        with mock.patch('applications.tasks.chord') as chord_mock:
+            match_customers_with_offers_sharded_task(shards=2)
+
+        shard_signatures = list(chord_mock.call_args[0][0])
+        pk_ranges = [tuple(signature.args) for signature in shard_signatures]
+        self.assertEqual(
+            pk_ranges,
+            [(customers[0].pk, customers[3].pk), (customers[3].pk, customers[4].pk + 1)]
+        )
+        chord_mock.return_value.assert_called_once_with(collect_matching_stats_task.s())
+
+        # Каждая задача сопоставляет только Анкеты из своего диапазона
+        shards_stats = [match_customers_shard_task(*pk_range) for pk_range in pk_ranges]
+        self.assertEqual([stats['customers'] for stats in shards_stats], [3, 2])
+        self.assertEqual(
+            set(Application.objects.values_list('customer_id', 'lender_offer_id')),
+            set([(customer.pk, offer.pk) for customer in customers])
+        )
+
+        total = collect_matching_stats_task(shards_stats)
+        self.assertEqual(total, {'customers': 5, 'applications': 5, 'skipped': 0, 'shards': 2})
+
+
+class RotationSchedulerTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.lender = Lender.objects.create(name='СберБанк')
+
+    def create_offer(self, rotating_start, rotating_end):
+        return Offer.objects.create(
+            name='Предложение', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=rotating_start, rotating_end=rotating_end,
+            min_credit_score=1, max_credit_score=20, lender=self.lender
+        )
+
+    def test_schedule_next_rotation(self):
+        now = datetime.now()
+        self.assertIsNone(get_next_rotation_start(now))
+
+        self.create_offer(now - relativedelta(days=1), now + relativedelta(months=1))
+        offer = self.create_offer(now + relativedelta(hours=2), now + relativedelta(months=1))
+        self.create_offer(now + relativedelta(days=2), now + relativedelta(months=1))
+
+        self.assertEqual(get_next_rotation_start(now), offer.rotating_start)
+
+        with mock.patch.object(rotate_offers_task, 'apply_async') as apply_async_mock:
+            self.assertEqual(schedule_next_rotation(now), offer.rotating_start)
+            # Задача на тот же момент не ставится повторно
+            self.assertEqual(schedule_next_rotation(now), offer.rotating_start)
+
+        apply_async_mock.assert_called_once_with((offer.rotating_start.isoformat(),), countdown=2 * 60 * 60)
+
+    def test_skip_unchanged(self):
+        now = datetime.now()
+        offer = self.create_offer(now - relativedelta(days=1), now + relativedelta(months=1))
+
+        with mock.patch('applications.tasks.match_customers') as match_customers_mock:
+            match_customers_mock.return_value = {}
+
+            match_customers_with_offers_task(skip_unchanged=True)
+            self.assertEqual(match_customers_mock.call_count, 1)
+
+            # Ничего не изменилось -- сопоставление пропускается
+            match_customers_with_offers_task(skip_unchanged=True)
+            self.assertEqual(match_customers_mock.call_count, 1)
+
+            # Без skip_unchanged сопоставление выполняется всегда
+            match_customers_with_offers_task()
+            self.assertEqual(match_customers_mock.call_count, 2)
+
+            # Предложение закончило ротацию -- набор актуальных Предложений изменился
+            Offer.objects.filter(pk=offer.pk).update(rotating_end=now - relativedelta(minutes=1))
+            match_customers_with_offers_task(skip_unchanged=True)
+            self.assertEqual(match_customers_mock.call_count, 3)
+
+            # Изменилось Предложение
+            offer.save()
+            match_customers_with_offers_task(skip_unchanged=True)
+            self.assertEqual(match_customers_mock.call_count, 4)
+
+            # Изменённая Анкета клиента сопоставляется из очереди, периодическое сопоставление пропускается
+            user = User.objects.create_user(username='Partner 1', password='user1_partner')
+            customer = Customer.objects.create(
+                surname='Иванов', name='Пётр', patronymic='Сергеевич',
+                birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+                credit_score=10, partner=Partner.objects.create(user=user, name='М-Видео'),
+                offer_matching_mode=['auto']
+            )
+            self.assertTrue(PendingMatch.objects.filter(customer=customer).exists())
+            match_customers_with_offers_task(skip_unchanged=True)
+            self.assertEqual(match_customers_mock.call_count, 4)
+
+
+class OfferMatchingTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        user1_partner = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user1_partner, name='М-Видео')
+        self.partner = partner
+        self.lender = Lender.objects.create(name='СберБанк')
+
+        customer_data = dict(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            partner=partner,
+        )
+        self.customer1 = Customer.objects.create(credit_score=10, offer_matching_mode=['auto'], **customer_data)
+        self.customer2 = Customer.objects.create(credit_score=12, offer_matching_mode=['auto'], **customer_data)
+        Customer.objects.create(credit_score=30, offer_matching_mode=['auto'], **customer_data)
+        Customer.objects.create(credit_score=10, offer_matching_mode=['manual'], **customer_data)
+
+    def create_offer(self, rotating_start, rotating_end):
+        return Offer.objects.create(
+            name='Предложение', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=rotating_start, rotating_end=rotating_end,
+            min_credit_score=5, max_credit_score=20, lender=self.lender
+        )
+
+    def test_match_offer_task(self):
+        now = datetime.now()
+        offer = self.create_offer(now - relativedelta(days=1), now + relativedelta(months=1))
+        Application.objects.create(customer=self.customer2, lender_offer=offer)
+
+        self.assertEqual(match_offer_task(offer.pk), 1)
+        self.assertEqual(
+            set(Application.objects.values_list('customer_id', flat=True)),
+            set([self.customer1.pk, self.customer2.pk])
+        )
+        self.assertEqual(match_offer_task(offer.pk), 0)
+
+        # По неактуальному Предложению Заявки не создаются
+        old_offer = self.create_offer(now - relativedelta(months=2), now - relativedelta(months=1))
+        self.assertEqual(match_offer_task(old_offer.pk), 0)
+        self.assertFalse(Application.objects.filter(lender_offer=old_offer).exists())
+
+    def test_rotate_offers_task(self):
+        rotating_start = datetime.now() - relativedelta(seconds=1)
+        offer = self.create_offer(rotating_start, rotating_start + relativedelta(months=1))
+        other_offer = self.create_offer(rotating_start - relativedelta(days=1), rotating_start + relativedelta(months=1))
+
+        with mock.patch('applications.tasks.schedule_next_rotation') as schedule_next_rotation_mock:
+            rotate_offers_task(rotating_start.isoformat())
+
+        schedule_next_rotation_mock.assert_called_once_with()
+        self.assertEqual(Application.objects.filter(lender_offer=offer).count(), 2)
+        self.assertEqual(Application.objects.filter(lender_offer=other_offer).count(), 0)
+
+    def test_match_offer_on_save(self):
+        now = datetime.now()
+        PendingMatch.objects.all().delete()
+
+        # Очередь пополняется задачей после фиксации транзакции, а не в транзакции сохранения Предложения
+        with mock.patch.object(enqueue_offer_matches_task, 'delay') as delay_mock, \
+                mock.patch('applications.signals.transaction') as transaction_mock:
+
+            def enqueued_offers():
+                callbacks = [call[0][0] for call in transaction_mock.on_commit.call_args_list]
+                return [callback.args for callback in callbacks if getattr(callback, 'func', None) is delay_mock]
+
+            # Предложение, ротация которого ещё не началась, не ставит Анкеты в очередь
+            self.create_offer(now + relativedelta(days=1), now + relativedelta(months=1))
+            self.assertEqual(enqueued_offers(), [])
+
+            offer = self.create_offer(now - relativedelta(days=1), now + relativedelta(months=1))
+            self.assertEqual(enqueued_offers(), [(offer.pk,)])
+            self.assertFalse(PendingMatch.objects.exists())
+
+            # Изменение полей, не влияющих на подбор Анкет, не ставит их в очередь
+            offer.name = 'Новое название'
+            offer.save()
+            offer.save(update_fields=['name'])
+            self.assertEqual(enqueued_offers(), [(offer.pk,)])
+
+            offer.max_credit_score = 25
+            offer.save()
+            self.assertEqual(enqueued_offers(), [(offer.pk,), (offer.pk,)])
+
+        self.assertEqual(enqueue_offer_matches_task(offer.pk), 2)
+        self.assertEqual(
+            set(PendingMatch.objects.values_list('customer_id', flat=True)),
+            set([self.customer1.pk, self.customer2.pk])
+        )
+
+        stats = drain_pending_matches_task()
+        self.assertEqual(stats, {'customers': 2, 'applications': 2, 'batches': 1, 'lag': mock.ANY})
+        self.assertEqual(list(stats['lag']), [self.partner.pk])
+        self.assertEqual(Application.objects.filter(lender_offer=offer).count(), 2)
+        self.assertFalse(PendingMatch.objects.exists())
+
+    def test_drain_pending_matches_task(self):
+        now = datetime.now()
+        offer = self.create_offer(now - relativedelta(days=1), now + relativedelta(months=1))
+        PendingMatch.objects.all().delete()
+
+        # Новые и изменённые Анкеты с режимом 'auto' ставятся в очередь при сохранении
+        self.customer1.save()
+        self.customer2.save()
+        manual_customer = Customer.objects.get(offer_matching_mode=['manual'])
+        manual_customer.save()
+        self.assertEqual(
+            set(PendingMatch.objects.values_list('customer_id', flat=True)),
+            set([self.customer1.pk, self.customer2.pk])
+        )
+        self.assertEqual(PendingMatch.objects.enqueue([self.customer1.pk]), 0)
+
+        # После постановки в очередь у Анкеты сменился режим, она удаляется из очереди без сопоставления
+        Customer.objects.filter(pk=self.customer2.pk).update(offer_matching_mode=['manual'])
+
+        # Нулевой вес, сохранённый в обход валидации, не мешает разбору очереди
+        Partner.objects.update(matching_weight=0)
+
+        stats = drain_pending_matches_task(batch_size=1)
+        self.assertEqual(stats, {'customers': 1, 'applications': 1, 'batches': 2, 'lag': mock.ANY})
+        self.assertEqual(list(Application.objects.values_list('customer_id', 'lender_offer_id')), [
+            (self.customer1.pk, offer.pk)
+        ])
+        self.assertFalse(PendingMatch.objects.exists())
+        self.assertEqual(drain_pending_matches_task()['batches'], 0)
+
+    def test_weighted_fair_shares(self):
+        # Места делятся пропорционально весам
+        self.assertEqual(weighted_fair_shares({1: 100, 2: 100}, {1: 3, 2: 1}, 8), {1: 6, 2: 2})
+        # Места, которые не нужны Партнёру, достаются остальным
+        self.assertEqual(weighted_fair_shares({1: 100, 2: 1, 3: 100}, {}, 9), {1: 4, 2: 1, 3: 4})
+        # Остаток от деления по весам достаётся Партнёрам в порядке приоритета
+        self.assertEqual(weighted_fair_shares({1: 100, 2: 100, 3: 100}, {}, 4, priority=[3, 2]), {1: 1, 2: 1, 3: 2})
+        self.assertEqual(weighted_fair_shares({1: 2, 2: 3}, {}, 100), {1: 2, 2: 3})
+        self.assertEqual(weighted_fair_shares({}, {}, 100), {})
+        # Нулевой вес считается равным 1
+        self.assertEqual(weighted_fair_shares({1: 100, 2: 100}, {1: 0, 2: 0}, 4), {1: 2, 2: 2})
+        self.assertEqual(weighted_fair_shares({1: 100, 2: 100}, {1: 0, 2: 3}, 4), {1: 1, 2: 3})
+
+    def test_drain_pending_matches_fairness(self):
+        now = datetime.now()
+        self.create_offer(now - relativedelta(days=1), now + relativedelta(months=1))
+        PendingMatch.objects.all().delete()
+
+        user2_partner = User.objects.create_user(username='Partner 2', password='user2_partner')
+        other_partner = Partner.objects.create(user=user2_partner, name='Эльдорадо', matching_weight=2)
+        other_customers = [
+            Customer.objects.create(
+                surname='Петров', name='Иван', patronymic='Сергеевич',
+                birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+                credit_score=15, offer_matching_mode=['auto'], partner=other_partner,
+            )
+            for _ in range(4)
+        ]
+
+        # Анкеты первого Партнёра стоят в очереди раньше, но не занимают всю пачку
+        PendingMatch.objects.all().delete()
+        PendingMatch.objects.enqueue([self.customer1.pk, self.customer2.pk])
+        PendingMatch.objects.filter(partner=self.partner).update(created_at=now - relativedelta(minutes=5))
+        PendingMatch.objects.enqueue([customer.pk for customer in other_customers])
+
+        with mock.patch('applications.matching.match_customers_chunk', return_value=0) as match_chunk_mock:
+            stats = drain_pending_matches_task(batch_size=3)
+
+        self.assertEqual(stats['batches'], 2)
+        self.assertEqual(set(stats['lag']), set([self.partner.pk, other_partner.pk]))
+        self.assertGreaterEqual(stats['lag'][self.partner.pk], 300)
+
+        # В первой пачке Партнёры получают места по весам 1:2
+        first_batch = match_chunk_mock.call_args_list[0][0][0]
+        self.assertEqual(
+            sorted(customer.partner_id for customer in first_batch),
+            sorted([self.partner.pk, other_partner.pk, other_partner.pk])
+        )
+        self.assertFalse(PendingMatch.objects.exists())
+
+
+class PendingMatchConcurrencyTestCase(TransactionTestCase):
+
+    def test_drain_pending_matches_requeues_customer_saved_during_match(self):
+        user1_partner = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user1_partner, name='М-Видео')
+        customer = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=partner, offer_matching_mode=['auto']
+        )
+        self.assertTrue(PendingMatch.objects.filter(customer=customer).exists())
+
+        def save_customer():
+            try:
+                Customer.objects.get(pk=customer.pk).save()
+            finally:
+                connection.close()
+
+        matched = []
+        thread = threading.Thread(target=save_customer)
+
+        def match_chunk(customers, offer_index):
+            matched.extend(customers)
+            if thread.ident is None:
+                # Анкета сохраняется в другом соединении, пока её пачка сопоставляется
+                thread.start()
+                with connection.cursor() as cursor:
+                    for _ in range(100):
+                        cursor.execute(
+                            "SELECT COUNT(*) FROM pg_stat_activity "
+                            "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                        )
+                        if cursor.fetchone()[0]:
+                            break
+                        time.sleep(0.05)
+            return 0
+
+        with mock.patch('applications.matching.match_customers_chunk', side_effect=match_chunk):
+            drain_pending_matches_task()
+            thread.join()
 
-        self.assertEqual(match_with_offers_mock.call_count, 2)
-        match_with_offers_mock.assert_has_calls([mock.call(customer1), mock.call(customer2)])
-        bulk_create_mock.assert_called_once_with(['fake_data', 'fake_data'])
+        # Изменение не теряется: Анкета либо сопоставлена повторно, либо снова стоит в очереди
+        requeued = PendingMatch.objects.filter(customer=customer).exists()
+        self.assertTrue(len(matched) == 2 or requeued)
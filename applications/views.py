@@ -7,7 +7,10 @@ from accounts.utils import is_lender, is_partner
 from applications.models import Application
 from applications.serializers import (ApplicationSerializer,
                                       ApplicationToAllLendersSerializer,
-                                      ApplicationToCertainLenderSerializer)
+                                      ApplicationToCertainLenderSerializer,
+                                      ApplicationValuesSerializer)
+from common.mixins import ConditionalGetMixin, SparseFieldsetsMixin
+from common.pagination import KeysetCursorPagination
 
 
 class ApplicationsFilter(django_filters.FilterSet):
@@ -21,7 +24,9 @@ class ApplicationsFilter(django_filters.FilterSet):
         }
 
 
-class ApplicationsView(mixins.ListModelMixin,
+class ApplicationsView(ConditionalGetMixin,
+                       SparseFieldsetsMixin,
+                       mixins.ListModelMixin,
                        mixins.CreateModelMixin,
                        generics.GenericAPIView):
 
@@ -31,8 +36,11 @@ class ApplicationsView(mixins.ListModelMixin,
     )
     filterset_class = ApplicationsFilter
     ordering_fields = ('created_at', 'updated_at',)
+    ordering = ('-created_at',)
+    pagination_class = KeysetCursorPagination
 
     serializer_class = ApplicationSerializer
+    sparse_fields_sources = {'status_display': ('status',)}
     serializer_class_create_for_certain = ApplicationToCertainLenderSerializer
     serializer_class_create_for_all = ApplicationToAllLendersSerializer
 
@@ -65,6 +73,27 @@ class ApplicationsView(mixins.ListModelMixin,
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
+    def get_list_queryset(self):
+        # Список сериализуется из строк values() без создания объектов моделей (ApplicationValuesSerializer),
+        # результат совпадает с ApplicationSerializer
+        values_fields = ApplicationValuesSerializer.get_values_fields(self.get_sparse_fields())
+
+        # Постраничному выводу по курсору нужны поля сортировки, версии списка -- поля last_modified_fields
+        extra_fields = ('id',) + self.ordering_fields + self.last_modified_fields
+        values_fields += [field for field in extra_fields if field not in values_fields]
+        return self.filter_queryset(self.get_queryset()).values(*values_fields)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_list_queryset()
+
+        page = self.paginate_queryset(queryset)
+        serializer = ApplicationValuesSerializer(
+            queryset if page is None else page, context=self.get_serializer_context(), fields=self.get_sparse_fields()
+        )
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -101,11 +130,14 @@ class ApplicationsView(mixins.ListModelMixin,
             return read_serializer.data
 
 
-class ApplicationsDetailView(mixins.RetrieveModelMixin,
+class ApplicationsDetailView(ConditionalGetMixin,
+                             SparseFieldsetsMixin,
+                             mixins.RetrieveModelMixin,
                              mixins.UpdateModelMixin,
                              generics.GenericAPIView):
 
     serializer_class = ApplicationSerializer
+    sparse_fields_sources = {'status_display': ('status',)}
 
     def get_queryset(self):
         apps_qs = Application.objects.select_related(
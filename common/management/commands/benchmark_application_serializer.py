@@ -0,0 +1,103 @@
+# encoding: utf-8
+import time
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from applications.models import Application
+from applications.serializers import ApplicationSerializer, ApplicationValuesSerializer
+from lenders.models import Lender, Offer
+from partners.models import Customer, Partner
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает сериализацию списка Заявок через ApplicationSerializer и ApplicationValuesSerializer '
+        'и проверяет, что JSON совпадает. Тестовые Заявки создаются во временной транзакции.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--applications', type=int, default=10000, help='Количество тестовых Заявок')
+        parser.add_argument('--repeat', type=int, default=3, help='Количество замеров, выводится лучший')
+        parser.add_argument('--host', default='localhost', help='Хост в ссылках на Анкеты и Предложения')
+
+    def handle(self, *args, **options):
+        request = APIRequestFactory().get('/api/applications/', HTTP_HOST=options['host'])
+        context = {'request': request}
+
+        with transaction.atomic():
+            ids = self.create_applications(options['applications'])
+            queryset = Application.objects.filter(pk__in=ids).order_by('-created_at', '-id')
+
+            serializations = (
+                ('ApplicationSerializer', lambda: ApplicationSerializer(
+                    queryset.select_related('customer', 'lender_offer'), many=True, context=context
+                ).data),
+                ('ApplicationValuesSerializer', lambda: ApplicationValuesSerializer(
+                    queryset.values(*ApplicationValuesSerializer.get_values_fields()), context=context
+                ).data),
+            )
+
+            outputs = []
+            for title, serialize in serializations:
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    output = JSONRenderer().render(serialize())
+                    timings.append(time.perf_counter() - started)
+                outputs.append(output)
+                self.stdout.write('{0}: {1:.3f} с на {2} заявок (запрос, сериализация и JSON)'.format(
+                    title, min(timings), len(ids)
+                ))
+
+            # Тестовые Заявки не сохраняются
+            transaction.set_rollback(True)
+
+        if outputs[0] != outputs[1]:
+            raise CommandError('JSON сериализаторов различается')
+        self.stdout.write(self.style.SUCCESS('JSON совпадает побайтно ({0} байт)'.format(len(outputs[0]))))
+
+    def create_applications(self, count):
+        """
+        Создаёт count Заявок: каждая из Анкет клиентов подаётся на каждое из Предложений.
+
+        :return: list of int, id созданных Заявок.
+        """
+        side = int(count ** 0.5) + 1
+        now = datetime.now()
+
+        user = User.objects.create_user(username='benchmark_application_serializer')
+        partner = Partner.objects.create(user=user, name='Тестовый партнёр')
+        lender = Lender.objects.create(name='Тестовая кредитная организация')
+
+        customers = Customer.objects.bulk_create([
+            Customer(
+                surname='Иванов', name='Пётр', patronymic='Сергеевич',
+                birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+                credit_score=10, partner=partner,
+            )
+            for _ in range(side)
+        ])
+        offers = Offer.objects.bulk_create([
+            Offer(
+                name='Предложение {0}'.format(i), offer_type=Offer.CONSUMER_CREDIT,
+                rotating_start=now - relativedelta(days=1), rotating_end=now + relativedelta(months=1),
+                min_credit_score=0, max_credit_score=100, lender=lender,
+            )
+            for i in range(side)
+        ])
+
+        statuses = [status for status, _ in Application.STATUSES]
+        applications = [
+            Application(customer=customer, lender_offer=offer, status=statuses[i % len(statuses)])
+            for i, (customer, offer) in enumerate((customer, offer) for customer in customers for offer in offers)
+        ][:count]
+        return [application.pk for application in Application.objects.bulk_create(applications)]
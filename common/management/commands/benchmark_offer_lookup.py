@@ -0,0 +1,74 @@
+# encoding: utf-8
+import random
+import time
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from lenders.models import Lender, Offer
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск подходящих Предложений по отдельным btree-индексированным полям '
+        'и по range-полям с GiST-индексом. Тестовые Предложения создаются во временной транзакции.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offers', type=int, default=10000, help='Количество тестовых Предложений')
+        parser.add_argument('--queries', type=int, default=200, help='Количество запросов для замера времени')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.create_offers(options['offers'])
+
+            now = datetime.now()
+            lookups = (
+                ('btree (min/max_credit_score, rotating_start/end)', lambda score: Offer.objects.filter(
+                    min_credit_score__lte=score,
+                    max_credit_score__gte=score,
+                    rotating_start__lte=now,
+                    rotating_end__gte=now
+                )),
+                ('GiST (credit_score_range, rotating_range)', lambda score: Offer.objects.active(
+                    now
+                ).for_credit_score(score)),
+            )
+
+            scores = [random.randint(0, 1000) for _ in range(options['queries'])]
+            for title, get_queryset in lookups:
+                self.stdout.write(self.style.MIGRATE_HEADING(title))
+                self.stdout.write(get_queryset(500).explain(analyze=True))
+
+                started = time.perf_counter()
+                for score in scores:
+                    list(get_queryset(score).values_list('pk', flat=True))
+                elapsed = time.perf_counter() - started
+
+                self.stdout.write('Среднее время запроса: {0:.3f} мс\n'.format(elapsed / len(scores) * 1000))
+
+            # Тестовые Предложения не сохраняются
+            transaction.set_rollback(True)
+
+    def create_offers(self, count):
+        lender = Lender.objects.create(name='Тестовая кредитная организация')
+        now = datetime.now()
+
+        offers = []
+        for i in range(count):
+            min_credit_score = random.randint(0, 1000)
+            rotating_start = now + relativedelta(days=random.randint(-60, 30))
+            offers.append(Offer(
+                name='Предложение {0}'.format(i), offer_type=Offer.CONSUMER_CREDIT,
+                rotating_start=rotating_start,
+                rotating_end=rotating_start + relativedelta(days=random.randint(1, 60)),
+                min_credit_score=min_credit_score,
+                max_credit_score=min_credit_score + random.randint(0, 100),
+                lender=lender,
+            ))
+        Offer.objects.bulk_create(offers)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE {0}'.format(Offer._meta.db_table))
@@ -0,0 +1,70 @@
+# encoding: utf-8
+import csv
+import sys
+from datetime import datetime
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from applications.models import Application
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает Заявки из CSV-файла со столбцами customer_id,lender_offer_id[,status] через COPY FROM STDIN. '
+        'Уже существующие Заявки пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к CSV-файлу или "-" для чтения из stdin')
+        parser.add_argument('--batch-size', type=int, default=100000, help='Количество строк, загружаемых за один COPY')
+        parser.add_argument('--skip-header', action='store_true', help='Пропустить первую строку файла')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            self.load(sys.stdin, options)
+        else:
+            with open(options['path'], newline='') as f:
+                self.load(f, options)
+
+    def load(self, f, options):
+        reader = csv.reader(f)
+        if options['skip_header']:
+            next(reader, None)
+
+        stats = {'rows': 0, 'inserted': 0}
+        now = datetime.now()
+        while True:
+            rows_count = stats['rows']
+
+            # Строки пачки разбираются по мере чтения их COPY, пачка целиком в памяти не собирается
+            stats['inserted'] += Application.objects.copy_skip_conflicts(
+                self.parse_batch(reader, options['batch_size'], now, stats)
+            )
+            if stats['rows'] == rows_count:
+                break
+            self.stdout.write('Обработано строк: {rows}, создано заявок: {inserted}'.format(**stats))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Загрузка завершена. Создано заявок: {0}, пропущено строк: {1} '
+            '(заявка уже существует, либо анкета клиента или предложение не найдены)'.format(
+                stats['inserted'], stats['rows'] - stats['inserted']
+            )
+        ))
+
+    def parse_batch(self, reader, batch_size, now, stats):
+        for row in islice(reader, batch_size):
+            stats['rows'] += 1
+            yield self.parse_row(row, reader.line_num, now)
+
+    def parse_row(self, row, line_num, now):
+        try:
+            customer_id, lender_offer_id = int(row[0]), int(row[1])
+            status = int(row[2]) if len(row) > 2 and row[2] else Application.NEW
+        except (IndexError, ValueError):
+            raise CommandError('Некорректная строка {0}: {1}'.format(line_num, row))
+
+        if status not in dict(Application.STATUSES):
+            raise CommandError('Некорректный статус в строке {0}: {1}'.format(line_num, status))
+
+        return customer_id, lender_offer_id, status, now, now
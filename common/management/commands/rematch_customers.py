@@ -0,0 +1,179 @@
+# encoding: utf-8
+import json
+import math
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
+
+from applications.matching import get_auto_customers, match_customers
+
+
+def rematch_range(pk_gte, pk_lt, chunk_size, skip_matched, rate):
+    """
+    Сопоставляет Анкеты клиентов из диапазона id [pk_gte, pk_lt) в процессе пула.
+    Предложения, версия их набора и фильтр существующих Заявок строятся один раз на весь диапазон.
+    Если задан rate, то после каждой пачки процесс ждёт, чтобы его скорость не превышала rate Анкет в секунду.
+    Так нагрузка на БД распределяется равномерно, а не всплесками на каждый диапазон.
+
+    :return: (pk_gte, pk_lt, dict статистики сопоставления)
+    """
+    if not rate:
+        return pk_gte, pk_lt, match_customers(
+            pk_gte=pk_gte, pk_lt=pk_lt, chunk_size=chunk_size, skip_matched=skip_matched
+        )
+
+    started = time.monotonic()
+    matched = 0
+
+    def throttle(customers_count):
+        nonlocal matched
+        matched += customers_count
+        time.sleep(max(0, matched / rate - (time.monotonic() - started)))
+
+    if settings.APPLICATIONS_MATCHING_ENGINE != 'sql':
+        return pk_gte, pk_lt, match_customers(
+            pk_gte=pk_gte, pk_lt=pk_lt, chunk_size=chunk_size, skip_matched=skip_matched, on_chunk=throttle
+        )
+
+    # Движок 'sql' сопоставляет диапазон одним запросом без подготовки, поэтому делим диапазон на части
+    # шириной chunk_size id и ждём после каждой
+    step = chunk_size or settings.APPLICATIONS_MATCHING_CHUNK_SIZE
+    stats = {'customers': 0, 'applications': 0}
+    for part_gte in range(pk_gte, pk_lt, step):
+        part_pk_lt = min(part_gte + step, pk_lt)
+        stats['applications'] += match_customers(pk_gte=part_gte, pk_lt=part_pk_lt)['applications']
+        customers_count = get_auto_customers().filter(pk__gte=part_gte, pk__lt=part_pk_lt).count()
+        stats['customers'] += customers_count
+        throttle(customers_count)
+
+    return pk_gte, pk_lt, stats
+
+
+def rematch_range_star(args):
+    return rematch_range(*args)
+
+
+class Command(BaseCommand):
+    help = (
+        'Массово сопоставляет Анкеты клиентов с режимом "auto" с актуальными Предложениями '
+        'в нескольких процессах по диапазонам id. После каждого диапазона записывает контрольную точку, '
+        'повторный запуск продолжает с незавершённых диапазонов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Количество процессов')
+        parser.add_argument('--range-size', type=int, default=100000, help='Ширина диапазона id Анкет')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Количество Анкет в пачке')
+        parser.add_argument(
+            '--rate', type=int, default=0,
+            help=(
+                'Ограничение скорости, Анкет в секунду на все процессы. Выдерживается после каждой пачки '
+                '--chunk-size Анкет. 0 -- без ограничения'
+            )
+        )
+        parser.add_argument(
+            '--checkpoint', default='rematch_customers.checkpoint.json', help='Путь к файлу контрольной точки'
+        )
+        parser.add_argument('--restart', action='store_true', help='Начать заново, не учитывая контрольную точку')
+        parser.add_argument(
+            '--all', action='store_true', dest='rematch_all',
+            help='Сопоставлять и Анкеты, уже отмеченные текущей версией набора Предложений'
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = None if options['restart'] else self.load_checkpoint(options['checkpoint'])
+        if checkpoint is None:
+            checkpoint = {
+                'ranges': self.split_ranges(options['range_size']),
+                'done': [],
+                'customers': 0,
+                'applications': 0,
+            }
+            self.save_checkpoint(options['checkpoint'], checkpoint)
+        else:
+            self.stdout.write('Продолжение с контрольной точки "{0}": завершено диапазонов {1} из {2}'.format(
+                options['checkpoint'], len(checkpoint['done']), len(checkpoint['ranges'])
+            ))
+
+        done = set(tuple(pk_range) for pk_range in checkpoint['done'])
+        pending = [pk_range for pk_range in checkpoint['ranges'] if tuple(pk_range) not in done]
+        if not pending:
+            self.stdout.write(self.style.SUCCESS('Все диапазоны уже сопоставлены'))
+            return
+
+        processes = max(1, min(options['processes'], len(pending)))
+        rate = options['rate'] / processes if options['rate'] else 0
+        tasks = [
+            (pk_gte, pk_lt, options['chunk_size'], not options['rematch_all'], rate)
+            for pk_gte, pk_lt in pending
+        ]
+
+        started = time.monotonic()
+        session = {'ranges': 0, 'customers': 0}
+        for pk_gte, pk_lt, stats in self.run(tasks, processes):
+            checkpoint['done'].append([pk_gte, pk_lt])
+            checkpoint['customers'] += stats.get('customers', 0)
+            checkpoint['applications'] += stats['applications']
+            self.save_checkpoint(options['checkpoint'], checkpoint)
+
+            session['ranges'] += 1
+            session['customers'] += stats.get('customers', 0)
+            self.report_progress(checkpoint, session, len(pending), time.monotonic() - started)
+
+        self.stdout.write(self.style.SUCCESS('Сопоставление завершено. Анкет: {customers}, заявок: {applications}'.format(
+            **checkpoint
+        )))
+
+    def run(self, tasks, processes):
+        if processes == 1:
+            for task in tasks:
+                yield rematch_range(*task)
+            return
+
+        # Соединение с БД нельзя использовать в нескольких процессах,
+        # дочерние процессы открывают собственные соединения
+        connections.close_all()
+        with multiprocessing.Pool(processes) as pool:
+            yield from pool.imap_unordered(rematch_range_star, tasks)
+
+    def split_ranges(self, range_size):
+        bounds = get_auto_customers().aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+        if bounds['min_pk'] is None:
+            return []
+        return [
+            [start, min(start + range_size, bounds['max_pk'] + 1)]
+            for start in range(bounds['min_pk'], bounds['max_pk'] + 1, range_size)
+        ]
+
+    def report_progress(self, checkpoint, session, session_total, elapsed):
+        throughput = session['customers'] / elapsed if elapsed else 0
+        eta = timedelta(seconds=math.ceil(elapsed / session['ranges'] * (session_total - session['ranges'])))
+        self.stdout.write(
+            '[{done}/{total}] анкет: {customers}, заявок: {applications}, '
+            '{throughput:.0f} анкет/с, осталось ~{eta}'.format(
+                done=len(checkpoint['done']), total=len(checkpoint['ranges']),
+                customers=checkpoint['customers'], applications=checkpoint['applications'],
+                throughput=throughput, eta=eta,
+            )
+        )
+
+    def load_checkpoint(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save_checkpoint(self, path, checkpoint):
+        checkpoint['updated_at'] = datetime.now().isoformat()
+
+        # Файл заменяется атомарно, чтобы контрольная точка не повредилась при падении во время записи
+        tmp_path = '{0}.tmp'.format(path)
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
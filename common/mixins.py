@@ -0,0 +1,256 @@
+# encoding: utf-8
+import hashlib
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework.exceptions import ValidationError
+
+
+class NotModified(Exception):
+    """
+    Ответ на условный запрос готов до вызова обработчика представления (304 Not Modified или 412).
+    """
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы (If-None-Match, If-Modified-Since) для представлений DRF.
+
+    После проверки прав вычисляется версия ответа, из неё строится заголовок ETag. Если данные у клиента актуальны,
+    то ответ 304 Not Modified возвращается без сериализации записей.
+    Версия детальной записи -- наибольшее значение полей last_modified_fields, оно же отдаётся в Last-Modified.
+    Версия постраничного списка -- id и значения last_modified_fields записей запрошенной страницы и наличие
+    соседних страниц, поэтому удаление записи или её выход из выборки тоже меняют ETag. Версия списка без
+    постраничного вывода -- число записей и наибольшие значения last_modified_fields, один агрегирующий запрос.
+    Last-Modified для списков не отправляется: удаление записи не увеличивает наибольшее значение.
+    Страница, выбранная для ETag, используется и при выводе списка, повторно она не запрашивается.
+
+    ETag учитывает пользователя, полный путь запроса (фильтры, сортировку, курсор страницы) и формат ответа.
+    """
+
+    # Поля, изменение которых меняет представление записи. Например, ('updated_at', 'lender__updated_at'),
+    # если в ответ входят данные связанной модели.
+    last_modified_fields = ('updated_at',)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        self.etag = self.last_modified = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+
+        self.etag, self.last_modified = self.get_validators(request)
+        if self.etag is None:
+            return
+
+        response = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+        if response is not None:
+            raise NotModified(response)
+
+    def get_validators(self, request):
+        """
+        :return: (ETag, Last-Modified в секундах от начала эпохи или None для списков)
+                 или (None, None), если детальной записи нет.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg not in self.kwargs:
+            return self.make_etag(request, self.get_list_state()), None
+
+        queryset = self.get_queryset().filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        aggregates = {field: Max(field) for field in self.last_modified_fields}
+        aggregates = queryset.order_by().aggregate(count=Count('pk'), **aggregates)
+        if not aggregates['count']:
+            return None, None
+
+        last_modified_values = [aggregates[field] for field in self.last_modified_fields]
+        values = [value for value in last_modified_values if value is not None]
+        last_modified = int(timezone.make_aware(max(values)).timestamp()) if values else None
+        return self.make_etag(request, last_modified_values), last_modified
+
+    def make_etag(self, request, state):
+        """
+        :param state: версия данных ответа, её строковое представление входит в ETag.
+        """
+        validator = '|'.join(str(value) for value in [
+            self.get_queryset().model._meta.label, request.user.pk, request.get_full_path(),
+            request.accepted_renderer.format, state,
+        ])
+        return quote_etag(hashlib.md5(validator.encode('utf-8')).hexdigest())
+
+    def get_list_queryset(self):
+        """
+        Возвращает QuerySet, который выводит list(): по нему вычисляется версия списка.
+        Объекты моделей или строки values() должны содержать поля last_modified_fields.
+        """
+        return self.filter_queryset(self.get_queryset())
+
+    def get_list_state(self):
+        """
+        Версия списка. Для постраничного вывода -- id и значения last_modified_fields записей страницы, она
+        выбирается тем же запросом по индексу, что и при выводе, и сохраняется для list(). Без постраничного
+        вывода -- число записей и наибольшие значения last_modified_fields одним запросом.
+
+        :return: list или tuple (list, наличие следующей страницы, наличие предыдущей страницы).
+        """
+        queryset = self.get_list_queryset()
+
+        self._conditional_page = None
+        if self.paginator is not None:
+            self._conditional_page = super().paginate_queryset(queryset)
+        if self._conditional_page is None:
+            aggregates = {field: Max(field) for field in self.last_modified_fields}
+            aggregates = queryset.order_by().aggregate(count=Count('pk'), **aggregates)
+            return [aggregates['count']] + [aggregates[field] for field in self.last_modified_fields]
+
+        fields = (queryset.model._meta.pk.attname,) + tuple(self.last_modified_fields)
+
+        rows = [tuple(self.get_row_value(row, field) for field in fields) for row in self._conditional_page]
+        return rows, self.paginator.has_next, self.paginator.has_previous
+
+    def get_row_value(self, row, field):
+        """
+        :param row: объект модели или строка values().
+        :param field: str, поле в нотации QuerySet, например 'partner__updated_at'.
+        """
+        if isinstance(row, dict):
+            return row[field]
+        return reduce(lambda obj, name: getattr(obj, name, None), field.split('__'), row)
+
+    def paginate_queryset(self, queryset):
+        # Страница уже выбрана при вычислении версии списка
+        page = getattr(self, '_conditional_page', None)
+        if page is not None:
+            self._conditional_page = None
+            return page
+        return super().paginate_queryset(queryset)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        is_success = 200 <= response.status_code < 300 or response.status_code == 304
+        if getattr(self, 'etag', None) is not None and is_success:
+            response['ETag'] = self.etag
+            if self.last_modified is not None:
+                response['Last-Modified'] = http_date(self.last_modified)
+        return response
+
+
+class SparseFieldsetsMixin:
+    """
+    Выбор полей ответа параметром запроса fields (например, ?fields=id,status) для GET-запросов.
+
+    Лишние поля удаляются из сериализатора, а из БД загружаются только нужные колонки (QuerySet.only()),
+    select_related сокращается до связей, поля которых вошли в ответ.
+    Колонки поля сериализатора определяются по его source. Для полей, у которых source нельзя сопоставить
+    с колонками (например, SerializerMethodField), колонки задаются в sparse_fields_sources.
+    """
+
+    fields_query_param = 'fields'
+
+    # {поле сериализатора: колонки модели в нотации QuerySet.only()}
+    sparse_fields_sources = {}
+
+    def get_sparse_fields(self):
+        """
+        :return: set of str, запрошенные поля ответа или None, если ответ не сокращается.
+        """
+        if self.request.method not in ('GET', 'HEAD') or self.fields_query_param not in self.request.query_params:
+            return None
+
+        if not hasattr(self, '_sparse_fields'):
+            fields = set(filter(None, self.request.query_params[self.fields_query_param].split(',')))
+            unknown = fields - set(self.get_serializer_class()().fields)
+            if not fields or unknown:
+                raise ValidationError({self.fields_query_param: [
+                    'Неизвестные поля: {0}'.format(', '.join(sorted(unknown))) if unknown else 'Не указаны поля'
+                ]})
+            self._sparse_fields = fields
+
+        return self._sparse_fields
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            serializer_fields = getattr(serializer, 'child', serializer).fields
+            for name in list(serializer_fields):
+                if name not in fields:
+                    serializer_fields.pop(name)
+
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+
+        sources = self.get_sparse_sources(fields, queryset.model)
+        if sources is None:
+            return queryset
+
+        related = set(source.rsplit('__', 1)[0] for source in sources if '__' in source)
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*sources)
+
+    def get_sparse_sources(self, fields, model):
+        """
+        Возвращает колонки, которые нужны для полей fields, для сортировки списка и для версии записей
+        (last_modified_fields условных запросов).
+
+        :return: set of str в нотации QuerySet.only() или None, если колонки какого-то поля определить нельзя.
+        """
+        serializer_fields = self.get_serializer_class()().fields
+
+        # Поля сортировки нужны постраничному выводу по курсору
+        sources = set(['pk'])
+        ordering_fields = tuple(getattr(self, 'ordering_fields', None) or ())
+        ordering_fields += tuple(getattr(self, 'ordering', None) or ())
+        sources.update(field.lstrip('-') for field in ordering_fields)
+        sources.update(getattr(self, 'last_modified_fields', ()))
+
+        for name in fields:
+            if name in self.sparse_fields_sources:
+                sources.update(self.sparse_fields_sources[name])
+                continue
+
+            field = serializer_fields[name]
+            if field.source == '*' or not self.is_model_path(model, field.source_attrs):
+                return None
+            sources.add('__'.join(field.source_attrs))
+
+        return sources
+
+    def is_model_path(self, model, path):
+        """
+        Путь path -- цепочка полей модели, по которой можно загрузить колонку через QuerySet.only().
+        """
+        for i, name in enumerate(path):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return False
+            if not field.concrete:
+                return False
+            if i < len(path) - 1:
+                if not field.many_to_one and not field.one_to_one:
+                    return False
+                model = field.related_model
+        return True
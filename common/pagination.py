@@ -0,0 +1,177 @@
+# encoding: utf-8
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Постраничный вывод по курсору (keyset pagination).
+
+    К сортировке, заданной OrderingFilter представления (или атрибутом ordering представления),
+    всегда добавляется id в том же направлении, поэтому позиция каждой записи уникальна.
+    Курсор хранит значения всех полей сортировки последней записи страницы, следующая страница выбирается
+    условием (поле, id) > (значение, id записи) по индексу, а не через OFFSET. Поэтому время ответа
+    не зависит от номера страницы, а количество записей (COUNT(*)) не запрашивается.
+
+    Размер страницы задаётся параметром page_size, по умолчанию API_PAGE_SIZE, не больше API_MAX_PAGE_SIZE.
+    """
+
+    page_size_query_param = 'page_size'
+    ordering = ('-created_at',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.model = queryset.model
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor.reverse, self.cursor.position
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(current_position, reverse))
+
+        # Лишняя запись показывает, есть ли следующая страница
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_page_size(self, request):
+        # Настройки читаются при каждом запросе, а не при импорте модуля, как api_settings в DRF
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+        return super().get_page_size(request)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        # Следующая страница начинается сразу после последней записи текущей
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            position = self.next_position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+
+        # Предыдущая страница заканчивается сразу перед первой записью текущей
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            position = self.previous_position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def get_ordering(self, request, queryset, view):
+        ordering = [field for field in super().get_ordering(request, queryset, view) if field.lstrip('-') != 'id']
+        if not ordering:
+            return ('-id',)
+        id_ordering = '-id' if ordering[0].startswith('-') else 'id'
+        return tuple(ordering) + (id_ordering,)
+
+    def get_keyset_filter(self, position, reverse):
+        """
+        Возвращает условие выбора записей, следующих за позицией в порядке self.ordering
+        (предшествующих ей, если reverse).
+
+        :param position: list, значения полей сортировки записи.
+        :param reverse: boolean, выбирать записи перед позицией.
+        :return: django.db.models.Q
+        """
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        # (f1, f2, ..., id) > (v1, v2, ..., id0) раскрывается в
+        # f1 > v1 OR (f1 = v1 AND f2 > v2) OR ... OR (f1 = v1 AND ... AND id > id0)
+        keyset_filter = Q()
+        equal = Q()
+        for order, value in zip(self.ordering, position):
+            field = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            keyset_filter |= equal & Q(**{'{0}__{1}'.format(field, lookup): value})
+            equal &= Q(**{field: value})
+
+        # Избыточное условие по первому полю позволяет начать просмотр индекса сразу с позиции курсора
+        first_field = self.ordering[0].lstrip('-')
+        lookup = 'lte' if self.ordering[0].startswith('-') != reverse else 'gte'
+        return Q(**{'{0}__{1}'.format(first_field, lookup): position[0]}) & keyset_filter
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        # Значения курсора приводятся к типам полей сортировки: изменённый клиентом курсор
+        # должен давать 404, а не ошибку БД при выполнении запроса
+        values = []
+        for order, value in zip(self.ordering, position):
+            field = self.model._meta.get_field(order.lstrip('-'))
+            try:
+                value = field.to_python(value)
+            except (DjangoValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+
+        return Cursor(offset=0, reverse=cursor.reverse, position=values)
+
+    def encode_cursor(self, cursor):
+        position = [value if isinstance(value, int) else str(value) for value in cursor.position]
+        return super().encode_cursor(cursor._replace(position=json.dumps(position)))
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            field = order.lstrip('-')
+            values.append(instance[field] if isinstance(instance, dict) else getattr(instance, field))
+        return values
@@ -5,6 +5,7 @@ from datetime import date, datetime
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.core.cache import caches
 from django.utils.dateparse import parse_date, parse_datetime
 
 from lenders.models import Lender
@@ -21,6 +22,10 @@ class CreateInitialDataMixin:
 
     def setUp(self):
         super().setUp()
+        # Кэш не откатывается вместе с транзакцией теста
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
         partners_grp = Group.objects.get(name='Партнёры')
         lenders_grp = Group.objects.get(name='Кредитные организации')
 
@@ -115,7 +120,7 @@ class FiltersTestMixin:
                     )
 
                 response = client.get(url)
-                response_data = response.json()
+                response_data = response.json()['results']
                 response_values = [item[field] for item in response_data]
 
                 if lookup == 'lt':
@@ -168,7 +173,7 @@ class OrderingTestMixin:
                 )
 
                 response = client.get(url)
-                response_data = response.json()
+                response_data = response.json()['results']
                 response_ids = [item['id'] for item in response_data]
 
                 reverse = False
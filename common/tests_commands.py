@@ -0,0 +1,179 @@
+# encoding: utf-8
+import json
+import os
+import tempfile
+from datetime import datetime
+from io import StringIO
+from unittest import mock
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from applications.models import Application
+from common.management.commands.rematch_customers import rematch_range
+from lenders.models import Lender, Offer
+from lenders.offer_index import OfferIndex
+from partners.models import Customer, Partner
+
+
+User = get_user_model()
+
+
+class LoadApplicationsCommandTestCase(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user, name='М-Видео')
+        lender = Lender.objects.create(name='СберБанк')
+
+        self.customer = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=partner
+        )
+        now = datetime.now()
+        self.offer1, self.offer2, self.offer3 = [
+            Offer.objects.create(
+                name='Предложение {0}'.format(i), offer_type=Offer.CONSUMER_CREDIT,
+                rotating_start=now - relativedelta(days=1), rotating_end=now + relativedelta(months=1),
+                min_credit_score=5, max_credit_score=30, lender=lender
+            )
+            for i in range(1, 4)
+        ]
+
+    def load(self, lines, **options):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        out = StringIO()
+        call_command('load_applications', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_load_applications(self):
+        Application.objects.create(customer=self.customer, lender_offer=self.offer1)
+
+        output = self.load([
+            'customer_id,lender_offer_id,status',
+            '{0},{1},'.format(self.customer.pk, self.offer1.pk),
+            '{0},{1},{2}'.format(self.customer.pk, self.offer2.pk, Application.SENT),
+            # Несуществующие Анкета клиента и Предложение пропускаются
+            '{0},{1},'.format(self.customer.pk + 1000, self.offer3.pk),
+            '{0},{1},'.format(self.customer.pk, self.offer3.pk + 1000),
+            '{0},{1},'.format(self.customer.pk, self.offer3.pk),
+        ], skip_header=True, batch_size=2)
+
+        self.assertEqual(
+            set(Application.objects.values_list('lender_offer_id', 'status')),
+            {(self.offer1.pk, Application.NEW), (self.offer2.pk, Application.SENT), (self.offer3.pk, Application.NEW)}
+        )
+        self.assertIn('Создано заявок: 2, пропущено строк: 3', output)
+
+    def test_load_applications_invalid_row(self):
+        with self.assertRaisesMessage(CommandError, 'Некорректный статус в строке 2'):
+            self.load([
+                '{0},{1}'.format(self.customer.pk, self.offer1.pk),
+                '{0},{1},100'.format(self.customer.pk, self.offer2.pk),
+            ])
+        self.assertFalse(Application.objects.exists())
+
+
+class RematchCustomersCommandTestCase(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user, name='М-Видео')
+        lender = Lender.objects.create(name='СберБанк')
+
+        self.customers = [
+            Customer.objects.create(
+                surname='Иванов', name='Пётр', patronymic='Сергеевич',
+                birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+                credit_score=10, partner=partner, offer_matching_mode=['auto']
+            )
+            for _ in range(4)
+        ]
+        now = datetime.now()
+        self.offer = Offer.objects.create(
+            name='Предложение', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=now - relativedelta(days=1), rotating_end=now + relativedelta(months=1),
+            min_credit_score=5, max_credit_score=30, lender=lender
+        )
+
+        fd, self.checkpoint = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        os.remove(self.checkpoint)
+        self.addCleanup(lambda: os.path.exists(self.checkpoint) and os.remove(self.checkpoint))
+
+    def rematch(self, *args):
+        out = StringIO()
+        call_command('rematch_customers', '--processes', '1', '--checkpoint', self.checkpoint, *args, stdout=out)
+        return out.getvalue()
+
+    def matched_customers(self):
+        return set(Application.objects.values_list('customer_id', flat=True))
+
+    def write_checkpoint(self, ranges, done):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'ranges': ranges, 'done': done, 'customers': 0, 'applications': 0}, f)
+
+    def test_rematch_customers_resume(self):
+        pks = [customer.pk for customer in self.customers]
+        ranges = [[pks[0], pks[2]], [pks[2], pks[-1] + 1]]
+
+        # Первый диапазон завершён до падения, продолжаются только незавершённые
+        self.write_checkpoint(ranges, done=[ranges[0]])
+        output = self.rematch()
+
+        self.assertIn('завершено диапазонов 1 из 2', output)
+        self.assertEqual(self.matched_customers(), set(pks[2:]))
+        with open(self.checkpoint) as f:
+            checkpoint = json.load(f)
+        self.assertEqual(checkpoint['done'], ranges)
+        self.assertEqual(checkpoint['applications'], 2)
+
+        self.assertIn('Все диапазоны уже сопоставлены', self.rematch())
+        self.assertEqual(self.matched_customers(), set(pks[2:]))
+
+    def test_rematch_customers_restart(self):
+        pks = [customer.pk for customer in self.customers]
+        self.write_checkpoint([[pks[0], pks[-1] + 1]], done=[[pks[0], pks[-1] + 1]])
+
+        # С --restart контрольная точка не учитывается, диапазоны вычисляются заново
+        self.rematch('--restart', '--range-size', '2')
+
+        self.assertEqual(self.matched_customers(), set(pks))
+        with open(self.checkpoint) as f:
+            checkpoint = json.load(f)
+        self.assertEqual(len(checkpoint['ranges']), 2)
+        self.assertEqual(checkpoint['done'], checkpoint['ranges'])
+        self.assertEqual(checkpoint['customers'], 4)
+
+    def test_rematch_range_throttle(self):
+        pks = [customer.pk for customer in self.customers]
+
+        # Скорость ограничивается после каждой пачки, а Предложения и их версия загружаются один раз на диапазон
+        with mock.patch('common.management.commands.rematch_customers.time.sleep') as sleep_mock, \
+                mock.patch('applications.matching.get_offers_version', return_value=1) as get_offers_version_mock, \
+                mock.patch('applications.matching.OfferIndex.build', wraps=OfferIndex.build) as build_mock:
+            pk_gte, pk_lt, stats = rematch_range(pks[0], pks[-1] + 1, 1, False, 1000)
+
+        self.assertEqual((pk_gte, pk_lt), (pks[0], pks[-1] + 1))
+        self.assertEqual((stats['customers'], stats['applications']), (4, 4))
+        self.assertEqual(sleep_mock.call_count, 4)
+        self.assertEqual(get_offers_version_mock.call_count, 1)
+        self.assertEqual(build_mock.call_count, 1)
+
+    @override_settings(APPLICATIONS_MATCHING_ENGINE='sql')
+    def test_rematch_range_throttle_sql_engine(self):
+        pks = [customer.pk for customer in self.customers]
+
+        with mock.patch('common.management.commands.rematch_customers.time.sleep') as sleep_mock:
+            _, _, stats = rematch_range(pks[0], pks[-1] + 1, 2, False, 1000)
+
+        self.assertEqual(stats, {'customers': 4, 'applications': 4})
+        self.assertEqual(sleep_mock.call_count, 2)
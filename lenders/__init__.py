@@ -0,0 +1 @@
+default_app_config = 'lenders.apps.LendersConfig'
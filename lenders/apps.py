@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class LendersConfig(AppConfig):
     name = 'lenders'
+
+    def ready(self):
+        import lenders.signals     # noqa: F401
@@ -0,0 +1,62 @@
+# Generated by Django 2.1.2 on 2026-10-18 15:38
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+# Триггер поддерживает range-поля в актуальном состоянии при любом изменении строки,
+# в том числе через QuerySet.update() и bulk_create(), которые не вызывают Offer.save().
+CREATE_RANGES_TRIGGER_SQL = '''
+    CREATE FUNCTION lenders_offer_set_ranges() RETURNS trigger AS $$
+    BEGIN
+        NEW.credit_score_range := CASE
+            WHEN NEW.min_credit_score <= NEW.max_credit_score
+                THEN int4range(NEW.min_credit_score, NEW.max_credit_score, '[]')
+            ELSE 'empty'::int4range
+        END;
+        NEW.rotating_range := CASE
+            WHEN NEW.rotating_start <= NEW.rotating_end
+                THEN tstzrange(NEW.rotating_start, NEW.rotating_end, '[]')
+            ELSE 'empty'::tstzrange
+        END;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER lenders_offer_set_ranges
+        BEFORE INSERT OR UPDATE ON lenders_offer
+        FOR EACH ROW EXECUTE PROCEDURE lenders_offer_set_ranges();
+
+    UPDATE lenders_offer SET id = id;
+'''
+
+DROP_RANGES_TRIGGER_SQL = '''
+    DROP TRIGGER lenders_offer_set_ranges ON lenders_offer;
+    DROP FUNCTION lenders_offer_set_ranges();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lenders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offer',
+            name='credit_score_range',
+            field=django.contrib.postgres.fields.ranges.IntegerRangeField(editable=False, null=True, verbose_name='Диапазон скорингового балла'),
+        ),
+        migrations.AddField(
+            model_name='offer',
+            name='rotating_range',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(editable=False, null=True, verbose_name='Период ротации'),
+        ),
+        migrations.RunSQL(CREATE_RANGES_TRIGGER_SQL, DROP_RANGES_TRIGGER_SQL),
+        migrations.AddIndex(
+            model_name='offer',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['credit_score_range', 'rotating_range'], name='lenders_offer_ranges_gist'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.1.2 on 2026-10-18 15:58
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lenders', '0002_offer_ranges'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreOffers',
+            fields=[
+                ('score_from', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='Начало отрезка скорингового балла')),
+                ('offers', django.contrib.postgres.fields.jsonb.JSONField(default=dict, verbose_name='id Предложений по id Кредитных организаций')),
+                ('valid_until', models.DateTimeField(null=True, verbose_name='Актуально до')),
+            ],
+            options={
+                'verbose_name': 'Предложения по скоринговому баллу',
+                'verbose_name_plural': 'Предложения по скоринговому баллу',
+            },
+        ),
+    ]
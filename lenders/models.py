@@ -1,6 +1,13 @@
 # encoding: utf-8
+import hashlib
+from datetime import datetime, timedelta
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.contrib.postgres.fields import DateTimeRangeField, IntegerRangeField, JSONField
+from django.contrib.postgres.indexes import GistIndex
+from django.db import connections, models, transaction
+from django.db.models import Min, Value
+from django.db.models.functions import Cast
 
 
 User = get_user_model()
@@ -22,6 +29,35 @@ class Lender(models.Model):
         return self.name
 
 
+class OfferQuerySet(models.QuerySet):
+
+    def active(self, now=None):
+        """
+        Предложения, ротация которых идёт в момент now (по умолчанию текущее время).
+        """
+        # Поля DateTimeField хранятся в PostgreSQL как timestamp with time zone, а даты в проекте -- без часового пояса.
+        # Оператору @> нужен тот же тип, что и у элементов диапазона, поэтому приводим дату явно.
+        now = Cast(Value(now or datetime.now()), output_field=models.DateTimeField())
+        return self.filter(rotating_range__contains=now)
+
+    def for_credit_score(self, credit_score):
+        """
+        Предложения, диапазон скорингового балла которых покрывает credit_score.
+        """
+        return self.filter(credit_score_range__contains=credit_score)
+
+    def aggregate_version(self, **aggregates):
+        """
+        Версия набора Предложений: хэш значений агрегатов, вычисленных одним запросом без выборки строк.
+
+        :param aggregates: агрегаты в нотации QuerySet.aggregate(), например count=Count('pk').
+        :return: int, 64-битное число со знаком.
+        """
+        state = self.aggregate(**aggregates)
+        state = '|'.join('{0}={1}'.format(name, state[name]) for name in sorted(state))
+        return int.from_bytes(hashlib.md5(state.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+
 class Offer(models.Model):
 
     CONSUMER_CREDIT = 1
@@ -44,12 +80,133 @@ class Offer(models.Model):
 
     lender = models.ForeignKey(Lender, verbose_name='Кредитная организация', on_delete=models.PROTECT)
 
+    # Диапазоны [min_credit_score, max_credit_score] и [rotating_start, rotating_end] в виде range-типов PostgreSQL.
+    # Заполняются триггером в БД при любом INSERT или UPDATE (см. миграцию 0002_offer_ranges),
+    # и по ним построен GiST-индекс для поиска подходящих Предложений оператором @>.
+    credit_score_range = IntegerRangeField(verbose_name='Диапазон скорингового балла', null=True, editable=False)
+    rotating_range = DateTimeRangeField(verbose_name='Период ротации', null=True, editable=False)
+
     created_at = models.DateTimeField(verbose_name='Дата и время создания', auto_now_add=True)
     updated_at = models.DateTimeField(verbose_name='Дата и время обновления', auto_now=True)
 
+    objects = OfferQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Предложение'
         verbose_name_plural = 'Предложения'
+        indexes = [
+            GistIndex(fields=['credit_score_range', 'rotating_range'], name='lenders_offer_ranges_gist'),
+        ]
 
     def __str__(self):
         return '{name} {lender}'.format(name=self.name, lender=self.lender)
+
+
+class ScoreOffersQuerySet(models.QuerySet):
+
+    # Ключ advisory-блокировки PostgreSQL, которая не даёт нескольким процессам перестраивать таблицу одновременно
+    REBUILD_LOCK_KEY = 0x5c0e0ff
+
+    def rebuild(self, now=None):
+        """
+        Перестраивает таблицу по Предложениям, актуальным на момент now.
+        Таблица обновляется по разнице с текущим содержимым: изменяются только отрезки,
+        набор Предложений или срок актуальности которых изменился.
+
+        :param now: datetime, по умолчанию текущее время.
+        :return: int, количество добавленных, изменённых и удалённых строк.
+        """
+        from lenders.offer_index import ScoreIntervals     # Импортируем тут, иначе получается циклический импорт.
+
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [self.REBUILD_LOCK_KEY])
+
+            now = now or datetime.now()
+            offers = list(Offer.objects.active(now).only(
+                'pk', 'lender_id', 'min_credit_score', 'max_credit_score', 'rotating_end'
+            ))
+
+            # Набор актуальных Предложений изменится, когда начнётся ротация следующего
+            # или закончится ротация одного из текущих Предложений
+            moments = [offer.rotating_end + timedelta(microseconds=1) for offer in offers]
+            moments.append(Offer.objects.filter(rotating_start__gt=now).aggregate(start=Min('rotating_start'))['start'])
+            valid_until = min(filter(None, moments), default=None)
+
+            # Отрезок с нулевого балла есть всегда, поэтому для любого балла находится строка
+            segments = {0: {}}
+            for score_from, segment_offers in ScoreIntervals(offers).segments():
+                lender_offers = {}
+                for offer in segment_offers:
+                    lender_offers.setdefault(str(offer.lender_id), []).append(offer.pk)
+                segments[score_from] = lender_offers
+
+            changes = 0
+            existed = {row.score_from: row for row in self.all()}
+            for score_from, row in existed.items():
+                if score_from not in segments:
+                    row.delete()
+                    changes += 1
+                elif row.offers != segments[score_from] or row.valid_until != valid_until:
+                    row.offers = segments[score_from]
+                    row.valid_until = valid_until
+                    row.save()
+                    changes += 1
+
+            new_rows = [
+                self.model(score_from=score_from, offers=lender_offers, valid_until=valid_until)
+                for score_from, lender_offers in segments.items() if score_from not in existed
+            ]
+            self.bulk_create(new_rows)
+
+        return changes + len(new_rows)
+
+    def lookup(self, credit_score, lender=None, now=None):
+        """
+        Возвращает id актуальных Предложений, диапазон скорингового балла которых покрывает credit_score.
+        Строка ищется одним запросом по первичному ключу. Если таблица ещё не построена
+        или её содержимое устарело (valid_until прошёл), то Предложения ищутся запросом по диапазонам,
+        а таблица не перестраивается: это делает задача lenders.tasks.rebuild_score_offers_task,
+        запускаемая после сохранения Предложений и периодически, и задача начала ротации.
+
+        Изменения Предложений через QuerySet.update() не вызывают сигналов и не меняют valid_until,
+        поэтому до ближайшего периодического перестроения таблица может возвращать прежний набор Предложений.
+
+        :param credit_score: int, скоринговый балл Анкеты клиента.
+        :param lender: lenders.Lender или его id.
+                       Если задано, то Предложения ищутся только у этой Кредитной организации.
+        :param now: datetime, по умолчанию текущее время.
+        :return: list of int, id Предложений в порядке возрастания.
+        """
+        now = now or datetime.now()
+        lender_id = getattr(lender, 'pk', lender)
+
+        row = self.filter(score_from__lte=credit_score).order_by('-score_from').first()
+        if row is None or (row.valid_until is not None and row.valid_until <= now):
+            offers_qs = Offer.objects.active(now).for_credit_score(credit_score)
+            if lender_id is not None:
+                offers_qs = offers_qs.filter(lender_id=lender_id)
+            return list(offers_qs.order_by('pk').values_list('pk', flat=True))
+
+        if lender_id is None:
+            return sorted(pk for offers_ids in row.offers.values() for pk in offers_ids)
+        return sorted(row.offers.get(str(lender_id), []))
+
+
+class ScoreOffers(models.Model):
+    """
+    Таблица поиска актуальных Предложений по скоринговому баллу.
+    Ось баллов разбита на отрезки границами диапазонов актуальных Предложений.
+    Для каждого отрезка хранятся id покрывающих его Предложений по Кредитным организациям,
+    поэтому подходящие Предложения находятся одним запросом по первичному ключу вместо поиска по диапазонам.
+    """
+
+    score_from = models.PositiveIntegerField(verbose_name='Начало отрезка скорингового балла', primary_key=True)
+    offers = JSONField(verbose_name='id Предложений по id Кредитных организаций', default=dict)
+    valid_until = models.DateTimeField(verbose_name='Актуально до', null=True)
+
+    objects = ScoreOffersQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Предложения по скоринговому баллу'
+        verbose_name_plural = 'Предложения по скоринговому баллу'
@@ -0,0 +1,101 @@
+# encoding: utf-8
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from lenders.models import Offer
+
+
+class ScoreIntervals:
+    """
+    Структура для поиска Предложений, диапазон скорингового балла которых покрывает заданный балл.
+
+    Границы диапазонов всех Предложений сортируются и разбивают ось баллов на элементарные отрезки.
+    Для каждого отрезка заранее вычисляется список покрывающих его Предложений,
+    поэтому поиск -- это один бинарный поиск по границам: O(log n + k).
+    """
+
+    def __init__(self, offers):
+        points = set()
+        for offer in offers:
+            if offer.min_credit_score <= offer.max_credit_score:
+                points.add(offer.min_credit_score)
+                points.add(offer.max_credit_score + 1)     # Правая граница не включается в отрезок
+
+        self._points = sorted(points)
+        segments = [[] for _ in range(max(len(self._points) - 1, 0))]
+
+        for offer in sorted(offers, key=lambda x: x.pk):
+            start = bisect_left(self._points, offer.min_credit_score)
+            end = bisect_left(self._points, offer.max_credit_score + 1)
+            for i in range(start, end):
+                segments[i].append(offer)
+
+        self._segments = [tuple(segment) for segment in segments]
+
+    def segments(self):
+        """
+        Элементарные отрезки оси баллов в порядке возрастания.
+
+        :return: list of (int, tuple of lenders.Offer), начало отрезка и покрывающие его Предложения.
+                 Отрезок продолжается до начала следующего, последний отрезок -- до бесконечности.
+        """
+        return list(zip(self._points, self._segments + [()]))
+
+    def match(self, credit_score):
+        i = bisect_right(self._points, credit_score) - 1
+        if i < 0 or i >= len(self._segments):
+            return ()
+        return self._segments[i]
+
+
+class OfferIndex:
+    """
+    Индекс актуальных Предложений в памяти, сгруппированный по Кредитным организациям.
+
+    Строится одним запросом к БД на весь прогон сопоставления
+    и заменяет запрос Предложений для каждой Анкеты клиента.
+
+    Набор Предложений для каждого отрезка оси баллов вычисляется при построении (ScoreIntervals),
+    поэтому поиск по баллу не требует дополнительного запоминания результатов.
+    Индекс не отслеживает изменения Предложений, поэтому для каждого прогона строится заново.
+    """
+
+    def __init__(self, offers):
+        offers = list(offers)
+        self.offers = {offer.pk: offer for offer in offers}
+
+        lender_offers = defaultdict(list)
+        for offer in offers:
+            lender_offers[offer.lender_id].append(offer)
+
+        self._all = ScoreIntervals(offers)
+        self._by_lender = {
+            lender_id: ScoreIntervals(offers_list) for lender_id, offers_list in lender_offers.items()
+        }
+
+    @classmethod
+    def build(cls, now=None):
+        """
+        Строит индекс по Предложениям, актуальным на момент now.
+
+        :param now: datetime, по умолчанию текущее время.
+        :return: OfferIndex
+        """
+        return cls(Offer.objects.active(now))
+
+    def match(self, credit_score, lender=None):
+        """
+        Возвращает Предложения, диапазон скорингового балла которых покрывает credit_score.
+
+        :param credit_score: int, скоринговый балл Анкеты клиента.
+        :param lender: lenders.Lender или его id.
+                       Если задано, то Предложения ищутся только у этой Кредитной организации.
+        :return: tuple of lenders.Offer
+        """
+        lender_id = getattr(lender, 'pk', lender)
+        if lender_id is None:
+            return self._all.match(credit_score)
+
+        if lender_id not in self._by_lender:
+            return ()
+        return self._by_lender[lender_id].match(credit_score)
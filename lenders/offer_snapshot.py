@@ -0,0 +1,141 @@
+# encoding: utf-8
+import mmap
+import os
+import struct
+import tempfile
+from datetime import datetime
+
+import numpy as np
+from django.db.models import Count, Max
+
+from lenders.models import Offer
+
+
+# Заголовок файла: сигнатура, версия набора Предложений, количество Предложений.
+# За заголовком следуют массивы int64 одинаковой длины в порядке SNAPSHOT_FIELDS.
+SNAPSHOT_MAGIC = b'UNIOFFR1'
+SNAPSHOT_HEADER = struct.Struct('<8sqq')
+SNAPSHOT_FIELDS = ('ids', 'lender_ids', 'min_credit_scores', 'max_credit_scores', 'rotating_starts', 'rotating_ends')
+
+# Снимки, отображённые в память текущего процесса, по пути к файлу
+_snapshots = {}
+
+
+def get_snapshot_version(now=None):
+    """
+    Возвращает версию набора Предложений, ротация которых ещё не закончилась.
+    Версия меняется при создании, изменении и удалении Предложений, а также при окончании ротации.
+
+    :param now: datetime, по умолчанию текущее время.
+    :return: int, 64-битное число со знаком.
+    """
+    now = now or datetime.now()
+    return Offer.objects.filter(
+        rotating_end__gte=now
+    ).aggregate_version(
+        count=Count('pk'), updated_at=Max('updated_at')
+    )
+
+
+def publish_offer_snapshot(path, now=None):
+    """
+    Записывает снимок Предложений, ротация которых ещё не закончилась, в файл path.
+    В снимок попадают и Предложения, ротация которых ещё не началась: актуальность проверяет читающий процесс,
+    поэтому снимок не нужно перезаписывать в момент начала ротации.
+    Файл заменяется атомарно: процессы, которые уже отобразили старый снимок в память, продолжают с ним работать.
+
+    :param path: str, путь к файлу снимка.
+    :param now: datetime, по умолчанию текущее время.
+    :return: int, версия записанного снимка.
+    """
+    now = now or datetime.now()
+    version = get_snapshot_version(now)
+    offers = list(
+        Offer.objects.filter(
+            rotating_end__gte=now
+        ).order_by(
+            'pk'
+        ).values_list(
+            'pk', 'lender_id', 'min_credit_score', 'max_credit_score', 'rotating_start', 'rotating_end'
+        )
+    )
+
+    columns = list(zip(*offers)) or [()] * len(SNAPSHOT_FIELDS)
+    arrays = [np.array(column, dtype=np.int64) for column in columns[:4]]
+    arrays += [np.array(column, dtype='datetime64[us]').view(np.int64) for column in columns[4:]]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.offers-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, version, len(offers)))
+            for array in arrays:
+                f.write(array.tobytes())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return version
+
+
+class OfferSnapshot:
+    """
+    Снимок Предложений, отображённый в память только для чтения.
+    Массивы -- это представления numpy поверх отображённого файла, поэтому все процессы на хосте
+    используют одни и те же страницы памяти, а не собственные копии данных о Предложениях.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._stat = os.fstat(f.fileno())
+
+        magic, self.version, count = SNAPSHOT_HEADER.unpack_from(self._mmap)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('Файл "{0}" не является снимком Предложений'.format(path))
+
+        self.path = path
+        self.count = count
+        offset = SNAPSHOT_HEADER.size
+        for field in SNAPSHOT_FIELDS:
+            array = np.frombuffer(self._mmap, dtype=np.int64, count=count, offset=offset)
+            if field in ('rotating_starts', 'rotating_ends'):
+                array = array.view('datetime64[us]')
+            setattr(self, field, array)
+            offset += count * 8
+
+    def is_replaced(self):
+        """
+        Файл снимка был заменён новым.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) != (self._stat.st_ino, self._stat.st_mtime_ns)
+
+
+def get_offer_snapshot(path, now=None):
+    """
+    Возвращает актуальный снимок Предложений, отображённый в память.
+    Если версия набора Предложений в БД отличается от версии снимка, то снимок перезаписывается
+    и отображается заново. Пока версия не меняется, повторные вызовы стоят одного агрегирующего запроса.
+
+    :param path: str, путь к файлу снимка.
+    :param now: datetime, по умолчанию текущее время.
+    :return: OfferSnapshot
+    """
+    version = get_snapshot_version(now)
+
+    snapshot = _snapshots.get(path)
+    if snapshot is None or snapshot.version != version or snapshot.is_replaced():
+        # Снимок мог уже обновить другой процесс на этом хосте
+        snapshot = OfferSnapshot(path) if os.path.exists(path) else None
+        if snapshot is None or snapshot.version != version:
+            publish_offer_snapshot(path, now)
+            snapshot = OfferSnapshot(path)
+        _snapshots[path] = snapshot
+
+    return snapshot
@@ -0,0 +1,57 @@
+# encoding: utf-8
+import math
+from datetime import datetime
+
+from django.core.cache import caches
+from django.db.models import Min, Q
+
+from lenders.models import Offer
+
+
+# Кэш списка актуальных Предложений (настройка CACHES)
+OFFERS_LIST_CACHE_ALIAS = 'offers'
+
+# Сериализованный список актуальных Предложений и его версия для ETag (lenders.views.OffersView).
+# Он одинаков для всех Партнёров
+OFFERS_LIST_CACHE_KEY = 'lenders:offers_list'
+
+
+def get_next_offers_boundary(now=None):
+    """
+    Возвращает ближайший момент в будущем, когда меняется набор актуальных Предложений:
+    начинается или заканчивается ротация какого-либо Предложения.
+
+    :param now: datetime, по умолчанию текущее время.
+    :return: datetime или None, если таких Предложений нет.
+    """
+    now = now or datetime.now()
+    boundaries = Offer.objects.aggregate(
+        next_start=Min('rotating_start', filter=Q(rotating_start__gt=now)),
+        next_end=Min('rotating_end', filter=Q(rotating_end__gte=now)),
+    )
+    boundaries = [boundary for boundary in boundaries.values() if boundary is not None]
+    return min(boundaries) if boundaries else None
+
+
+def get_offers_list_cache_timeout(now=None):
+    """
+    Возвращает время жизни закэшированного списка актуальных Предложений в секундах:
+    до ближайшего начала или окончания ротации. Если таких моментов нет, то список хранится до изменения Предложений.
+
+    :param now: datetime, по умолчанию текущее время.
+    :return: int или None (без ограничения времени жизни).
+    """
+    now = now or datetime.now()
+    boundary = get_next_offers_boundary(now)
+    if boundary is None:
+        return None
+    # Предложение актуально до rotating_end включительно, поэтому время жизни не меньше секунды
+    return max(1, math.ceil((boundary - now).total_seconds()))
+
+
+def get_offers_list_cache():
+    return caches[OFFERS_LIST_CACHE_ALIAS]
+
+
+def invalidate_offers_list_cache():
+    get_offers_list_cache().delete(OFFERS_LIST_CACHE_KEY)
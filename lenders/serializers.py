@@ -10,4 +10,4 @@ class OfferSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Offer
-        fields = ('__all__')
+        exclude = ('credit_score_range', 'rotating_range')
@@ -0,0 +1,28 @@
+# encoding: utf-8
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from lenders.models import Lender, Offer
+from lenders.offers_cache import invalidate_offers_list_cache
+from lenders.tasks import rebuild_score_offers_task
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+@receiver(post_save, sender=Lender)
+@receiver(post_delete, sender=Lender)
+def invalidate_offers_list_on_change(sender, instance, **kwargs):
+    # Список актуальных Предложений содержит название Кредитной организации.
+    # Кэш сбрасывается сразу и ещё раз после сохранения изменений в БД: запрос, выполненный параллельно
+    # до окончания транзакции, мог закэшировать список без этих изменений.
+    invalidate_offers_list_cache()
+    transaction.on_commit(invalidate_offers_list_cache)
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def rebuild_score_offers_on_offer_change(sender, instance, **kwargs):
+    # Таблица поиска Предложений по скоринговому баллу перестраивается задачей после сохранения изменений в БД,
+    # а не в запросе, изменившем Предложение
+    transaction.on_commit(rebuild_score_offers_task.delay)
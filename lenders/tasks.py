@@ -0,0 +1,22 @@
+# encoding: utf-8
+from celery import shared_task
+from celery.utils.log import get_task_logger
+
+from lenders.models import ScoreOffers
+
+
+logger = get_task_logger(__name__)
+
+
+@shared_task
+def rebuild_score_offers_task():
+    """
+    Перестраивает таблицу поиска Предложений по скоринговому баллу (lenders.ScoreOffers).
+    Запускается после сохранения и удаления Предложений, а также периодически: окончание ротации Предложения
+    и изменения через QuerySet.update() не вызывают сигналов, а поиск по устаревшей таблице переходит
+    на запрос к Предложениям.
+    """
+    changes = ScoreOffers.objects.rebuild()
+    if changes:
+        logger.info('Таблица поиска предложений по скоринговому баллу перестроена, изменено строк: %s', changes)
+    return changes
@@ -3,11 +3,17 @@ from datetime import datetime
 
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 
 from common.test_utils import CreateInitialDataMixin
 from lenders.models import Offer
+from lenders.offers_cache import (OFFERS_LIST_CACHE_KEY, get_offers_list_cache,
+                                  get_offers_list_cache_timeout,
+                                  invalidate_offers_list_cache)
 
 
 class OffersApiTestCase(CreateInitialDataMixin, TestCase):
@@ -99,6 +105,139 @@ class OffersApiTestCase(CreateInitialDataMixin, TestCase):
         response = client_lender.get(self.api_url)
         self.assertNotEqual(response.status_code, 200)
 
+    def test_offer_read_list_cache(self):
+        now = datetime.now()
+        offer = Offer.objects.create(
+            name='Предложение 1', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=now - relativedelta(days=1), rotating_end=now + relativedelta(days=2),
+            min_credit_score=10, max_credit_score=20,
+            lender=self.user3_lender.lender
+        )
+        client_partner = APIClient()
+        client_partner.login(username=self.user1_partner.username, password='user1_partner')
+
+        # Повторный запрос отдаёт закэшированный список, изменения в обход модели в нём не видны
+        self.assertEqual([item['name'] for item in client_partner.get(self.api_url).json()], ['Предложение 1'])
+        # Список хранится в отдельном кэше, а не в кэше по умолчанию
+        self.assertIsNotNone(get_offers_list_cache().get(OFFERS_LIST_CACHE_KEY))
+        self.assertIsNone(cache.get(OFFERS_LIST_CACHE_KEY))
+        Offer.objects.filter(pk=offer.pk).update(name='Предложение 2')
+        self.assertEqual([item['name'] for item in client_partner.get(self.api_url).json()], ['Предложение 1'])
+
+        # Сохранение Предложения и Кредитной организации сбрасывает кэш
+        offer.refresh_from_db()
+        offer.save()
+        self.assertEqual([item['name'] for item in client_partner.get(self.api_url).json()], ['Предложение 2'])
+
+        self.user3_lender.lender.name = 'Сбербанк России'
+        self.user3_lender.lender.save()
+        self.assertEqual(
+            [item['lender_name'] for item in client_partner.get(self.api_url).json()], ['Сбербанк России']
+        )
+
+        # Запрошенные поля выбираются из закэшированного списка
+        response = client_partner.get('{0}?fields=id,lender_name'.format(self.api_url))
+        self.assertEqual(response.json(), [{'id': offer.pk, 'lender_name': 'Сбербанк России'}])
+
+        offer.delete()
+        self.assertEqual(client_partner.get(self.api_url).json(), [])
+
+    def test_offers_list_cache_timeout(self):
+        now = datetime(2026, 1, 1, 12, 0)
+        self.assertIsNone(get_offers_list_cache_timeout(now))
+
+        offer_data = dict(
+            name='Предложение', offer_type=Offer.CONSUMER_CREDIT,
+            min_credit_score=10, max_credit_score=20, lender=self.user3_lender.lender
+        )
+        Offer.objects.create(
+            rotating_start=now - relativedelta(days=1), rotating_end=now + relativedelta(hours=2), **offer_data
+        )
+        self.assertEqual(get_offers_list_cache_timeout(now), 2 * 3600)
+
+        # Кэш живёт до ближайшей границы ротации: начала или окончания
+        Offer.objects.create(
+            rotating_start=now + relativedelta(minutes=30), rotating_end=now + relativedelta(days=2), **offer_data
+        )
+        self.assertEqual(get_offers_list_cache_timeout(now), 30 * 60)
+
+        # Окончившаяся ротация не влияет на время жизни
+        Offer.objects.create(
+            rotating_start=now - relativedelta(days=2), rotating_end=now - relativedelta(days=1), **offer_data
+        )
+        self.assertEqual(get_offers_list_cache_timeout(now), 30 * 60)
+
+    def test_offer_conditional_get(self):
+        now = datetime.now()
+        offer = Offer.objects.create(
+            name='Предложение 1', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=now - relativedelta(days=1), rotating_end=now + relativedelta(months=1),
+            min_credit_score=10, max_credit_score=20,
+            lender=self.user3_lender.lender
+        )
+        client_partner = APIClient()
+        client_partner.login(username=self.user1_partner.username, password='user1_partner')
+        detail_url = '{api_url}{pk}/'.format(api_url=self.api_url, pk=offer.pk)
+
+        for url in (self.api_url, detail_url):
+            response = client_partner.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+            # Клиент с актуальной версией получает 304 без тела ответа
+            response = client_partner.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+
+        # Last-Modified отправляется только для детальной записи
+        last_modified = client_partner.get(detail_url)['Last-Modified']
+        self.assertEqual(client_partner.get(detail_url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        response = client_partner.get(self.api_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+
+        # ETag закэшированного списка вычисляется без запросов к Предложениям
+        list_etag = client_partner.get(self.api_url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = client_partner.get(self.api_url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries.captured_queries if 'lenders_offer' in query['sql']])
+
+        # Изменение Предложения или связанной Кредитной организации меняет ETag
+        detail_etag = client_partner.get(detail_url)['ETag']
+        self.assertNotEqual(list_etag, detail_etag)
+
+        Offer.objects.filter(pk=offer.pk).update(updated_at=datetime.now() + relativedelta(seconds=5))
+        self.assertEqual(client_partner.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+
+        self.user3_lender.lender.name = 'Сбербанк России'
+        self.user3_lender.lender.save()
+        response = client_partner.get(self.api_url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+        # Смена Предложения в ротации меняет ETag, даже если количество Предложений и их updated_at те же
+        list_etag = response['ETag']
+        next_offer = Offer.objects.create(
+            name='Предложение 2', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=now + relativedelta(days=1), rotating_end=now + relativedelta(months=1),
+            min_credit_score=10, max_credit_score=20,
+            lender=self.user3_lender.lender
+        )
+        self.assertEqual(client_partner.get(self.api_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        Offer.objects.filter(pk=offer.pk).update(rotating_end=now - relativedelta(hours=1))
+        Offer.objects.filter(pk=next_offer.pk).update(rotating_start=now - relativedelta(hours=1))
+        # Кэш списка истекает на границе ротации
+        invalidate_offers_list_cache()
+        response = client_partner.get(self.api_url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()], [next_offer.pk])
+
+        # Для несуществующей записи условный запрос не меняет ответ
+        url = '{api_url}{pk}/'.format(api_url=self.api_url, pk=offer.pk + 100)
+        self.assertEqual(client_partner.get(url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 404)
+
     def test_offer_read_detail(self):
         offer1 = Offer.objects.create(
             name='Предложение 1', offer_type=Offer.CONSUMER_CREDIT,
@@ -0,0 +1,109 @@
+# encoding: utf-8
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.test import TestCase
+
+from lenders.models import Lender, Offer, ScoreOffers
+
+
+class OfferModelTestCase(TestCase):
+
+    def test_ranges(self):
+        lender = Lender.objects.create(name='СберБанк')
+        now = datetime.now()
+
+        offer1 = Offer.objects.create(
+            name='Предложение 1', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=now - relativedelta(days=1),
+            rotating_end=now + relativedelta(months=1),
+            min_credit_score=5, max_credit_score=10, lender=lender
+        )
+        offer2 = Offer.objects.create(
+            name='Предложение 2', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=now + relativedelta(days=1),
+            rotating_end=now + relativedelta(months=2),
+            min_credit_score=10, max_credit_score=20, lender=lender
+        )
+
+        # Диапазоны заполняются в БД и включают обе границы
+        offer1.refresh_from_db()
+        self.assertEqual((offer1.credit_score_range.lower, offer1.credit_score_range.upper), (5, 11))
+
+        self.assertEqual(list(Offer.objects.active(now)), [offer1])
+        self.assertEqual(list(Offer.objects.active(offer1.rotating_start)), [offer1])
+        self.assertEqual(list(Offer.objects.active(offer1.rotating_end).order_by('pk')), [offer1, offer2])
+        self.assertEqual(list(Offer.objects.active(offer1.rotating_end + relativedelta(seconds=1))), [offer2])
+        self.assertEqual(list(Offer.objects.active(now + relativedelta(days=2)).order_by('pk')), [offer1, offer2])
+
+        self.assertEqual(list(Offer.objects.for_credit_score(4)), [])
+        self.assertEqual(list(Offer.objects.for_credit_score(5)), [offer1])
+        self.assertEqual(list(Offer.objects.for_credit_score(10).order_by('pk')), [offer1, offer2])
+        self.assertEqual(list(Offer.objects.for_credit_score(20)), [offer2])
+
+        # Диапазоны обновляются и при изменении через QuerySet.update()
+        Offer.objects.filter(pk=offer1.pk).update(max_credit_score=30, rotating_end=now - relativedelta(hours=1))
+        self.assertEqual(list(Offer.objects.for_credit_score(30)), [offer1])
+        self.assertEqual(list(Offer.objects.active(now)), [])
+
+
+class ScoreOffersTestCase(TestCase):
+
+    def test_rebuild_and_lookup(self):
+        lender1 = Lender.objects.create(name='СберБанк')
+        lender2 = Lender.objects.create(name='ВТБ')
+        now = datetime.now()
+
+        def create_offer(lender, min_credit_score, max_credit_score, rotating_start, rotating_end):
+            return Offer.objects.create(
+                name='Предложение', offer_type=Offer.CONSUMER_CREDIT,
+                rotating_start=rotating_start, rotating_end=rotating_end,
+                min_credit_score=min_credit_score, max_credit_score=max_credit_score, lender=lender
+            )
+
+        offer1 = create_offer(lender1, 5, 10, now - relativedelta(days=1), now + relativedelta(days=2))
+        offer2 = create_offer(lender2, 8, 20, now - relativedelta(days=1), now + relativedelta(days=1))
+        future_offer = create_offer(lender1, 1, 30, now + relativedelta(hours=1), now + relativedelta(days=3))
+
+        # Пока таблица не построена, Предложения ищутся запросом по диапазонам, а таблица не перестраивается
+        self.assertEqual(ScoreOffers.objects.lookup(9, now=now), [offer1.pk, offer2.pk])
+        self.assertEqual(ScoreOffers.objects.lookup(9, lender=lender2, now=now), [offer2.pk])
+        self.assertFalse(ScoreOffers.objects.exists())
+
+        self.assertEqual(ScoreOffers.objects.rebuild(now), 5)
+        self.assertEqual(
+            list(ScoreOffers.objects.order_by('score_from').values_list('score_from', flat=True)),
+            [0, 5, 8, 11, 21]
+        )
+        self.assertEqual(ScoreOffers.objects.get(score_from=8).valid_until, future_offer.rotating_start)
+
+        # Один запрос на поиск
+        with self.assertNumQueries(5):
+            self.assertEqual(ScoreOffers.objects.lookup(4, now=now), [])
+            self.assertEqual(ScoreOffers.objects.lookup(10, lender=lender1, now=now), [offer1.pk])
+            self.assertEqual(ScoreOffers.objects.lookup(10, lender=lender2.pk, now=now), [offer2.pk])
+            self.assertEqual(ScoreOffers.objects.lookup(15, now=now), [offer2.pk])
+            self.assertEqual(ScoreOffers.objects.lookup(100, now=now), [])
+
+        # Повторное построение без изменений ничего не меняет
+        self.assertEqual(ScoreOffers.objects.rebuild(now), 0)
+
+        # Началась ротация нового Предложения: устаревшая таблица не используется до перестроения
+        later = now + relativedelta(hours=2)
+        self.assertEqual(ScoreOffers.objects.lookup(25, now=later), [future_offer.pk])
+        self.assertEqual(ScoreOffers.objects.lookup(9, now=later), [offer1.pk, offer2.pk, future_offer.pk])
+        self.assertEqual(ScoreOffers.objects.get(score_from=8).valid_until, future_offer.rotating_start)
+
+        self.assertGreater(ScoreOffers.objects.rebuild(later), 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(ScoreOffers.objects.lookup(25, now=later), [future_offer.pk])
+
+        # id Предложений Кредитной организации возвращаются в порядке возрастания
+        row = ScoreOffers.objects.filter(score_from__lte=9).order_by('-score_from').first()
+        row.offers[str(lender1.pk)] = [future_offer.pk, offer1.pk]
+        row.save()
+        self.assertEqual(ScoreOffers.objects.lookup(9, lender=lender1, now=later), [offer1.pk, future_offer.pk])
+        self.assertEqual(
+            ScoreOffers.objects.get(score_from=0).valid_until,
+            offer2.rotating_end + relativedelta(microseconds=1)
+        )
@@ -0,0 +1,32 @@
+# encoding: utf-8
+from django.test import SimpleTestCase
+
+from lenders.models import Offer
+from lenders.offer_index import OfferIndex
+
+
+class OfferIndexTestCase(SimpleTestCase):
+
+    def test_match(self):
+        offer1 = Offer(pk=1, lender_id=1, min_credit_score=1, max_credit_score=10)
+        offer2 = Offer(pk=2, lender_id=1, min_credit_score=5, max_credit_score=15)
+        offer3 = Offer(pk=3, lender_id=2, min_credit_score=10, max_credit_score=10)
+        offer4 = Offer(pk=4, lender_id=2, min_credit_score=20, max_credit_score=10)     # Пустой диапазон
+
+        offer_index = OfferIndex([offer4, offer3, offer2, offer1])
+
+        self.assertEqual(offer_index.match(0), ())
+        self.assertEqual(offer_index.match(1), (offer1,))
+        self.assertEqual(offer_index.match(5), (offer1, offer2))
+        self.assertEqual(offer_index.match(10), (offer1, offer2, offer3))
+        self.assertEqual(offer_index.match(11), (offer2,))
+        self.assertEqual(offer_index.match(15), (offer2,))
+        self.assertEqual(offer_index.match(16), ())
+        self.assertEqual(offer_index.match(20), ())
+
+        # Поиск среди Предложений определённой Кредитной организации
+        self.assertEqual(offer_index.match(10, lender=1), (offer1, offer2))
+        self.assertEqual(offer_index.match(10, lender=2), (offer3,))
+        self.assertEqual(offer_index.match(10, lender=3), ())
+
+        self.assertEqual(OfferIndex([]).match(10), ())
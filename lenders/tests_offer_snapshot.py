@@ -0,0 +1,73 @@
+# encoding: utf-8
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.test import TestCase
+
+from lenders.models import Lender, Offer
+from lenders.offer_snapshot import (OfferSnapshot, get_offer_snapshot,
+                                    publish_offer_snapshot)
+
+
+class OfferSnapshotTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'offers.bin')
+
+        self.lender = Lender.objects.create(name='СберБанк')
+        self.now = datetime.now().replace(microsecond=0)
+
+    def create_offer(self, rotating_start, rotating_end, min_credit_score=5, max_credit_score=20):
+        return Offer.objects.create(
+            name='Предложение', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=rotating_start, rotating_end=rotating_end,
+            min_credit_score=min_credit_score, max_credit_score=max_credit_score, lender=self.lender
+        )
+
+    def test_publish(self):
+        # Пустой снимок
+        publish_offer_snapshot(self.path, self.now)
+        self.assertEqual(OfferSnapshot(self.path).count, 0)
+
+        offer1 = self.create_offer(self.now - relativedelta(days=1), self.now + relativedelta(days=1))
+        offer2 = self.create_offer(self.now + relativedelta(days=1), self.now + relativedelta(days=2), 1, 10)
+        self.create_offer(self.now - relativedelta(days=2), self.now - relativedelta(days=1))   # Ротация закончилась
+
+        version = publish_offer_snapshot(self.path, self.now)
+        snapshot = OfferSnapshot(self.path)
+
+        self.assertEqual(snapshot.version, version)
+        self.assertEqual(snapshot.ids.tolist(), [offer1.pk, offer2.pk])
+        self.assertEqual(snapshot.lender_ids.tolist(), [self.lender.pk] * 2)
+        self.assertEqual(snapshot.min_credit_scores.tolist(), [5, 1])
+        self.assertEqual(snapshot.max_credit_scores.tolist(), [20, 10])
+        self.assertEqual(snapshot.rotating_starts[0], np.datetime64(offer1.rotating_start, 'us'))
+        self.assertEqual(snapshot.rotating_ends[1], np.datetime64(offer2.rotating_end, 'us'))
+        self.assertFalse(snapshot.ids.flags.writeable)
+
+    def test_get_offer_snapshot(self):
+        offer = self.create_offer(self.now - relativedelta(days=1), self.now + relativedelta(days=1))
+
+        snapshot = get_offer_snapshot(self.path, self.now)
+        self.assertEqual(snapshot.ids.tolist(), [offer.pk])
+
+        # Пока Предложения не меняются, используется тот же снимок
+        with self.assertNumQueries(1):
+            self.assertIs(get_offer_snapshot(self.path, self.now), snapshot)
+
+        # Изменение Предложения меняет версию, снимок перезаписывается
+        offer.max_credit_score = 30
+        offer.save()
+        new_snapshot = get_offer_snapshot(self.path, self.now)
+        self.assertNotEqual(new_snapshot.version, snapshot.version)
+        self.assertEqual(new_snapshot.max_credit_scores.tolist(), [30])
+
+        # Старый снимок остаётся доступен процессам, которые его уже отобразили
+        self.assertEqual(snapshot.max_credit_scores.tolist(), [20])
+        self.assertTrue(snapshot.is_replaced())
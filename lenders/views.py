@@ -1,16 +1,24 @@
 # encoding: utf-8
-from datetime import datetime
+import hashlib
+import json
+from collections import OrderedDict
 
+from django.core.serializers.json import DjangoJSONEncoder
 from rest_framework import generics, mixins
+from rest_framework.response import Response
 
 from accounts.utils import UserIsPartnerMixin, is_lender
+from common.mixins import ConditionalGetMixin, SparseFieldsetsMixin
 from lenders.models import Offer
+from lenders.offers_cache import OFFERS_LIST_CACHE_KEY, get_offers_list_cache, get_offers_list_cache_timeout
 from lenders.serializers import OfferSerializer
 
 
-class BaseOffersView(generics.GenericAPIView):
+class BaseOffersView(ConditionalGetMixin, SparseFieldsetsMixin, generics.GenericAPIView):
 
     serializer_class = OfferSerializer
+    # В ответ входит название Кредитной организации
+    last_modified_fields = ('updated_at', 'lender__updated_at')
 
 
 class OffersView(UserIsPartnerMixin,
@@ -20,14 +28,46 @@ class OffersView(UserIsPartnerMixin,
     def get_queryset(self):
         return Offer.objects.select_related(
             'lender'
-        ).filter(
-            rotating_start__lte=datetime.now(),
-            rotating_end__gte=datetime.now()
-        )
+        ).active()
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
+    def get_validators(self, request):
+        # Версия списка хранится в кэше рядом с ним, поэтому при попадании в кэш запросов к БД нет
+        return self.make_etag(request, self.get_offers_list()['version']), None
+
+    def get_offers_list(self):
+        """
+        Список одинаков для всех Партнёров и меняется только при изменении Предложений (сбрасывается сигналами)
+        или на границе ротации, до которой и хранится в кэше.
+
+        :return: dict: data -- сериализованный список актуальных Предложений, version -- хэш списка.
+        """
+        if not hasattr(self, '_offers_list'):
+            cache = get_offers_list_cache()
+            offers_list = cache.get(OFFERS_LIST_CACHE_KEY)
+            if offers_list is None:
+                timeout = get_offers_list_cache_timeout()
+                serializer = self.serializer_class(
+                    self.get_queryset(), many=True, context=self.get_serializer_context()
+                )
+                data = serializer.data
+                version = hashlib.md5(json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')).hexdigest()
+                offers_list = {'data': data, 'version': version}
+                cache.set(OFFERS_LIST_CACHE_KEY, offers_list, timeout=timeout)
+            self._offers_list = offers_list
+        return self._offers_list
+
+    def list(self, request, *args, **kwargs):
+        data = self.get_offers_list()['data']
+
+        # В кэше хранится полный список, запрошенные поля выбираются из него
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            data = [OrderedDict((name, value) for name, value in item.items() if name in fields) for item in data]
+        return Response(data)
+
 
 class OffersDetailView(mixins.RetrieveModelMixin,
                        BaseOffersView):
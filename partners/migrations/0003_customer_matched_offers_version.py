@@ -0,0 +1,18 @@
+# Generated by Django 2.1.2 on 2026-10-18 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0002_customer_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='matched_offers_version',
+            field=models.BigIntegerField(editable=False, null=True, verbose_name='Версия сопоставленных предложений'),
+        ),
+    ]
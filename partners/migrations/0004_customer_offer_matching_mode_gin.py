@@ -0,0 +1,24 @@
+# Generated by Django 2.1.2 on 2026-10-18 15:55
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0003_customer_matched_offers_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='offer_matching_mode',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(choices=[('manual', 'Вручную'), ('auto', 'Авто')], max_length=10), default=['manual', 'auto'], size=2, verbose_name='Режим создания заявок'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['offer_matching_mode'], name='partners_customer_mode_gin'),
+        ),
+    ]
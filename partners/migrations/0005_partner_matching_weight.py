@@ -0,0 +1,19 @@
+# Generated by Django 2.1.2 on 2026-10-18 16:40
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0004_customer_offer_matching_mode_gin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='partner',
+            name='matching_weight',
+            field=models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Вес при сопоставлении'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.1.2 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['credit_score', 'id'], name='partners_customer_score_id'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['birth_date', 'id'], name='partners_customer_birth_id'),
+        ),
+    ]
@@ -1,11 +1,11 @@
 # encoding: utf-8
-from datetime import datetime
-
 from django.contrib.auth import get_user_model
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.core.validators import MinValueValidator
 from django.db import models
 
-from lenders.models import Offer
+from lenders.models import ScoreOffers
 
 
 User = get_user_model()
@@ -16,6 +16,13 @@ class Partner(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     name = models.CharField(verbose_name='Название партнёра', max_length=255)
 
+    # Доля Партнёра при разборе очереди Анкет на сопоставление (applications.matching.drain_pending_matches):
+    # в каждой пачке Партнёр получает место, пропорциональное весу, поэтому большая загрузка Анкет одним Партнёром
+    # не задерживает сопоставление Анкет остальных Партнёров.
+    matching_weight = models.PositiveIntegerField(
+        verbose_name='Вес при сопоставлении', default=1, validators=[MinValueValidator(1)]
+    )
+
     created_at = models.DateTimeField(verbose_name='Дата и время создания', auto_now_add=True)
     updated_at = models.DateTimeField(verbose_name='Дата и время обновления', auto_now=True)
 
@@ -27,6 +34,22 @@ class Partner(models.Model):
         return self.name
 
 
+class CustomerQuerySet(models.QuerySet):
+
+    def auto(self):
+        """
+        Анкеты клиентов с режимом создания заявок 'auto'.
+        """
+        # Условие @> по массиву использует GIN-индекс по offer_matching_mode
+        return self.filter(offer_matching_mode__contains=['auto'])
+
+    def manual(self):
+        """
+        Анкеты клиентов с режимом создания заявок 'manual'.
+        """
+        return self.filter(offer_matching_mode__contains=['manual'])
+
+
 class Customer(models.Model):
 
     # Режимы поиска подходящих Предложений для Анкеты клиента и создания соответствующих Заявок.
@@ -56,16 +79,33 @@ class Customer(models.Model):
         models.CharField(choices=OFFER_MATCHING_MODES, max_length=10),
         size=2,
         verbose_name='Режим создания заявок',
-        default=list(['manual', 'auto']),
-        db_index=True
+        default=list(['manual', 'auto'])
+    )
+
+    # Версия набора актуальных Предложений (applications.matching.get_offers_version), с которым Анкета
+    # была сопоставлена при последнем периодическом сопоставлении. Если версия не изменилась,
+    # то новых Заявок для Анкеты не появится и она пропускается. Сбрасывается при каждом сохранении Анкеты.
+    matched_offers_version = models.BigIntegerField(
+        verbose_name='Версия сопоставленных предложений', null=True, editable=False
     )
 
     created_at = models.DateTimeField(verbose_name='Дата и время создания', auto_now_add=True)
     updated_at = models.DateTimeField(verbose_name='Дата и время обновления', auto_now=True)
 
+    objects = CustomerQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Анкета клиента'
         verbose_name_plural = 'Анкеты клиентов'
+        indexes = [
+            # btree-индекс не используется для поиска по элементам массива (offer_matching_mode @> ARRAY['auto'])
+            GinIndex(fields=['offer_matching_mode'], name='partners_customer_mode_gin'),
+            # Постраничный вывод по курсору (common.pagination.KeysetCursorPagination)
+            models.Index(fields=['created_at', 'id'], name='partners_customer_created_id'),
+            models.Index(fields=['updated_at', 'id'], name='partners_customer_updated_id'),
+            models.Index(fields=['credit_score', 'id'], name='partners_customer_score_id'),
+            models.Index(fields=['birth_date', 'id'], name='partners_customer_birth_id'),
+        ]
 
     def __str__(self):
         return '{0} {1} {2} ({3}) {4}'.format(
@@ -73,7 +113,26 @@ class Customer(models.Model):
             self.credit_score, self.partner
         )
 
-    def match_with_offers(self, lender=None, return_existed=False):
+    @property
+    def is_auto(self):
+        """
+        Анкета участвует в автоматическом сопоставлении.
+        """
+        return 'auto' in self.offer_matching_mode
+
+    @property
+    def is_manual(self):
+        """
+        Анкету можно отправить на заявку через API.
+        """
+        return 'manual' in self.offer_matching_mode
+
+    def save(self, *args, **kwargs):
+        # Изменённую Анкету нужно заново сопоставить со всеми актуальными Предложениями
+        self.matched_offers_version = None
+        super().save(*args, **kwargs)
+
+    def match_with_offers(self, lender=None, return_existed=False, offer_index=None):
         """
         Сопоставляет Анкету клиента с имеющимися актуальными Предложениями.
         Для найденных подходящих Предложений создаёт Заявки, но НЕ сохраняет их в базу.
@@ -85,6 +144,10 @@ class Customer(models.Model):
         :param return_existed: boolean, по умолчанию False.
                                Если True, то кроме новых Заявок возвращает уже существующие у этой Анкеты Заявки.
 
+        :param offer_index: lenders.offer_index.OfferIndex.
+                            Если задано, то подходящие Предложения ищутся в этом индексе, а не запросом к БД.
+                            Используется при массовом сопоставлении, чтобы не делать запрос на каждую Анкету.
+
         :return: если return_existed=False (значение по умлочанию), то
                  list of applications.Application, список новых не сохранённых в базу Заявок
 
@@ -99,26 +162,29 @@ class Customer(models.Model):
         if lender:
             existed_apps_qs = existed_apps_qs.filter(lender_offer__lender=lender)
 
-        existed_matched_offers_ids = [app.lender_offer_id for app in existed_apps_qs]
-
-        matched_offers_qs = Offer.objects.filter(
-            min_credit_score__lte=self.credit_score,
-            max_credit_score__gte=self.credit_score,
-            rotating_start__lte=datetime.now(),
-            rotating_end__gte=datetime.now()
-        ).exclude(
-            pk__in=existed_matched_offers_ids
-        )
-        if lender:
-            matched_offers_qs = matched_offers_qs.filter(lender=lender)
-
-        for offer in matched_offers_qs:
-            new_applications.append(
-                Application(
-                    customer=self,
-                    lender_offer=offer
+        existed_matched_offers_ids = {app.lender_offer_id for app in existed_apps_qs}
+        if offer_index is not None:
+            matched_offers = [
+                offer for offer in offer_index.match(self.credit_score, lender=lender)
+                if offer.pk not in existed_matched_offers_ids
+            ]
+            for offer in matched_offers:
+                new_applications.append(
+                    Application(
+                        customer=self,
+                        lender_offer=offer
+                    )
                 )
-            )
+        else:
+            # id подходящих Предложений берутся из таблицы поиска по скоринговому баллу
+            for offer_id in ScoreOffers.objects.lookup(self.credit_score, lender=lender):
+                if offer_id not in existed_matched_offers_ids:
+                    new_applications.append(
+                        Application(
+                            customer=self,
+                            lender_offer_id=offer_id
+                        )
+                    )
 
         if return_existed:
             return existed_apps_qs, new_applications
@@ -11,11 +11,11 @@ class CustomerSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Customer
-        fields = ('__all__')
+        exclude = ('matched_offers_version',)
 
 
 class CustomerCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Customer
-        exclude = ('partner',)
+        exclude = ('partner', 'matched_offers_version')
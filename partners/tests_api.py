@@ -1,8 +1,13 @@
 # encoding: utf-8
+import json
+from base64 import b64encode
 from datetime import date, datetime
+from urllib import parse
 
 from dateutil.relativedelta import relativedelta
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 
 from applications.models import Application
@@ -123,7 +128,7 @@ class CustomersApiTestCase(CreateInitialDataMixin, FiltersTestMixin, OrderingTes
         client_partner1.login(username=self.user1_partner.username, password='user1_partner')
 
         response = client_partner1.get(self.api_url)
-        response_data = response.json()
+        response_data = response.json()['results']
 
         user1_expected_customers_ids = set([customer1.id, customer2.id, customer3.id])
         self.assertEqual(
@@ -134,7 +139,7 @@ class CustomersApiTestCase(CreateInitialDataMixin, FiltersTestMixin, OrderingTes
         client_partner2 = APIClient()
         client_partner2.login(username=self.user2_partner.username, password='user2_partner')
         response = client_partner2.get(self.api_url)
-        response_data = response.json()
+        response_data = response.json()['results']
 
         user2_expected_customers_ids = set([customer4.id, customer5.id, customer6.id])
         self.assertEqual(
@@ -178,6 +183,123 @@ class CustomersApiTestCase(CreateInitialDataMixin, FiltersTestMixin, OrderingTes
         response = client_lender.get(self.api_url)
         self.assertEqual(response.status_code, 403)
 
+    def test_customer_read_list_pagination(self):
+        customer_data = dict(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            partner=self.user1_partner.partner,
+        )
+        customers = [Customer.objects.create(credit_score=10 + i, **customer_data) for i in range(7)]
+
+        # У части Анкет одинаковое время создания: порядок внутри них определяет id
+        created_at = datetime.now() - relativedelta(days=1)
+        Customer.objects.filter(pk__in=[customer.pk for customer in customers[2:5]]).update(created_at=created_at)
+        expected_ids = list(Customer.objects.order_by('created_at', 'id').values_list('id', flat=True))
+
+        client_partner = APIClient()
+        client_partner.login(username=self.user1_partner.username, password='user1_partner')
+
+        # Страницы выбираются по позиции курсора, без подсчёта количества Анкет
+        url = '{0}?ordering=created_at&page_size=2'.format(self.api_url)
+        pages = []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                response = client_partner.get(url)
+                self.assertEqual(response.status_code, 200)
+                pages.append(response.json())
+                url = pages[-1]['next']
+
+        self.assertFalse([query for query in queries.captured_queries if 'COUNT(' in query['sql']])
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 2, 1])
+        self.assertEqual([item['id'] for page in pages for item in page['results']], expected_ids)
+
+        # По ссылке на предыдущую страницу возвращается та же страница
+        response = client_partner.get(pages[-1]['previous'])
+        self.assertEqual(response.json()['results'], pages[-2]['results'])
+
+        # Курсор, изменённый клиентом, проверяется по типам полей сортировки
+        def cursor_url(ordering, position):
+            querystring = parse.urlencode({'p': json.dumps(position)})
+            cursor = b64encode(querystring.encode('ascii')).decode('ascii')
+            return '{0}?ordering={1}&cursor={2}'.format(self.api_url, ordering, parse.quote(cursor))
+
+        response = client_partner.get(cursor_url('credit_score', [12, customers[2].pk]))
+        self.assertEqual([item['id'] for item in response.json()['results']], [customer.pk for customer in customers[3:]])
+        for ordering, position in [
+            ('credit_score', ['x', 1]),
+            ('credit_score', [10, [1]]),
+            ('created_at', ['x', 1]),
+            ('birth_date', [{'year': 1990}, 1]),
+            ('credit_score', [None, 1]),
+            ('credit_score', [10]),
+        ]:
+            response = client_partner.get(cursor_url(ordering, position))
+            self.assertEqual(response.status_code, 404, (ordering, position))
+
+        # Размер страницы ограничен настройкой API_MAX_PAGE_SIZE
+        with override_settings(API_MAX_PAGE_SIZE=3):
+            response = client_partner.get('{0}?page_size=100'.format(self.api_url))
+        self.assertEqual(len(response.json()['results']), 3)
+
+        # Размер страницы по умолчанию задаётся настройкой API_PAGE_SIZE
+        with override_settings(API_PAGE_SIZE=4):
+            response = client_partner.get(self.api_url)
+        self.assertEqual(len(response.json()['results']), 4)
+
+        # Условный запрос страницы проверяет только её записи
+        url = '{0}?ordering=created_at&page_size=2'.format(self.api_url)
+        with CaptureQueriesContext(connection) as queries:
+            response = client_partner.get(url)
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        # Страница, выбранная для ETag, выводится без повторного запроса
+        self.assertEqual(len([query for query in queries.captured_queries if 'partners_customer' in query['sql']]), 1)
+        self.assertEqual(client_partner.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Customer.objects.filter(pk=expected_ids[-1]).update(updated_at=datetime.now() + relativedelta(seconds=5))
+        self.assertEqual(client_partner.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Customer.objects.filter(pk=expected_ids[0]).update(updated_at=datetime.now() + relativedelta(seconds=5))
+        self.assertEqual(client_partner.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Удаление записи страницы тоже меняет ETag
+        etag = client_partner.get(url)['ETag']
+        Customer.objects.filter(pk=expected_ids[1]).delete()
+        self.assertEqual(client_partner.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        expected_ids.remove(expected_ids[1])
+
+        # По умолчанию Анкеты отсортированы от новых к старым
+        response = client_partner.get(self.api_url)
+        self.assertEqual([item['id'] for item in response.json()['results']], expected_ids[::-1])
+
+    def test_customer_read_sparse_fields(self):
+        customer = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=self.user1_partner.partner,
+        )
+        client_partner = APIClient()
+        client_partner.login(username=self.user1_partner.username, password='user1_partner')
+        detail_url = '{api_url}{pk}/'.format(api_url=self.api_url, pk=customer.pk)
+
+        # В ответ и в запрос к БД попадают только запрошенные поля
+        with CaptureQueriesContext(connection) as queries:
+            response = client_partner.get('{0}?fields=id,partner_name'.format(detail_url))
+        self.assertEqual(response.json(), {'id': customer.pk, 'partner_name': 'М-Видео'})
+        customer_queries = [query['sql'] for query in queries.captured_queries if 'passport' in query['sql']]
+        self.assertEqual(customer_queries, [])
+
+        # Поля версии для ETag загружаются тем же запросом, что и страница списка
+        with CaptureQueriesContext(connection) as queries:
+            response = client_partner.get('{0}?fields=surname'.format(self.api_url))
+        self.assertEqual(response.json()['results'], [{'surname': 'Иванов'}])
+        customer_queries = [query['sql'] for query in queries.captured_queries if 'partners_customer' in query['sql']]
+        self.assertEqual(len(customer_queries), 1)
+        self.assertNotIn('passport', customer_queries[0])
+
+        # Неизвестное поле -- ошибка
+        response = client_partner.get('{0}?fields=id,password'.format(self.api_url))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.json())
+
     def test_customer_read_detail(self):
         customer1 = Customer.objects.create(
             surname='Иванов', name='Пётр', patronymic='Сергеевич',
@@ -8,6 +8,7 @@ from django.test import TestCase
 
 from applications.models import Application
 from lenders.models import Lender, Offer
+from lenders.offer_index import OfferIndex
 from partners.models import Customer, Partner
 
 
@@ -101,3 +102,104 @@ class CustomerModelTestCase(TestCase):
         existed_apps_qs, new_applications = customer1.match_with_offers(lender=lender1, return_existed=True)
         self.assertEqual(len(existed_apps_qs), 1)
         self.assertEqual(len(new_applications), 0)
+
+    def test_method_match_with_offers_with_offer_index(self):
+        partners_grp = Group.objects.get(name='Партнёры')
+        lenders_grp = Group.objects.get(name='Кредитные организации')
+
+        user1_partner = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user1_partner, name='М-Видео')
+        partners_grp.user_set.add(user1_partner)
+
+        user2_lender = User.objects.create_user(username='Lender 1', password='user2_lender')
+        lender1 = Lender.objects.create(user=user2_lender, name='СберБанк')
+        lenders_grp.user_set.add(user2_lender)
+
+        user3_lender = User.objects.create_user(username='Lender 2', password='user3_lender')
+        lender2 = Lender.objects.create(user=user3_lender, name='ВТБ')
+        lenders_grp.user_set.add(user3_lender)
+
+        customer1 = Customer.objects.create(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=partner,
+        )
+
+        Offer.objects.create(
+            name='Предложение 1', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(days=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=1, max_credit_score=5, lender=lender1
+        )
+        Offer.objects.create(
+            name='Предложение 2', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(months=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=7, max_credit_score=10, lender=lender1
+        )
+        Offer.objects.create(
+            name='Предложение старое', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(months=2),
+            rotating_end=datetime.now() - relativedelta(months=1),
+            min_credit_score=7, max_credit_score=17, lender=lender1
+        )
+        Offer.objects.create(
+            name='Предложение 3', offer_type=Offer.CONSUMER_CREDIT,
+            rotating_start=datetime.now() - relativedelta(months=1),
+            rotating_end=datetime.now() + relativedelta(months=1),
+            min_credit_score=10, max_credit_score=50, lender=lender2
+        )
+
+        offer_index = OfferIndex.build()
+
+        # Предложения из индекса ищутся без запросов к БД
+        customer1 = Customer.objects.prefetch_related('application_set').get(pk=customer1.pk)
+        with self.assertNumQueries(0):
+            applications = customer1.match_with_offers(offer_index=offer_index)
+
+        self.assertEqual(
+            set([app.lender_offer.name for app in applications]),
+            set(['Предложение 2', 'Предложение 3'])
+        )
+
+        applications = customer1.match_with_offers(lender=lender1, offer_index=offer_index)
+        self.assertEqual(
+            set([app.lender_offer.name for app in applications]),
+            set(['Предложение 2'])
+        )
+
+        Application.objects.bulk_create(applications)
+        customer1 = Customer.objects.get(pk=customer1.pk)
+
+        existed_apps_qs, new_applications = customer1.match_with_offers(return_existed=True, offer_index=offer_index)
+        self.assertEqual(len(existed_apps_qs), 1)
+        self.assertEqual(
+            set([app.lender_offer.name for app in new_applications]),
+            set(['Предложение 3'])
+        )
+
+        # Результат совпадает с поиском Предложений через запрос к БД
+        self.assertEqual(
+            set([app.lender_offer_id for app in customer1.match_with_offers(offer_index=offer_index)]),
+            set([app.lender_offer_id for app in customer1.match_with_offers()])
+        )
+
+    def test_offer_matching_mode(self):
+        user1_partner = User.objects.create_user(username='Partner 1', password='user1_partner')
+        partner = Partner.objects.create(user=user1_partner, name='М-Видео')
+
+        customer_data = dict(
+            surname='Иванов', name='Пётр', patronymic='Сергеевич',
+            birth_date='1990-01-01', phone_number='89117310203', passport_number='1901432765',
+            credit_score=10, partner=partner,
+        )
+        auto_customer = Customer.objects.create(offer_matching_mode=['auto'], **customer_data)
+        manual_customer = Customer.objects.create(offer_matching_mode=['manual'], **customer_data)
+        both_customer = Customer.objects.create(offer_matching_mode=['manual', 'auto'], **customer_data)
+
+        self.assertEqual(set(Customer.objects.auto()), set([auto_customer, both_customer]))
+        self.assertEqual(set(Customer.objects.manual()), set([manual_customer, both_customer]))
+
+        self.assertEqual((auto_customer.is_auto, auto_customer.is_manual), (True, False))
+        self.assertEqual((manual_customer.is_auto, manual_customer.is_manual), (False, True))
+        self.assertEqual((both_customer.is_auto, both_customer.is_manual), (True, True))
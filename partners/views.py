@@ -4,6 +4,8 @@ from rest_framework import filters, generics, mixins
 
 from accounts.utils import UserIsPartnerMixin, is_lender, is_partner
 from applications.models import Application
+from common.mixins import ConditionalGetMixin, SparseFieldsetsMixin
+from common.pagination import KeysetCursorPagination
 from partners.models import Customer
 from partners.serializers import CustomerCreateSerializer, CustomerSerializer
 
@@ -21,6 +23,8 @@ class CustomerFilter(django_filters.FilterSet):
 
 
 class CustomerView(UserIsPartnerMixin,
+                   ConditionalGetMixin,
+                   SparseFieldsetsMixin,
                    mixins.ListModelMixin,
                    mixins.CreateModelMixin,
                    generics.GenericAPIView):
@@ -35,6 +39,10 @@ class CustomerView(UserIsPartnerMixin,
     filterset_class = CustomerFilter
     search_fields = ('surname',)
     ordering_fields = ('credit_score', 'created_at', 'updated_at', 'birth_date')
+    # В ответ входит название Партнёра
+    last_modified_fields = ('updated_at', 'partner__updated_at')
+    ordering = ('-created_at',)
+    pagination_class = KeysetCursorPagination
 
     def get_queryset(self):
         return Customer.objects.select_related(
@@ -58,10 +66,13 @@ class CustomerView(UserIsPartnerMixin,
         serializer.save(partner=self.request.user.partner)
 
 
-class CustomerDetailView(mixins.RetrieveModelMixin,
+class CustomerDetailView(ConditionalGetMixin,
+                         SparseFieldsetsMixin,
+                         mixins.RetrieveModelMixin,
                          generics.GenericAPIView):
 
     serializer_class = CustomerSerializer
+    last_modified_fields = ('updated_at', 'partner__updated_at')
 
     def get_queryset(self):
         customers_qs = Customer.objects.select_related('partner__user')
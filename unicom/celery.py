@@ -19,9 +19,23 @@ app.autodiscover_tasks()
 
 app.conf.timezone = 'UTC'
 
+# Сопоставление в момент начала ротации Предложений планируется отложенными задачами
+# (applications.scheduler.schedule_next_rotation). Новые и изменённые Анкеты клиентов и Предложения
+# ставятся в очередь (applications.PendingMatch), которую разбирает drain_pending_matches_task.
+# Полное периодическое сопоставление пропускается, если с прошлого раза не изменился набор актуальных Предложений.
+# Таблица поиска Предложений по скоринговому баллу периодически перестраивается по разнице с текущим содержимым.
 app.conf.beat_schedule = {
     'match-customers-with-offers-every-10-minutes': {
         'task': 'applications.tasks.match_customers_with_offers_task',
         'schedule': 60,    # Раз в 1 минуту (60 секунд)
+        'kwargs': {'skip_unchanged': True},
+    },
+    'drain-pending-matches': {
+        'task': 'applications.tasks.drain_pending_matches_task',
+        'schedule': 10,    # Раз в 10 секунд
+    },
+    'rebuild-score-offers': {
+        'task': 'lenders.tasks.rebuild_score_offers_task',
+        'schedule': 60,    # Раз в 1 минуту (60 секунд)
     },
 }
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -94,6 +95,47 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+
+# Кэш должен быть общим для веб-процессов и воркеров Celery, поэтому по умолчанию используются таблицы в БД
+# (создаются командой createcachetable), а не память процесса.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'unicom_cache'),
+    },
+    # Ключи объединения запросов на сопоставление Анкет (applications.tasks.enqueue_match_customer).
+    # При превышении MAX_ENTRIES бэкенд удаляет часть ключей, и повторный запрос может потеряться,
+    # поэтому MAX_ENTRIES должен превышать количество запросов за APPLICATIONS_MATCH_CUSTOMER_COALESCE_WINDOW секунд.
+    'matching': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('MATCHING_CACHE_LOCATION', 'unicom_matching_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('MATCHING_CACHE_MAX_ENTRIES', 1000000)),
+        },
+    },
+    # Список актуальных Предложений (lenders.views.OffersView), который сбрасывают сигналы. В кэше один ключ,
+    # поэтому он не вытесняется другими ключами, а COUNT(*) при записи в таблицу кэша выполняется по одной строке.
+    'offers': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('OFFERS_CACHE_LOCATION', 'unicom_offers_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10,
+        },
+    },
+}
+
+# Тесты используют кэш в памяти процесса
+if sys.argv[1:2] == ['test']:
+    CACHES = {
+        alias: dict(params, BACKEND='django.core.cache.backends.locmem.LocMemCache', LOCATION=alias)
+        for alias, params in CACHES.items()
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -142,6 +184,47 @@ DATETIME_FORMAT = 'Y-m-d H:i'
 
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', '')
 
+# Хранилище результатов задач. Нужно для параллельного сопоставления (APPLICATIONS_MATCHING_SHARDS > 1):
+# результаты задач по диапазонам собираются через chord, который поддерживают, например, redis:// и memcached.
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', None)
+
+
+# Способ автоматического сопоставления Анкет клиентов с Предложениями:
+# 'python' -- Заявки подбираются в коде для каждой Анкеты клиента;
+# 'sql' -- Заявки создаются одним запросом INSERT ... SELECT на стороне PostgreSQL;
+# 'numpy' -- Заявки подбираются векторизованно сразу для пачки Анкет клиентов;
+# 'bloom' -- существующие Заявки отсекаются фильтром Блума, Заявки Анкет не загружаются в память.
+APPLICATIONS_MATCHING_ENGINE = os.getenv('APPLICATIONS_MATCHING_ENGINE', 'python')
+
+# Вероятность ложного срабатывания фильтра Блума для движка 'bloom'.
+APPLICATIONS_MATCHING_BLOOM_ERROR_RATE = float(os.getenv('APPLICATIONS_MATCHING_BLOOM_ERROR_RATE', 0.001))
+
+# Количество Анкет клиентов, которые сопоставляются и сохраняются за одну транзакцию.
+APPLICATIONS_MATCHING_CHUNK_SIZE = int(os.getenv('APPLICATIONS_MATCHING_CHUNK_SIZE', 1000))
+
+# Количество диапазонов id Анкет клиентов, которые сопоставляются параллельно в отдельных задачах.
+# При значении 1 сопоставление выполняется одной задачей.
+APPLICATIONS_MATCHING_SHARDS = int(os.getenv('APPLICATIONS_MATCHING_SHARDS', 1))
+
+# Способ сохранения Заявок при пакетном сопоставлении:
+# 'insert' -- INSERT ... ON CONFLICT DO NOTHING из объектов Заявок;
+# 'copy' -- COPY FROM STDIN во временную таблицу без создания объектов Заявок, для больших объёмов.
+APPLICATIONS_MATCHING_WRITER = os.getenv('APPLICATIONS_MATCHING_WRITER', 'insert')
+
+# Окно в секундах, в течение которого повторные запросы на сопоставление Анкеты клиента со всеми
+# Кредитными организациями объединяются с уже поставленной задачей match_customer_task.
+APPLICATIONS_MATCH_CUSTOMER_COALESCE_WINDOW = int(os.getenv('APPLICATIONS_MATCH_CUSTOMER_COALESCE_WINDOW', 30))
+
+# Путь к файлу снимка Предложений (lenders.offer_snapshot) для движка 'numpy'.
+# Все процессы хоста отображают снимок в память только для чтения и не держат собственных копий Предложений.
+# Если не задан, то каждый прогон загружает Предложения из БД.
+APPLICATIONS_OFFER_SNAPSHOT_PATH = os.getenv('APPLICATIONS_OFFER_SNAPSHOT_PATH', None)
+
+
+# Размер страницы списков API (common.pagination.KeysetCursorPagination) по умолчанию
+# и наибольший размер страницы, который клиент может запросить параметром page_size.
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 100))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 1000))
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (